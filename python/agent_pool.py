@@ -0,0 +1,158 @@
+"""
+Process-wide agent factory and a pool of warm agents.
+
+PetrobrasRAGAgent is thread-safe, so the threads of one process should share
+a single agent: get_agent() builds it once and returns it to every caller.
+
+Workers that want an agent to themselves (for example threads running their
+own event loop, where a shared agent's async limiter would be rebound on
+every call) check one out of an AgentPool instead. The pool pre-spawns N
+warm agents; the first one opens the index and clients, the others share its
+LLM, embeddings, loaded index and fact index and only build their own graph.
+
+Nothing that holds sockets, threads or locks survives fork(): the HTTP
+client, embedding store and Chroma client registries reset themselves in the
+child, get_agent() builds a new agent there, and a pool carried into a child
+process notices the pid change and spawns fresh agents on the next checkout.
+Agents built directly rebuild their components on their first query in the
+child, and the child re-takes the leases of the snapshots it inherited open.
+"""
+import os
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from rag_agent import PetrobrasRAGAgent
+
+_agent: Optional[PetrobrasRAGAgent] = None
+_agent_lock = threading.Lock()
+_pools: "weakref.WeakSet[AgentPool]" = weakref.WeakSet()
+
+
+def get_agent() -> PetrobrasRAGAgent:
+    """Return the agent shared by every thread of this process, creating it on first use."""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = PetrobrasRAGAgent()
+    return _agent
+
+
+class AgentPool:
+    """Fixed set of warm agents handed out with checkout()/checkin()."""
+
+    def __init__(self, size: int, max_concurrency: Optional[int] = None, warm: bool = True):
+        """
+        Args:
+            size: Number of agents
+            max_concurrency: Async concurrency limit of each agent
+                (defaults to MAX_CONCURRENT_QUERIES)
+            warm: Build the agents' components now instead of on first use
+        """
+        if size < 1:
+            raise ValueError(f"AgentPool size must be at least 1, got {size}")
+        self.size = size
+        self.max_concurrency = max_concurrency
+        self.warm = warm
+        self._lock = threading.Lock()
+        self._spawn()
+        _pools.add(self)
+
+    def _spawn(self) -> None:
+        """Create the agents of this process (all sharing the first one's components)."""
+        started = time.perf_counter()
+        source = PetrobrasRAGAgent(max_concurrency=self.max_concurrency)
+        agents = [source] + [
+            PetrobrasRAGAgent(max_concurrency=self.max_concurrency, share_from=source)
+            for _ in range(self.size - 1)
+        ]
+        if self.warm:
+            for agent in agents:
+                agent.warm_up()
+        self._pid = os.getpid()
+        self._agents: List[PetrobrasRAGAgent] = agents
+        self._available: "queue.LifoQueue[PetrobrasRAGAgent]" = queue.LifoQueue()
+        for agent in agents:
+            self._available.put(agent)
+        self._checkouts = 0
+        self._waits = 0
+        if self.warm:
+            print(f"✅ Agent pool ready: {self.size} agents in {time.perf_counter() - started:.2f}s")
+
+    def _ensure_process(self) -> None:
+        """Replace agents inherited from a parent process after fork()."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._spawn()
+
+    def checkout(self, timeout: Optional[float] = None) -> PetrobrasRAGAgent:
+        """
+        Take an agent for exclusive use; return it with checkin().
+
+        Args:
+            timeout: Seconds to wait when all agents are taken (None waits forever)
+
+        Returns:
+            A warm agent
+
+        Raises:
+            TimeoutError: No agent became available within timeout
+        """
+        self._ensure_process()
+        try:
+            agent = self._available.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self._waits += 1
+            try:
+                agent = self._available.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No agent available within {timeout}s (pool size {self.size})") from None
+        with self._lock:
+            self._checkouts += 1
+        return agent
+
+    def checkin(self, agent: PetrobrasRAGAgent) -> None:
+        """Return an agent taken with checkout()."""
+        # Agents checked out before a fork belong to the parent's pool
+        if self._pid == os.getpid() and any(agent is pooled for pooled in self._agents):
+            self._available.put(agent)
+
+    @contextmanager
+    def agent(self, timeout: Optional[float] = None) -> Iterator[PetrobrasRAGAgent]:
+        """Context manager around checkout()/checkin()."""
+        agent = self.checkout(timeout)
+        try:
+            yield agent
+        finally:
+            self.checkin(agent)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, agents available now, total checkouts and checkouts that had to wait."""
+        return {
+            "size": self.size,
+            "available": self._available.qsize(),
+            "checkouts": self._checkouts,
+            "waits": self._waits,
+            "pid": self._pid
+        }
+
+
+def _reset_after_fork() -> None:
+    """Drop the parent's shared agent in a forked child."""
+    global _agent, _agent_lock
+    _agent = None
+    # Locks may have been held by parent threads that do not exist in the child
+    _agent_lock = threading.Lock()
+    for pool in _pools:
+        pool._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,268 @@
+"""
+Semantic answer cache for the Petrobras RAG agent.
+
+Answers are keyed on the question embedding: a new question reuses a cached
+answer when its cosine similarity to a cached question reaches the threshold,
+so paraphrases of the same question skip retrieval and generation.
+
+Questions that differ only in a period, a number or a name ("lucro líquido no
+1T25" vs "no 4T24") embed almost identically, so the embedding alone would
+serve one quarter's answer for another. Each entry is therefore also keyed on
+question_scope() (the periods, numbers, currencies and known names the
+question asks about), and only entries with the same scope can match.
+"""
+import atexit
+import copy
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from fact_index import question_periods
+from portuguese_text import tokenize
+
+# Names whose answers differ but whose questions embed almost identically:
+# producing fields, basins, refineries, subsidiaries, business segments and
+# pre-/post-salt, as accent-folded tokens
+ENTITY_TERMS = frozenset({
+    "atapu", "buzios", "itapu", "jubarte", "libra", "marlim", "mero", "sepia", "tupi",
+    "campos", "santos", "equatorial",
+    "boaventura", "reduc", "replan", "rnest",
+    "nts", "tag", "transpetro",
+    "exploracao", "refino", "comercializacao",
+    "pre", "pos"
+})
+CURRENCY_PATTERN = re.compile(r"\b(US|R)\$", re.IGNORECASE)
+
+
+def question_scope(question: str) -> str:
+    """
+    Periods, numbers, currencies and known names a question asks about.
+
+    Wording, letter case and stop words do not matter: "Qual foi o EBITDA
+    Ajustado no 1T25?" and "qual foi o ebitda ajustado do 1T25" both give
+    "1T25", and "Qual foi a produção de Búzios em 2024?" gives "2024 buzios".
+
+    Args:
+        question: The question
+
+    Returns:
+        The sorted terms joined by spaces ("" when there are none)
+    """
+    periods = question_periods(question)
+    terms = {period for period, _ in periods}
+    rest = question
+    for _, (start, end) in reversed(periods):
+        rest = rest[:start] + " " + rest[end:]
+    terms.update(match.group(1).lower() + "$" for match in CURRENCY_PATTERN.finditer(rest))
+    terms.update(
+        token for token in tokenize(rest)
+        if token in ENTITY_TERMS or any(char.isdigit() for char in token)
+    )
+    return " ".join(sorted(terms))
+
+
+class SemanticAnswerCache:
+    """LRU/TTL cache of agent results keyed on normalized question embeddings."""
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 1000,
+        ttl_seconds: float = 86400,
+        path: Optional[Union[str, Path]] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            threshold: Minimum cosine similarity for a cached answer to be reused
+            max_entries: Maximum number of answers kept (least recently used
+                entries are evicted first)
+            ttl_seconds: Age after which an entry expires (0 disables expiry)
+            path: Optional .npz file used to persist the cache across runs
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._fingerprint = ""
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_key = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+        self._lock = threading.Lock()
+
+        if self.path is not None:
+            self._load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        """Return the embedding as a unit-length float32 vector."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _check_fingerprint(self, fingerprint: str) -> None:
+        """Drop every entry when the index, prompt or model changed."""
+        if fingerprint != self._fingerprint:
+            self._entries.clear()
+            self._matrix = None
+            self._fingerprint = fingerprint
+
+    def _evict_expired(self, now: float) -> None:
+        """Remove entries older than the TTL."""
+        if not self.ttl_seconds:
+            return
+        expired = [
+            key for key, entry in self._entries.items()
+            if now - entry["created_at"] > self.ttl_seconds
+        ]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _similarity_matrix(self) -> Tuple[np.ndarray, List[int]]:
+        """Return the stacked entry embeddings, rebuilding them when stale."""
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = np.vstack([self._entries[key]["embedding"] for key in self._matrix_keys])
+        return self._matrix, self._matrix_keys
+
+    def lookup(self, embedding: List[float], fingerprint: str, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a question embedding.
+
+        Args:
+            embedding: Embedding of the incoming question
+            fingerprint: Current fingerprint of index, prompt and model
+            question: The incoming question; only answers cached for a
+                question with the same question_scope() are reused
+
+        Returns:
+            Dictionary with the cached "result", the "question" it was cached
+            for and the "similarity", or None on a miss
+        """
+        query = self._normalize(embedding)
+        scope = question_scope(question)
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self._evict_expired(time.time())
+
+            if self._entries:
+                matrix, keys = self._similarity_matrix()
+                same_scope = np.array([self._entries[key]["scope"] == scope for key in keys])
+                scores = np.where(same_scope, matrix @ query, -np.inf)
+                best = int(np.argmax(scores))
+                similarity = float(scores[best])
+                if similarity >= self.threshold:
+                    key = keys[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    entry = self._entries[key]
+                    return {
+                        "result": copy.deepcopy(entry["result"]),
+                        "question": entry["question"],
+                        "similarity": similarity
+                    }
+
+            self.misses += 1
+            return None
+
+    def store(self, question: str, embedding: List[float], result: Dict[str, Any], fingerprint: str) -> None:
+        """
+        Cache the result of a question.
+
+        Args:
+            question: The question that was answered
+            embedding: Embedding of the question
+            result: The agent result to reuse for similar questions
+            fingerprint: Fingerprint of index, prompt and model used to answer
+        """
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self._entries[self._next_key] = {
+                "question": question,
+                "scope": question_scope(question),
+                "embedding": self._normalize(embedding),
+                "result": copy.deepcopy(result),
+                "created_at": time.time()
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        """Remove every cached answer."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current cache size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries)
+        }
+
+    def save(self) -> None:
+        """Persist the cache to its .npz file (no-op without a path)."""
+        if self.path is None:
+            return
+        with self._lock:
+            entries = list(self._entries.values())
+            dim = entries[0]["embedding"].shape[0] if entries else 0
+            embeddings = (
+                np.vstack([entry["embedding"] for entry in entries])
+                if entries else np.zeros((0, dim), dtype=np.float32)
+            )
+            records = json.dumps({
+                "fingerprint": self._fingerprint,
+                "entries": [
+                    {
+                        "question": entry["question"],
+                        "result": entry["result"],
+                        "created_at": entry["created_at"]
+                    }
+                    for entry in entries
+                ]
+            }, ensure_ascii=False)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, embeddings=embeddings, records=np.array(records))
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> None:
+        """Load a previously saved cache, ignoring unreadable files."""
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path) as data:
+                embeddings = data["embeddings"]
+                records = json.loads(str(data["records"]))
+        except Exception as e:
+            print(f"⚠️ Could not load answer cache from {self.path}: {e}")
+            return
+
+        self._fingerprint = records["fingerprint"]
+        for embedding, entry in zip(embeddings, records["entries"]):
+            entry["embedding"] = embedding.astype(np.float32)
+            entry["scope"] = question_scope(entry["question"])
+            self._entries[self._next_key] = entry
+            self._next_key += 1
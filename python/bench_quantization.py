@@ -0,0 +1,180 @@
+"""
+Recall, memory and latency of the vector search paths.
+
+Compares Chroma (HNSW), exact float32 NumPy search and the int8 / binary
+quantized NumPy modes (compressed shortlist + exact rescoring) on the same
+vectors. Ground truth is exact cosine top-k. By default the corpus is a
+synthetic set of clustered 1536-dim vectors (the text-embedding-3-small
+dimension) so the benchmark needs no API calls; --index benchmarks the
+vectors of an existing NumPy index instead.
+"""
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from vector_index import NumpyIndexWriter, NumpyVectorStore, _normalize_rows
+
+MODES = ("none", "int8", "binary", "chroma")
+
+
+def synthetic_corpus(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered random vectors, closer to real embeddings than isotropic noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 100), dim)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), count)
+    return _normalize_rows(centers[assignments] + rng.normal(size=(count, dim)).astype(np.float32))
+
+
+def make_queries(corpus: np.ndarray, count: int, noise: float = 0.5, seed: int = 1) -> np.ndarray:
+    """Perturbed copies of random corpus rows (a question near some chunk)."""
+    rng = np.random.default_rng(seed)
+    rows = corpus[rng.integers(0, len(corpus), count)]
+    perturbed = rows + noise / np.sqrt(corpus.shape[1]) * rng.normal(size=rows.shape)
+    return _normalize_rows(perturbed.astype(np.float32))
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> List[List[int]]:
+    """Ground-truth rows by exact cosine similarity."""
+    scores = queries @ corpus.T
+    return [list(np.argsort(-row)[:k]) for row in scores]
+
+
+def recall_at_k(results: List[List[int]], truth: List[List[int]]) -> float:
+    """Mean fraction of the true top-k found."""
+    return statistics.mean(len(set(got) & set(want)) / len(want) for got, want in zip(results, truth))
+
+
+def _timed(search: Callable[[np.ndarray], Any], queries: np.ndarray) -> Dict:
+    """Run one search per query; return the results and per-query latencies."""
+    results, latencies = [], []
+    search(queries[0])  # warm up page cache and lazy state
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - started)
+    return {"results": results, "latencies": latencies}
+
+
+def _directory_bytes(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.rglob("*") if path.is_file())
+
+
+def bench_numpy(directory: Path, queries: np.ndarray, k: int, quantization: str,
+                rescore_multiplier: int) -> Dict:
+    """Benchmark one NumpyVectorStore mode."""
+    store = NumpyVectorStore(directory, None, quantization=quantization, rescore_multiplier=rescore_multiplier)
+    run = _timed(lambda query: [row for row, _ in store._search(query, k)], queries)
+    run["memory_bytes"] = store.memory_bytes
+    return run
+
+
+def bench_chroma(directory: Path, corpus: np.ndarray, queries: np.ndarray, k: int) -> Optional[Dict]:
+    """Benchmark a Chroma HNSW collection holding the same vectors."""
+    try:
+        import chromadb
+    except ImportError:
+        return None
+    client = chromadb.PersistentClient(path=str(directory))
+    collection = client.create_collection("bench", metadata={"hnsw:space": "cosine"})
+    batch = client.get_max_batch_size()
+    for start in range(0, len(corpus), batch):
+        rows = corpus[start:start + batch]
+        collection.add(ids=[str(i) for i in range(start, start + len(rows))], embeddings=rows)
+
+    def search(query: np.ndarray) -> List[int]:
+        hits = collection.query(query_embeddings=[query], n_results=k, include=[])
+        return [int(doc_id) for doc_id in hits["ids"][0]]
+
+    run = _timed(search, queries)
+    # HNSW keeps the float32 vectors and the graph in memory; the persisted
+    # size is the closest portable measure
+    run["memory_bytes"] = _directory_bytes(directory)
+    return run
+
+
+def benchmark(corpus: np.ndarray, queries: np.ndarray, k: int, modes: List[str],
+              rescore_multiplier: int) -> Dict:
+    """
+    Benchmark every mode on the same corpus and queries.
+
+    Returns:
+        Per mode: recall@k, memory (MB and bytes per vector) and p50/p95
+        latency in milliseconds
+    """
+    truth = exact_top_k(corpus, queries, k)
+    workdir = Path(tempfile.mkdtemp(prefix="bench_quantization_"))
+    summary: Dict = {"count": len(corpus), "dim": corpus.shape[1], "queries": len(queries), "k": k, "modes": {}}
+    try:
+        numpy_dir = workdir / "numpy_index"
+        writer = NumpyIndexWriter(numpy_dir)
+        for start in range(0, len(corpus), 4096):
+            rows = corpus[start:start + 4096]
+            writer.add([str(i) for i in range(start, start + len(rows))], [""] * len(rows),
+                       [{} for _ in rows], rows)
+        writer.close()
+
+        for mode in modes:
+            if mode == "chroma":
+                run = bench_chroma(workdir / "chroma", corpus, queries, k)
+                if run is None:
+                    print("⚠️ chromadb not installed, skipping the Chroma path")
+                    continue
+            else:
+                run = bench_numpy(numpy_dir, queries, k, mode, rescore_multiplier)
+            latencies = sorted(run["latencies"])
+            summary["modes"][mode] = {
+                "recall_at_k": recall_at_k(run["results"], truth),
+                "memory_mb": run["memory_bytes"] / 2 ** 20,
+                "bytes_per_vector": run["memory_bytes"] / len(corpus),
+                "p50_ms": statistics.median(latencies) * 1000,
+                "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return summary
+
+
+def main() -> None:
+    """Main benchmark function."""
+    parser = argparse.ArgumentParser(description="Benchmark quantized vector search against Chroma")
+    parser.add_argument("--count", type=int, default=20000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=1536, help="Synthetic vector dimension")
+    parser.add_argument("--index", type=Path, help="Use the vectors of an existing NumPy index instead")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=5, help="Results per query (recall@k)")
+    parser.add_argument("--rescore-multiplier", type=int, default=8, help="Candidates rescored per result")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated subset of {','.join(MODES)}")
+    parser.add_argument("--output", type=Path, help="Write the results to a JSON file")
+    args = parser.parse_args()
+
+    if args.index:
+        corpus = np.asarray(NumpyVectorStore(args.index, None)._vectors)
+    else:
+        corpus = synthetic_corpus(args.count, args.dim)
+    queries = make_queries(corpus, args.queries)
+
+    print("⏱️ Vector search benchmark")
+    print("=" * 40)
+    print(f"   {len(corpus)} vectors x {corpus.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    summary = benchmark(corpus, queries, args.k, [mode.strip() for mode in args.modes.split(",")],
+                        args.rescore_multiplier)
+    print(f"   {'mode':<8} {'recall@k':>9} {'memory MB':>10} {'B/vector':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, stats in summary["modes"].items():
+        print(f"   {mode:<8} {stats['recall_at_k']:>9.3f} {stats['memory_mb']:>10.1f} "
+              f"{stats['bytes_per_vector']:>9.0f} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f}")
+
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2))
+        print(f"💾 Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
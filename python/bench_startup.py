@@ -0,0 +1,132 @@
+"""
+Startup benchmark for the RAG agent.
+
+Each run happens in a fresh Python process so import caches do not hide
+regressions. Measures module import time, agent construction, first query
+latency (which includes building the LLM, vector store and graph) and a
+second query for comparison. The answer cache is disabled in the probe so
+the second query measures a warm agent rather than a cache hit.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Executed in a child process; prints one JSON line with the timings
+_PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+import rag_agent
+timings = {"import_s": time.perf_counter() - started}
+
+started = time.perf_counter()
+agent = rag_agent.PetrobrasRAGAgent()
+timings["construct_s"] = time.perf_counter() - started
+
+heavy = ("langchain_openai", "langchain_chroma", "langgraph", "chromadb")
+timings["heavy_modules_after_construct"] = [name for name in heavy if name in sys.modules]
+
+if QUESTION:
+    for label in ("first_query_s", "second_query_s"):
+        started = time.perf_counter()
+        result = agent.query(QUESTION)
+        timings[label] = time.perf_counter() - started
+        if result.get("error"):
+            timings["error"] = result["error"]
+print(json.dumps(timings))
+"""
+
+DEFAULT_QUESTION = "Qual foi o EBITDA Ajustado sem eventos exclusivos no 1T25?"
+TIMING_KEYS = ("import_s", "construct_s", "first_query_s", "second_query_s")
+# Slowdowns below this many seconds are treated as noise
+MIN_REGRESSION_S = 0.01
+
+
+def run_probe(question: Optional[str]) -> Dict:
+    """Run the probe once in a fresh interpreter and return its timings."""
+    code = f"QUESTION = {question!r}\n" + _PROBE
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+        # Both shortcuts would answer without building the LLM and vector store,
+        # which first_query_s is meant to measure
+        env={**os.environ, "ANSWER_CACHE_ENABLED": "false", "FACT_INDEX_ENABLED": "false"}
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def benchmark(runs: int, question: Optional[str]) -> Dict:
+    """
+    Run the probe several times and keep the median of each timing.
+
+    Args:
+        runs: Number of fresh-process runs
+        question: Question used for the query timings (None skips them)
+
+    Returns:
+        Dictionary with median timings and the raw runs
+    """
+    samples: List[Dict] = [run_probe(question) for _ in range(runs)]
+    summary = {
+        key: statistics.median(sample[key] for sample in samples)
+        for key in TIMING_KEYS if key in samples[0]
+    }
+    summary["heavy_modules_after_construct"] = samples[0]["heavy_modules_after_construct"]
+    summary["runs"] = samples
+    return summary
+
+
+def compare(summary: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Return the timings that regressed by more than `tolerance` (ratio)."""
+    regressions = []
+    for key in TIMING_KEYS:
+        if key in summary and key in baseline and baseline[key] > 0:
+            ratio = summary[key] / baseline[key]
+            if ratio > 1 + tolerance and summary[key] - baseline[key] > MIN_REGRESSION_S:
+                regressions.append(f"{key}: {baseline[key]:.3f}s -> {summary[key]:.3f}s ({ratio:.2f}x)")
+    return regressions
+
+
+def main() -> None:
+    """Main benchmark function."""
+    parser = argparse.ArgumentParser(description="Benchmark RAG agent cold start")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh-process runs (median is reported)")
+    parser.add_argument("--question", default=DEFAULT_QUESTION, help="Question used for query latency")
+    parser.add_argument("--no-query", action="store_true", help="Only measure import and construction")
+    parser.add_argument("--output", type=Path, help="Write the results to a JSON file")
+    parser.add_argument("--baseline", type=Path, help="Compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    print("⏱️ RAG agent startup benchmark")
+    print("=" * 40)
+
+    summary = benchmark(args.runs, None if args.no_query else args.question)
+    for key in TIMING_KEYS:
+        if key in summary:
+            print(f"   {key}: {summary[key] * 1000:.1f} ms")
+    print(f"   heavy modules loaded by construction: {summary['heavy_modules_after_construct'] or 'none'}")
+
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2))
+        print(f"💾 Results saved to: {args.output}")
+
+    if args.baseline:
+        regressions = compare(summary, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print("❌ Startup regressions:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("✅ No startup regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ Configuration management for RAG evaluation demo.
 """
 import os
 from pathlib import Path
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -13,6 +14,14 @@ PROJECT_ROOT = Path(__file__).parent.parent
 PYTHON_DIR = Path(__file__).parent
 DATASETS_DIR = PROJECT_ROOT / "datasets"
 CHROMA_DB_PATH = PYTHON_DIR / "chroma_db"
+NUMPY_INDEX_PATH = PYTHON_DIR / "numpy_index"
+LEXICAL_INDEX_PATH = PYTHON_DIR / "lexical_index"
+FACT_INDEX_PATH = PYTHON_DIR / "fact_index.json"
+# Versioned index snapshots: ingest.py builds each index version in
+# INDEX_SNAPSHOTS_DIR/snapshots/<version> and publishes it by swapping the
+# INDEX_SNAPSHOTS_DIR/CURRENT pointer (the paths above are the legacy layout,
+# used until the first snapshot is published)
+INDEX_SNAPSHOTS_DIR = Path(os.getenv("INDEX_SNAPSHOTS_DIR", str(PYTHON_DIR / "indexes")))
 
 # API Keys
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -25,16 +34,134 @@ LANGCHAIN_TRACING_V2 = os.getenv("LANGCHAIN_TRACING_V2", "true").lower() == "tru
 
 # Model configuration
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+# Optional OpenAI-compatible endpoint (e.g. a local fake server for tests)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Pooled HTTP clients (http_clients.py): one keep-alive connection pool per
+# provider base URL, shared by the LLM and embeddings of every agent in the
+# process. HTTP2_ENABLED needs the "http2" extra (h2 package)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
 
 # Dataset paths
 GOLDEN_SET_CSV = DATASETS_DIR / "golden-set.csv"
-RELATORIO_FINANCEIRO = DATASETS_DIR / "relatorio-financeiro.txt"
-RELATORIO_ADMINISTRACAO = DATASETS_DIR / "Relatorio-da-administracao.txt"
+
+# Ingestion corpus: every file under DATASETS_DIR matching INGEST_PATTERNS, or
+# exactly the files listed in the INGEST_MANIFEST JSON file
+INGEST_PATTERNS = [pattern.strip() for pattern in os.getenv("INGEST_PATTERNS", "*.txt,*.md,*.pdf").split(",") if pattern.strip()]
+INGEST_MANIFEST = Path(os.getenv("INGEST_MANIFEST")) if os.getenv("INGEST_MANIFEST") else None
+# Worker processes used to split reports
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# JSON profile (stage timings, chunk sizes, embedding counters) written by ingest.py
+INGEST_PROFILE_PATH = Path(os.getenv("INGEST_PROFILE_PATH", str(PYTHON_DIR / "ingest_profile.json")))
+# Near-duplicate chunks (boilerplate repeated across reports) are dropped at
+# ingest time: chunks whose MinHash Jaccard similarity reaches DEDUP_THRESHOLD
+# (and whose numbers match) keep only the first one
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))
+# A PDF whose extracted text is this much contained in a markdown/text report
+# is the same report in another format, and only the text one is ingested
+DEDUP_DOCUMENT_THRESHOLD = float(os.getenv("DEDUP_DOCUMENT_THRESHOLD", "0.8"))
+# Extracted PDF text, keyed by file hash, so re-runs skip extraction
+PDF_TEXT_CACHE_DIR = Path(os.getenv("PDF_TEXT_CACHE_DIR", str(PYTHON_DIR / "pdf_text_cache")))
+
+# Embedding configuration
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = Path(os.getenv("EMBEDDING_CACHE_DIR", str(PYTHON_DIR / "embedding_cache")))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+# Let the OpenAI client tokenize inputs with tiktoken and split those over the
+# model's context length. Chunks and questions are far below it, and tiktoken
+# downloads its encoding on first use, so it is off and the client works offline
+EMBEDDING_CHECK_CTX_LENGTH = os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "false").lower() == "true"
+# Ingestion embedding stage: batch limits, batches in flight and retries on
+# rate limits (429) and server errors (5xx)
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "20000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+# Agent query embeddings: concurrent questions that miss the embedding cache
+# within EMBEDDING_MICROBATCH_WINDOW_MS of each other (up to
+# EMBEDDING_MICROBATCH_MAX_SIZE) share one embeddings request
+EMBEDDING_MICROBATCH_ENABLED = os.getenv("EMBEDDING_MICROBATCH_ENABLED", "true").lower() == "true"
+EMBEDDING_MICROBATCH_WINDOW_MS = float(os.getenv("EMBEDDING_MICROBATCH_WINDOW_MS", "3"))
+EMBEDDING_MICROBATCH_MAX_SIZE = int(os.getenv("EMBEDDING_MICROBATCH_MAX_SIZE", "64"))
 
 # RAG configuration
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 TOP_K_RETRIEVAL = 5
+# Vector store backend: "chroma" (persistent Chroma DB) or "numpy" (in-process
+# memory-mapped index, faster to open for small corpora)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+# NumPy backend only: "none" (exact float32 search), "int8" (4x less memory) or
+# "binary" (32x less); quantized search shortlists VECTOR_RESCORE_MULTIPLIER
+# candidates per result and rescores them with the float32 vectors on disk
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+VECTOR_RESCORE_MULTIPLIER = int(os.getenv("VECTOR_RESCORE_MULTIPLIER", "8"))
+# Retrieval mode: "vector" (embedding similarity only) or "hybrid" (vector +
+# BM25 lexical ranking fused with reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Context packing: merge overlapping neighbour chunks and cap the prompt
+# context at CONTEXT_TOKEN_BUDGET tokens (0 disables the cap)
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Answer single-metric questions ("EBITDA Ajustado no 1T25") straight from the
+# table fact index written by ingest.py, without retrieval or an LLM call
+FACT_INDEX_ENABLED = os.getenv("FACT_INDEX_ENABLED", "true").lower() == "true"
+
+# Serving configuration
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "256"))
+# Concurrent LLM generations in PetrobrasRAGAgent.query_batch
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", "8"))
+# Deadline of a query, from the call to the answer (0 disables), and the
+# timeout of a single LLM request
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "60"))
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "30"))
+# Hedged generation (hedging.py): a completion still running after the
+# HEDGE_PERCENTILE latency of recent ones (HEDGE_INITIAL_DELAY_SECONDS until
+# HEDGE_MIN_SAMPLES were seen) is also sent to HEDGE_MODEL at HEDGE_BASE_URL
+# (default: the primary model and endpoint) and the first answer wins
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_MODEL = os.getenv("HEDGE_MODEL")
+HEDGE_BASE_URL = os.getenv("HEDGE_BASE_URL")
+HEDGE_API_KEY = os.getenv("HEDGE_API_KEY")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_INITIAL_DELAY_SECONDS = float(os.getenv("HEDGE_INITIAL_DELAY_SECONDS", "2"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# How often a running agent checks the CURRENT pointer for a new index version
+# (0 checks before every query), and how long a replaced version is kept for
+# queries still running on it before ingest.py deletes it
+INDEX_RELOAD_INTERVAL_SECONDS = float(os.getenv("INDEX_RELOAD_INTERVAL_SECONDS", "2"))
+SNAPSHOT_GC_GRACE_SECONDS = float(os.getenv("SNAPSHOT_GC_GRACE_SECONDS", "600"))
+# HTTP server (main.py): at most SERVER_MAX_CONCURRENCY queries run at once,
+# up to SERVER_MAX_QUEUE more wait for a slot (at most
+# SERVER_QUEUE_TIMEOUT_SECONDS) and anything beyond is rejected with 429
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", "16"))
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", "64"))
+SERVER_QUEUE_TIMEOUT_SECONDS = float(os.getenv("SERVER_QUEUE_TIMEOUT_SECONDS", "10"))
+# Worker threads that run blocking embedding and LLM calls under a query
+# deadline (hedging.py). Each running query holds up to two (primary and
+# hedge), and a call abandoned at the deadline keeps its worker until its own
+# request timeout, so the default leaves 4x the admission limit; calls beyond
+# it queue, which /ready reports as deadline_workers.queued
+DEADLINE_WORKERS = int(os.getenv("DEADLINE_WORKERS", str(4 * SERVER_MAX_CONCURRENCY)))
+
+# Semantic answer cache configuration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+# Optional .npz file to persist cached answers across runs
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH")
 
 # Evaluation configuration
 EVALUATION_METRICS = {
@@ -43,7 +170,7 @@ EVALUATION_METRICS = {
     "relevancy_threshold": 0.7
 }
 
-def validate_config():
+def validate_config() -> bool:
     """Validate that required configuration is present."""
     errors = []
     
@@ -56,24 +183,60 @@ def validate_config():
     if not GOLDEN_SET_CSV.exists():
         errors.append(f"Golden set CSV not found at {GOLDEN_SET_CSV}")
     
-    if not RELATORIO_FINANCEIRO.exists():
-        errors.append(f"Financial report not found at {RELATORIO_FINANCEIRO}")
+    if not DATASETS_DIR.is_dir():
+        errors.append(f"Datasets directory not found at {DATASETS_DIR}")
+    
+    if INGEST_MANIFEST is not None and not INGEST_MANIFEST.exists():
+        errors.append(f"Ingestion manifest not found at {INGEST_MANIFEST}")
+    
+    if not 0.0 < DEDUP_THRESHOLD <= 1.0:
+        errors.append(f"DEDUP_THRESHOLD must be in (0, 1], got {DEDUP_THRESHOLD}")
+    if not 0.0 < DEDUP_DOCUMENT_THRESHOLD <= 1.0:
+        errors.append(f"DEDUP_DOCUMENT_THRESHOLD must be in (0, 1], got {DEDUP_DOCUMENT_THRESHOLD}")
+    
+    if INDEX_RELOAD_INTERVAL_SECONDS < 0 or SNAPSHOT_GC_GRACE_SECONDS < 0:
+        errors.append("INDEX_RELOAD_INTERVAL_SECONDS and SNAPSHOT_GC_GRACE_SECONDS must not be negative")
+    
+    if EMBEDDING_MICROBATCH_WINDOW_MS < 0 or EMBEDDING_MICROBATCH_MAX_SIZE < 1:
+        errors.append("EMBEDDING_MICROBATCH_WINDOW_MS must not be negative and EMBEDDING_MICROBATCH_MAX_SIZE at least 1")
     
-    if not RELATORIO_ADMINISTRACAO.exists():
-        errors.append(f"Administration report not found at {RELATORIO_ADMINISTRACAO}")
+    if QUERY_TIMEOUT_SECONDS < 0 or LLM_REQUEST_TIMEOUT_SECONDS <= 0:
+        errors.append("QUERY_TIMEOUT_SECONDS must not be negative and LLM_REQUEST_TIMEOUT_SECONDS must be positive")
+    
+    if not 0 < HEDGE_PERCENTILE < 100 or HEDGE_INITIAL_DELAY_SECONDS < 0 or HEDGE_MIN_SAMPLES < 1:
+        errors.append("HEDGE_PERCENTILE must be between 0 and 100, HEDGE_INITIAL_DELAY_SECONDS not negative and HEDGE_MIN_SAMPLES at least 1")
+    
+    if HTTP_MAX_CONNECTIONS < 1 or not 0 <= HTTP_MAX_KEEPALIVE_CONNECTIONS <= HTTP_MAX_CONNECTIONS:
+        errors.append("HTTP_MAX_CONNECTIONS must be at least 1 and HTTP_MAX_KEEPALIVE_CONNECTIONS between 0 and HTTP_MAX_CONNECTIONS")
+    
+    if SERVER_MAX_CONCURRENCY < 1 or SERVER_MAX_QUEUE < 0:
+        errors.append("SERVER_MAX_CONCURRENCY must be at least 1 and SERVER_MAX_QUEUE not negative")
+    
+    if DEADLINE_WORKERS < 1:
+        errors.append("DEADLINE_WORKERS must be at least 1")
+    
+    if VECTOR_BACKEND not in ("chroma", "numpy"):
+        errors.append(f"VECTOR_BACKEND must be 'chroma' or 'numpy', got '{VECTOR_BACKEND}'")
+    
+    if VECTOR_QUANTIZATION not in ("none", "int8", "binary"):
+        errors.append(f"VECTOR_QUANTIZATION must be 'none', 'int8' or 'binary', got '{VECTOR_QUANTIZATION}'")
+    
+    if RETRIEVAL_MODE not in ("vector", "hybrid"):
+        errors.append(f"RETRIEVAL_MODE must be 'vector' or 'hybrid', got '{RETRIEVAL_MODE}'")
     
     if errors:
         raise ValueError("Configuration validation failed:\n" + "\n".join(f"- {error}" for error in errors))
     
     return True
 
-def get_llm_config():
+def get_llm_config() -> Dict[str, Optional[str]]:
     """Get LLM configuration based on available API keys."""
     if OPENAI_API_KEY:
         return {
             "provider": "openai",
             "api_key": OPENAI_API_KEY,
-            "model": OPENAI_MODEL
+            "model": OPENAI_MODEL,
+            "base_url": OPENAI_BASE_URL
         }
     elif OPENROUTER_API_KEY:
         return {
@@ -89,6 +252,8 @@ if __name__ == "__main__":
         validate_config()
         print("✅ Configuration is valid")
         print(f"📁 Chroma DB path: {CHROMA_DB_PATH}")
+        print(f"🗂️ Vector backend: {VECTOR_BACKEND}")
+        print(f"🔎 Retrieval mode: {RETRIEVAL_MODE}")
         print(f"📊 Golden set: {GOLDEN_SET_CSV}")
         print(f"🤖 LLM config: {get_llm_config()}")
     except ValueError as e:
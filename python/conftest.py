@@ -0,0 +1,159 @@
+"""
+Shared pytest fixtures.
+"""
+import hashlib
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Local OpenAI-compatible embeddings and chat completions endpoint with failure injection."""
+
+    daemon_threads = True
+
+    def __init__(self, dim: int = 8, delay: float = 0.02):
+        """
+        Args:
+            dim: Dimension of the returned embeddings
+            delay: Seconds each request takes, so concurrency is observable
+        """
+        super().__init__(("127.0.0.1", 0), _FakeOpenAIHandler)
+        self.dim = dim
+        self.delay = delay
+        self.fail_next: List[int] = []  # status codes returned by the next requests
+        self.answer = (
+            "**RESPOSTA:**\nO EBITDA Ajustado foi de R$ 62,3 bilhões "
+            "**[Relatório de Desempenho 1T25, Seção: Destaques]**.\n\n**CONFIANÇA:** alta"
+        )
+        self.chat_delay = 0.0  # extra seconds per chat completion
+        self.model_delays: Dict[str, float] = {}  # extra seconds per chat completion of a model
+        self.requests = 0
+        self.connections = 0
+        self.embedded_inputs = 0
+        self.chat_requests = 0
+        self.inflight = 0
+        self.max_inflight = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients hanging up (deadlines, cancelled hedges) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def embed(self, text: str) -> List[float]:
+        """Deterministic pseudo-embedding of a text."""
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [(byte - 128) / 128 for byte in digest[:self.dim]]
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server: FakeOpenAIServer
+    # Keep-alive, so clients can reuse connections
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests += 1
+            server.inflight += 1
+            server.max_inflight = max(server.max_inflight, server.inflight)
+            status = server.fail_next.pop(0) if server.fail_next else 200
+        try:
+            time.sleep(server.delay)
+            if status != 200:
+                self._send_json(status, {"error": {"message": f"injected {status}", "type": "fake"}})
+                return
+            if self.path.endswith("/chat/completions"):
+                self._complete(payload)
+                return
+            if not self.path.endswith("/embeddings"):
+                self._send_json(404, {"error": {"message": "not found", "type": "fake"}})
+                return
+            inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+            with server.lock:
+                server.embedded_inputs += len(inputs)
+            self._send_json(200, {
+                "object": "list",
+                "model": payload.get("model", "fake"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": server.embed(str(text))}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}
+            })
+        finally:
+            with server.lock:
+                server.inflight -= 1
+
+    def _complete(self, payload: dict) -> None:
+        """Answer a chat completion with server.answer, streamed word by word when asked."""
+        server = self.server
+        with server.lock:
+            server.chat_requests += 1
+        model = payload.get("model", "fake")
+        time.sleep(server.chat_delay + server.model_delays.get(model, 0.0))
+        if not payload.get("stream"):
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": 0,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": server.answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        words = server.answer.split(" ")
+        deltas = [{"role": "assistant", "content": word if i == 0 else " " + word} for i, word in enumerate(words)]
+        for delta in deltas + [{}]:
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None if delta else "stop"}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+@pytest.fixture
+def fake_openai_server() -> Iterator[FakeOpenAIServer]:
+    """Run a FakeOpenAIServer for the duration of a test."""
+    server = FakeOpenAIServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
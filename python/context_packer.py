@@ -0,0 +1,228 @@
+"""
+Token-budgeted context assembly for the RAG prompt.
+
+Chunks are produced by RecursiveCharacterTextSplitter with CHUNK_OVERLAP, so
+neighbouring chunks of the same section repeat up to that many characters.
+The packer merges chunks that are adjacent in the source (consecutive
+chunk_index, same report and headers) and drops the repeated text, groups
+passages by section, and fills the prompt up to a token budget, most relevant
+section first.
+"""
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+HEADER_KEYS = ("Header 1", "Header 2", "Header 3")
+
+# Shortest suffix/prefix match accepted as splitter overlap; shorter matches
+# (a shared space or punctuation mark) are coincidences
+MIN_OVERLAP_CHARS = 10
+
+# A passage is truncated to fit the remaining budget only when at least this
+# many tokens are left; otherwise packing stops
+MIN_TRUNCATED_TOKENS = 50
+
+
+@lru_cache(maxsize=8)
+def _get_encoder(model: str) -> Optional[Any]:
+    """Return the tiktoken encoder for a model, or None when unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model.split("/")[-1])
+    except Exception:
+        pass
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Encodings are downloaded on first use; fall back when offline
+        return None
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    """Count tokens with tiktoken, or estimate them (~4 characters per token)."""
+    encoder = _get_encoder(model)
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def section_of(doc: Document) -> Tuple[str, ...]:
+    """
+    Header path of a chunk, e.g. ("Relatório...", "Resultado consolidado").
+
+    Chunks of PDF reports have no headers; their page is the section, so each
+    page gets its own heading (and citation).
+    """
+    section = tuple(doc.metadata[key] for key in HEADER_KEYS if doc.metadata.get(key))
+    if doc.metadata.get("page") is not None:
+        section += (f"Página {doc.metadata['page']}",)
+    return section
+
+
+def merge_overlapping(first: str, second: str, max_overlap: int) -> str:
+    """
+    Join two consecutive chunks, dropping the text the splitter repeated.
+
+    Args:
+        first: Earlier chunk
+        second: Next chunk in the source
+        max_overlap: Longest overlap to look for (the splitter's chunk_overlap)
+
+    Returns:
+        The joined text
+    """
+    longest = min(len(first), len(second), max_overlap)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def _render_section(heading: str, texts: List[str]) -> str:
+    """Section heading followed by its passages; gaps are marked with [...]."""
+    return heading + "\n" + "\n\n[...]\n\n".join(texts)
+
+
+class ContextPacker:
+    """Merges, orders and budgets retrieved chunks into the prompt context."""
+
+    def __init__(self, token_budget: int, model: str = "", max_overlap: int = 200):
+        """
+        Initialize the packer.
+
+        Args:
+            token_budget: Maximum number of context tokens (0 disables the limit)
+            model: Model name used to pick the tokenizer
+            max_overlap: Splitter chunk_overlap, in characters
+        """
+        self.token_budget = token_budget
+        self.model = model
+        self.max_overlap = max_overlap
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the packer's tokenizer."""
+        return count_tokens(text, self.model)
+
+    def _passages(self, docs: List[Document]) -> List[Dict[str, Any]]:
+        """
+        Merge runs of adjacent chunks into passages.
+
+        Returns:
+            Passages with their report source, section, text, chunk indexes and
+            best retrieval rank
+        """
+        seen = set()
+        chunks = []
+        for rank, doc in enumerate(docs):
+            source = doc.metadata.get("source", "unknown")
+            chunk_index = doc.metadata.get("chunk_index")
+            key = (source, chunk_index) if chunk_index is not None else doc.page_content
+            if key in seen:
+                continue
+            seen.add(key)
+            chunks.append((source, section_of(doc), chunk_index, rank, doc))
+
+        # Chunks without chunk_index can't be proven adjacent and stay separate
+        ordered = sorted(
+            chunks,
+            key=lambda c: (c[0], c[1], c[2] is None, c[2] if c[2] is not None else c[3])
+        )
+        passages: List[Dict[str, Any]] = []
+        for source, section, chunk_index, rank, doc in ordered:
+            text = doc.page_content.strip()
+            last = passages[-1] if passages else None
+            if (last is not None and chunk_index is not None
+                    and last["source"] == source and last["section"] == section
+                    and last["chunk_indexes"][-1] == chunk_index - 1):
+                last["text"] = merge_overlapping(last["text"], text, self.max_overlap)
+                last["chunk_indexes"].append(chunk_index)
+                last["rank"] = min(last["rank"], rank)
+                continue
+            passages.append({
+                "source": source,
+                "section": section,
+                "text": text,
+                "chunk_indexes": [chunk_index],
+                "rank": rank,
+                "doc": doc
+            })
+        return passages
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text at a line or word boundary so it fits in max_tokens."""
+        tokens = self.count_tokens(text)
+        while tokens > max_tokens and text:
+            cut = int(len(text) * max_tokens / tokens * 0.95)
+            boundary = max(text.rfind("\n", 0, cut), text.rfind(" ", 0, cut))
+            text = text[:boundary if boundary > cut // 2 else cut].rstrip()
+            tokens = self.count_tokens(text)
+        return text
+
+    def pack(self, docs: List[Document],
+             label: Callable[[Document], str]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Build the prompt context for retrieved documents.
+
+        Args:
+            docs: Retrieved chunks, most relevant first
+            label: Returns the report name shown above a chunk's section
+
+        Returns:
+            The context text and packing stats: tokens used, tokens the
+            unpacked context would have used, tokens saved, and chunk/passage
+            counts
+        """
+        raw_context = "\n\n".join(f"**{label(doc)}**\n{doc.page_content.strip()}" for doc in docs)
+        raw_tokens = self.count_tokens(raw_context) if docs else 0
+
+        # Group passages by section; sections follow their best-ranked chunk
+        sections: Dict[Tuple[str, Tuple[str, ...]], List[Dict[str, Any]]] = {}
+        for passage in self._passages(docs):
+            sections.setdefault((passage["source"], passage["section"]), []).append(passage)
+        ordered_sections = sorted(sections.values(), key=lambda group: min(p["rank"] for p in group))
+
+        parts: List[str] = []
+        used = 0
+        packed_chunks = 0
+        passage_count = 0
+        truncated = False
+        for group in ordered_sections:
+            # Chunks keep their markdown headers, so the report name suffices
+            heading = f"**{label(group[0]['doc'])}**"
+
+            texts: List[str] = []
+            for passage in group:
+                section_tokens = self.count_tokens(_render_section(heading, texts + [passage["text"]]))
+                if self.token_budget and used + section_tokens > self.token_budget:
+                    remaining = self.token_budget - used - self.count_tokens(_render_section(heading, texts)) - 2
+                    if remaining >= MIN_TRUNCATED_TOKENS:
+                        texts.append(self._truncate(passage["text"], remaining))
+                        packed_chunks += len(passage["chunk_indexes"])
+                        passage_count += 1
+                    truncated = True
+                    break
+                texts.append(passage["text"])
+                packed_chunks += len(passage["chunk_indexes"])
+                passage_count += 1
+
+            if texts:
+                parts.append(_render_section(heading, texts))
+                used = self.count_tokens("\n\n".join(parts))
+            if truncated:
+                break
+
+        context = "\n\n".join(parts)
+        tokens = self.count_tokens(context) if parts else 0
+        return context, {
+            "tokens": tokens,
+            "raw_tokens": raw_tokens,
+            "tokens_saved": max(0, raw_tokens - tokens),
+            "chunks": packed_chunks,
+            "retrieved_chunks": len(docs),
+            "passages": passage_count,
+            "truncated": truncated
+        }
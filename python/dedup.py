@@ -0,0 +1,215 @@
+"""
+Near-duplicate chunk detection with MinHash and locality-sensitive hashing.
+
+The reports repeat boilerplate (disclaimers, table headers, the Sumário,
+glossary entries), which wastes embedding calls, top-k slots and prompt
+tokens. Every chunk gets a MinHash signature of its word 3-grams; signatures
+are split into LSH bands so only chunks sharing a band are compared, and a
+candidate is a duplicate when its estimated Jaccard similarity reaches the
+threshold. Chunks whose numbers differ are never merged, so the same table
+for two periods is kept twice. The first chunk (in document order) of each
+group is the representative.
+
+Whole reports are compared too: a PDF and its text conversion share almost
+every shingle, so find_duplicate_documents() pairs them before splitting.
+"""
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from context_packer import count_tokens
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_PATTERN = re.compile(r"\w+")
+_NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def lsh_parameters(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Bands and rows per band for a similarity threshold.
+
+    Picks the most rows per band whose S-curve midpoint (1/bands)^(1/rows)
+    does not exceed the threshold, so pairs at the threshold are very likely
+    to share a band (recall first; candidates are verified afterwards).
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold:
+            best = (bands, rows)
+    return best
+
+
+def word_shingles(text: str, size: int = 3) -> Set[str]:
+    """Word n-grams of the lowercased text (the whole text when shorter)."""
+    words = _WORD_PATTERN.findall(text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+class MinHasher:
+    """MinHash signatures of word shingles."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        """
+        Args:
+            num_perm: Hash functions per signature
+            shingle_size: Words per shingle
+            seed: Seed of the hash function coefficients
+        """
+        rng = np.random.default_rng(seed)
+        # Coefficients below 2^31 keep a * x + b within uint64 for 32-bit x
+        self.a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def shingles(self, text: str) -> List[str]:
+        """Word n-grams of the lowercased text (the whole text when shorter)."""
+        return list(word_shingles(text, self.shingle_size))
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (uint32, one value per hash function)."""
+        shingles = self.shingles(text)
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+        )
+        permuted = (hashes[:, None] * self.a + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """Streaming LSH index that reports the representative of near-duplicate texts."""
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 3):
+        """
+        Args:
+            threshold: Minimum estimated Jaccard similarity of duplicates
+            num_perm: Hash functions per MinHash signature
+            shingle_size: Words per shingle
+        """
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = lsh_parameters(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._numbers: Dict[str, Tuple[str, ...]] = {}
+
+    def add(self, key: str, text: str) -> Optional[str]:
+        """
+        Look a text up and index it when it is new.
+
+        Returns:
+            Key of the earlier text it duplicates, or None (the text is then
+            indexed as a representative)
+        """
+        signature = self.hasher.signature(text)
+        numbers = tuple(_NUMBER_PATTERN.findall(text))
+        band_keys = [
+            signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)
+        ]
+        seen = set()
+        for band, band_key in enumerate(band_keys):
+            for candidate in self._buckets[band].get(band_key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold and self._numbers[candidate] == numbers:
+                    return candidate
+
+        self._signatures[key] = signature
+        self._numbers[key] = numbers
+        for band, band_key in enumerate(band_keys):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        return None
+
+
+class DedupPlan:
+    """Which chunks are near-duplicates of which representative."""
+
+    def __init__(self) -> None:
+        self.representative_of: Dict[str, str] = {}
+        self.duplicate_sources: Dict[str, List[str]] = {}
+        self.removed_tokens = 0
+        self.total = 0
+
+    @property
+    def removed(self) -> int:
+        return len(self.representative_of)
+
+
+def chunk_location(chunk: Document) -> str:
+    """Where a chunk comes from, e.g. "relatorio.txt#12" or "relatorio.pdf#3 (p. 2)"."""
+    location = f"{chunk.metadata.get('source', '')}#{chunk.metadata.get('chunk_index', '')}"
+    if chunk.metadata.get("page") is not None:
+        location += f" (p. {chunk.metadata['page']})"
+    return location
+
+
+def find_near_duplicates(chunks: Iterable[Document], threshold: float = 0.85, num_perm: int = 128,
+                         model: str = "") -> DedupPlan:
+    """
+    Find the near-duplicate chunks of a corpus.
+
+    Args:
+        chunks: Chunks with IDs, in document order (consumed once)
+        threshold: Minimum estimated Jaccard similarity of duplicates
+        num_perm: Hash functions per MinHash signature
+        model: Embedding model name used to count the removed tokens
+
+    Returns:
+        The DedupPlan mapping every duplicate to its representative
+    """
+    index = NearDuplicateIndex(threshold, num_perm)
+    plan = DedupPlan()
+    for chunk in chunks:
+        plan.total += 1
+        representative = index.add(chunk.id, chunk.page_content)
+        if representative is None:
+            continue
+        plan.representative_of[chunk.id] = representative
+        plan.duplicate_sources.setdefault(representative, []).append(chunk_location(chunk))
+        plan.removed_tokens += count_tokens(chunk.page_content, model)
+    return plan
+
+
+def containment(shingles: Set[str], other: Set[str]) -> float:
+    """Share of the smaller shingle set found in the other one (1.0 when one text contains the other)."""
+    if not shingles or not other:
+        return 0.0
+    return len(shingles & other) / min(len(shingles), len(other))
+
+
+def find_duplicate_documents(candidates: Dict[str, str], originals: Dict[str, str],
+                             threshold: float = 0.8, shingle_size: int = 3) -> Dict[str, Tuple[str, float]]:
+    """
+    Find the candidate documents that are another copy of an original one.
+
+    Containment rather than Jaccard similarity is used, since a conversion
+    drops page headers and footers or adds markup, so one text is mostly
+    contained in the other even when their sizes differ.
+
+    Args:
+        candidates: Texts that may be copies, by key (e.g. extracted PDFs)
+        originals: Texts kept when a copy is found, by key
+        threshold: Minimum containment of duplicates
+        shingle_size: Words per shingle
+
+    Returns:
+        (original key, containment) of every duplicate candidate, by key
+    """
+    original_shingles = {key: word_shingles(text, shingle_size) for key, text in originals.items()}
+    duplicates = {}
+    for key, text in candidates.items():
+        shingles = word_shingles(text, shingle_size)
+        scores = [(containment(shingles, other), original) for original, other in original_shingles.items()]
+        if not scores:
+            continue
+        score, original = max(scores)
+        if score >= threshold:
+            duplicates[key] = (original, score)
+    return duplicates
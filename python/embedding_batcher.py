@@ -0,0 +1,173 @@
+"""
+Micro-batching of query embeddings across concurrent requests.
+
+Every question the agent answers needs one query embedding, so under
+concurrent load each request would make its own single-string HTTP call.
+MicroBatchingEmbeddings queues embed_query()/aembed_query() calls; a
+collector thread waits at most window_ms after the first queued query (or
+until max_batch_size queries are waiting), sends the unique texts as one
+embed_documents() request and routes each vector back to its caller. Sync
+callers block on a future, async callers await it without blocking the
+event loop. Document embeddings (ingestion, query_batch) are already
+batched and pass straight through.
+"""
+import asyncio
+import os
+import queue
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class _PendingQuery:
+    """A queued query embedding and the future its caller waits on."""
+
+    __slots__ = ("text", "future", "enqueued")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """Embeddings wrapper that coalesces concurrent query embeddings into batches."""
+
+    def __init__(self, embeddings: Embeddings, window_ms: float = 3.0, max_batch_size: int = 64,
+                 max_inflight: int = 4):
+        """
+        Args:
+            embeddings: Underlying embeddings client (e.g. OpenAIEmbeddings)
+            window_ms: How long the first query of a batch waits for others
+            max_batch_size: Queries per batch; a full batch is sent at once
+            max_inflight: Batches sent concurrently
+        """
+        self.embeddings = embeddings
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_inflight = max_inflight
+        self._batch_sizes: Counter = Counter()
+        self._delays: deque = deque(maxlen=10000)
+        self._requests = 0
+        self._texts_sent = 0
+        self._start()
+
+    def _start(self) -> None:
+        """Create the queue, sender threads and lock of the current process."""
+        self._pid = os.getpid()
+        self._queue: "queue.SimpleQueue[_PendingQuery]" = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(self.max_inflight, thread_name_prefix="embedding-batch")
+        self._collector: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _submit(self, text: str) -> Future:
+        """Queue a query and start the collector thread on first use."""
+        if self._pid != os.getpid():
+            # Threads do not survive fork(); the child needs its own
+            self._start()
+        if self._collector is None:
+            with self._lock:
+                if self._collector is None:
+                    self._collector = threading.Thread(target=self._collect, name="embedding-batcher", daemon=True)
+                    self._collector.start()
+        pending = _PendingQuery(text)
+        self._queue.put(pending)
+        return pending.future
+
+    def _collect(self) -> None:
+        """Form batches: the first query opens a window, the batch closes when it ends or fills up."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].enqueued + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: List[_PendingQuery]) -> None:
+        """Embed a batch with one request and resolve every caller's future."""
+        dispatched = time.perf_counter()
+        # Callers that gave up (cancelled async waits) are dropped
+        batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        texts = list(dict.fromkeys(pending.text for pending in batch))
+        with self._lock:
+            self._requests += len(batch)
+            self._texts_sent += len(texts)
+            self._batch_sizes[len(batch)] += 1
+            self._delays.extend(dispatched - pending.enqueued for pending in batch)
+        try:
+            vectors = dict(zip(texts, self.embeddings.embed_documents(texts)))
+        except Exception as e:
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        for pending in batch:
+            pending.future.set_result(vectors[pending.text])
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query as part of the next batch."""
+        return self._submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async version of embed_query()."""
+        return await asyncio.wrap_future(self._submit(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents directly (they are batched already)."""
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Async version of embed_documents()."""
+        return await self.embeddings.aembed_documents(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Batching metrics.
+
+        Returns:
+            requests (queries embedded), batches, texts_sent (after merging
+            identical queries), mean/max batch size, batch size histogram
+            and the queueing delay added by batching (ms: mean, p50, p95,
+            max over the last 10000 queries)
+        """
+        with self._lock:
+            sizes = dict(sorted(self._batch_sizes.items()))
+            delays = sorted(self._delays)
+            requests = self._requests
+            texts_sent = self._texts_sent
+        batches = sum(sizes.values())
+        return {
+            "requests": requests,
+            "batches": batches,
+            "texts_sent": texts_sent,
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "max_batch_size": max(sizes) if sizes else 0,
+            "batch_size_histogram": sizes,
+            "queue_delay_ms": {
+                "mean": statistics.mean(delays) * 1000 if delays else 0.0,
+                "p50": delays[len(delays) // 2] * 1000 if delays else 0.0,
+                "p95": delays[int(0.95 * (len(delays) - 1))] * 1000 if delays else 0.0,
+                "max": delays[-1] * 1000 if delays else 0.0
+            }
+        }
+
+
+def find_batcher(embeddings: Any) -> Optional[MicroBatchingEmbeddings]:
+    """The MicroBatchingEmbeddings in a wrapper chain (e.g. under CachedEmbeddings), or None."""
+    while embeddings is not None:
+        if isinstance(embeddings, MicroBatchingEmbeddings):
+            return embeddings
+        embeddings = getattr(embeddings, "embeddings", None)
+    return None
@@ -0,0 +1,453 @@
+"""
+Persistent, content-hash-keyed embedding cache shared by ingestion and the agent.
+
+Vectors live in a memory-mapped float32 file, one directory per embedding
+model and provider (namespace). Each row stores the vector followed by the 16-byte hash of
+the text it belongs to, so a row is verified on every read. A compact binary
+index (hash, row, last use) maps hashes to rows, and the least recently used
+rows are recycled once the cache reaches its size limit. A store whose
+vectors have a different dimension than the provider returns (for example
+after the model's output size changed) is discarded and rebuilt.
+"""
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+from config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAX_MB,
+    EMBEDDING_CHECK_CTX_LENGTH,
+    EMBEDDING_MICROBATCH_WINDOW_MS,
+    EMBEDDING_MICROBATCH_MAX_SIZE
+)
+
+# Trailing float32 slots of each row holding the 16-byte text hash
+_KEY_SLOTS = 4
+_INDEX_DTYPE = np.dtype([("key", "S16"), ("row", "<i8"), ("last_used", "<f8")])
+
+
+def text_key(text: str) -> bytes:
+    """Return the 16-byte content hash used as cache key."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingStore:
+    """Memory-mapped float32 embedding store for one model namespace."""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        """
+        Open (or create) the store.
+
+        Args:
+            directory: Namespace directory holding the store files
+            max_bytes: Size limit of the vector file; older rows are recycled
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.vectors_path = self.directory / "vectors.f32"
+        self.index_path = self.directory / "index.npy"
+        self.meta_path = self.directory / "meta.json"
+        self.lock_path = self.directory / ".lock"
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[bytes, List[float]] = {}
+        self._index_mtime = 0
+        self._dirty = False
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.RLock()
+
+        self._read_meta()
+        self._reload_index()
+        atexit.register(self.flush)
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of rows allowed by the size limit."""
+        return max(1, self.max_bytes // ((self.dim + _KEY_SLOTS) * 4))
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Serialize writers across processes sharing the same cache."""
+        with open(self.lock_path, "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                elif msvcrt is not None:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_meta(self) -> None:
+        """Load the vector dimension recorded by the process that created the store."""
+        if self.meta_path.exists():
+            self.dim = json.loads(self.meta_path.read_text())["dim"]
+
+    def _reset(self, dim: int) -> None:
+        """
+        Discard every cached vector and start over with a new dimension.
+
+        Called with the file lock held when the provider returns vectors of
+        another size than the store holds.
+        """
+        print(f"⚠️ Embedding cache {self.directory} holds {self.dim}-dim vectors, "
+              f"the provider returned {dim}-dim ones; rebuilding it")
+        self._vectors = None
+        self.vectors_path.unlink(missing_ok=True)
+        self.dim = dim
+        self.meta_path.write_text(json.dumps({"dim": dim}))
+        self._rows = {}
+        self._save_index()
+
+    def _reload_index(self) -> None:
+        """Reload the index when another process rewrote it."""
+        if not self.index_path.exists():
+            return
+        mtime = self.index_path.stat().st_mtime_ns
+        if mtime == self._index_mtime:
+            return
+        # The store may have been rebuilt with another dimension
+        self._read_meta()
+        index = np.load(self.index_path)
+        self._rows = {
+            bytes(entry["key"]): [int(entry["row"]), float(entry["last_used"])]
+            for entry in index
+        }
+        self._index_mtime = mtime
+        self._vectors = None
+
+    def _open_vectors(self, rows: int = 0) -> np.memmap:
+        """Map the vector file, growing it to hold at least `rows` rows."""
+        row_bytes = (self.dim + _KEY_SLOTS) * 4
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        # Ignore a partial trailing row (e.g. a file written with another dimension)
+        size -= size % row_bytes
+        if size < rows * row_bytes:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(rows * row_bytes)
+            size = rows * row_bytes
+            self._vectors = None
+        if self._vectors is None and size:
+            self._vectors = np.memmap(
+                self.vectors_path,
+                dtype=np.float32,
+                mode="r+",
+                shape=(size // row_bytes, self.dim + _KEY_SLOTS)
+            )
+        return self._vectors
+
+    def get_many(self, texts: List[str], dim: Optional[int] = None) -> List[Optional[List[float]]]:
+        """
+        Look up cached embeddings.
+
+        Args:
+            texts: Texts to look up
+            dim: Dimension the caller expects, when known; a store holding
+                vectors of another size reports every text as a miss
+
+        Returns:
+            One embedding per text, or None where the text is not cached
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            self._reload_index()
+            usable = self.dim is not None and (dim is None or dim == self.dim)
+            vectors = self._open_vectors() if usable else None
+            if vectors is None or not self._rows:
+                self.misses += len(texts)
+                return results
+
+            now = time.time()
+            for i, text in enumerate(texts):
+                key = text_key(text)
+                entry = self._rows.get(key)
+                if entry is not None and entry[0] < len(vectors):
+                    row = vectors[entry[0]]
+                    if row[self.dim:].tobytes() == key:
+                        results[i] = row[:self.dim].tolist()
+                        entry[1] = now
+                        self._dirty = True
+                        self.hits += 1
+                        continue
+                self.misses += 1
+        return results
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]) -> None:
+        """
+        Store embeddings for texts, recycling least recently used rows when full.
+
+        A batch with more new texts than the cache holds keeps only its last
+        capacity texts, with a warning.
+
+        Args:
+            texts: Texts that were embedded
+            embeddings: Their embeddings, in the same order
+        """
+        if not texts:
+            return
+        dims = {len(embedding) for embedding in embeddings}
+        if len(dims) != 1:
+            raise ValueError(f"Embeddings of mixed dimensions {sorted(dims)} cannot be cached together")
+        dim = dims.pop()
+        with self._lock, self._file_lock():
+            self._reload_index()
+            if self.dim is None:
+                self.dim = dim
+                self.meta_path.write_text(json.dumps({"dim": self.dim}))
+            elif self.dim != dim:
+                self._reset(dim)
+
+            new_items = {}
+            for text, embedding in zip(texts, embeddings):
+                key = text_key(text)
+                if key not in self._rows:
+                    new_items[key] = embedding
+            if not new_items:
+                return
+            capacity = self.capacity
+            if len(new_items) > capacity:
+                print(f"⚠️ Embedding cache {self.directory} holds {capacity} vectors; caching only the last "
+                      f"{capacity} of {len(new_items)} new ones (raise EMBEDDING_CACHE_MAX_MB)")
+                new_items = dict(list(new_items.items())[-capacity:])
+
+            rows = self._allocate_rows(len(new_items))
+            vectors = self._open_vectors(max(rows) + 1)
+            now = time.time()
+            for row, (key, embedding) in zip(rows, new_items.items()):
+                vectors[row, :self.dim] = embedding
+                vectors[row].view(np.uint8)[self.dim * 4:] = np.frombuffer(key, dtype=np.uint8)
+                self._rows[key] = [row, now]
+            vectors.flush()
+            self._dirty = True
+            self._save_index()
+
+    def _allocate_rows(self, count: int) -> List[int]:
+        """Pick rows for count (at most capacity) new entries: free slots first, then recycled LRU rows."""
+        capacity = self.capacity
+        used = {entry[0] for entry in self._rows.values()}
+        free = [row for row in range(min(capacity, len(used) + count)) if row not in used]
+        rows = free[:count]
+
+        shortfall = count - len(rows)
+        if shortfall > 0:
+            by_age = sorted(self._rows.items(), key=lambda item: item[1][1])
+            for key, entry in by_age[:shortfall]:
+                rows.append(entry[0])
+                del self._rows[key]
+        return rows
+
+    def _save_index(self) -> None:
+        """Atomically rewrite the binary index."""
+        index = np.array(
+            [(key, row, last_used) for key, (row, last_used) in self._rows.items()],
+            dtype=_INDEX_DTYPE
+        )
+        tmp_path = self.index_path.with_name("index.tmp.npy")
+        np.save(tmp_path, index)
+        tmp_path.replace(self.index_path)
+        self._index_mtime = self.index_path.stat().st_mtime_ns
+        self._dirty = False
+
+    def flush(self) -> None:
+        """Persist pending last-use updates."""
+        with self._lock:
+            if self._dirty and self.dim is not None:
+                with self._file_lock():
+                    self._save_index()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of cached vectors."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._rows)}
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends uncached texts to the provider."""
+
+    def __init__(self, embeddings: Embeddings, store: EmbeddingStore):
+        """
+        Args:
+            embeddings: Underlying embeddings client (e.g. OpenAIEmbeddings)
+            store: Embedding store for the client's model
+        """
+        self.embeddings = embeddings
+        self.store = store
+        # Dimension of the provider's vectors. Until the first provider call
+        # reveals it the cache cannot tell stale vectors from good ones, so
+        # that call always goes to the provider.
+        self.dim: Optional[int] = None
+
+    def _missing(self, texts: List[str], cached: List[Optional[List[float]]]) -> List[str]:
+        """Unique texts that still need to be embedded, in first-seen order."""
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        if self.dim is None and not missing and texts:
+            # Everything is cached but the provider's dimension is unknown: probe with one text
+            missing = [texts[0]]
+        return missing
+
+    def _stale(self, cached: List[Optional[List[float]]]) -> bool:
+        """Whether cached vectors were read before the store was found to have another dimension."""
+        return any(vector is not None and len(vector) != self.dim for vector in cached)
+
+    @staticmethod
+    def _merge(texts: List[str], cached: List[Optional[List[float]]], missing: List[str],
+               embedded: List[List[float]]) -> List[List[float]]:
+        """Fill the cache misses with the freshly embedded vectors."""
+        fresh = dict(zip(missing, embedded))
+        return [vector if vector is not None else fresh[text] for text, vector in zip(texts, cached)]
+
+    def _store(self, texts: List[str], embedded: List[List[float]]) -> None:
+        """Cache fresh vectors; their size becomes the dimension expected from the store."""
+        if embedded:
+            self.dim = len(embedded[0])
+        self.store.put_many(texts, embedded)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, serving repeated texts from the cache."""
+        cached = self.store.get_many(texts, self.dim)
+        missing = self._missing(texts, cached)
+        embedded = self.embeddings.embed_documents(missing) if missing else []
+        self._store(missing, embedded)
+        if self._stale(cached):
+            return self.embed_documents(texts)
+        return self._merge(texts, cached, missing, embedded)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, serving repeated texts from the cache."""
+        cached = self.store.get_many([text], self.dim)[0] if self.dim is not None else None
+        if cached is not None:
+            return cached
+        # Misses go through embed_query so a micro-batcher below can coalesce them
+        vector = self.embeddings.embed_query(text)
+        self._store([text], [vector])
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Async version of embed_documents()."""
+        cached = self.store.get_many(texts, self.dim)
+        missing = self._missing(texts, cached)
+        embedded = await self.embeddings.aembed_documents(missing) if missing else []
+        self._store(missing, embedded)
+        if self._stale(cached):
+            return await self.aembed_documents(texts)
+        return self._merge(texts, cached, missing, embedded)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async version of embed_query()."""
+        cached = self.store.get_many([text], self.dim)[0] if self.dim is not None else None
+        if cached is not None:
+            return cached
+        vector = await self.embeddings.aembed_query(text)
+        self._store([text], [vector])
+        return vector
+
+
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def cache_namespace(model: str, base_url: Optional[str] = None) -> str:
+    """
+    Directory name of a model's cache.
+
+    Vectors from different providers (e.g. a proxy or a local test server
+    serving the same model name) are kept apart by a hash of the base URL.
+    """
+    namespace = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+    if base_url:
+        namespace += "-" + hashlib.blake2b(base_url.rstrip("/").encode("utf-8"), digest_size=4).hexdigest()
+    return namespace
+
+
+def get_embedding_store(model: str, base_url: Optional[str] = None) -> EmbeddingStore:
+    """Return the process-wide embedding store for a model and provider."""
+    namespace = cache_namespace(model, base_url)
+    with _stores_lock:
+        if namespace not in _stores:
+            _stores[namespace] = EmbeddingStore(
+                EMBEDDING_CACHE_DIR / namespace,
+                max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+            )
+        return _stores[namespace]
+
+
+def _reset_after_fork() -> None:
+    """Open fresh stores in a forked child (the parent's locks may be held by threads it does not have)."""
+    global _stores, _stores_lock
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def create_embeddings(llm_config: Dict[str, str], max_retries: Optional[int] = None,
+                      micro_batching: bool = False) -> Embeddings:
+    """
+    Create the OpenAI embeddings client used by ingestion and the agent.
+
+    Args:
+        llm_config: Configuration returned by config.get_llm_config()
+        max_retries: Client-side retries (None keeps the client default;
+            ingestion passes 0 and retries in its own embedding stage)
+        micro_batching: Coalesce concurrent query embeddings that miss the
+            cache into batched requests (see embedding_batcher.py)
+
+    Returns:
+        OpenAIEmbeddings, optionally micro-batched, wrapped in the
+        persistent cache when enabled
+    """
+    from langchain_openai import OpenAIEmbeddings
+    from http_clients import get_http_clients
+
+    options = {"max_retries": max_retries} if max_retries is not None else {}
+    if llm_config.get("base_url"):
+        options["base_url"] = llm_config["base_url"]
+    # Shares the process-wide connection pool with the LLM of the same provider
+    http_client, http_async_client = get_http_clients(llm_config.get("base_url"))
+    embeddings = OpenAIEmbeddings(
+        openai_api_key=llm_config["api_key"],
+        model=EMBEDDING_MODEL,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        check_embedding_ctx_length=EMBEDDING_CHECK_CTX_LENGTH,
+        **options
+    )
+    if micro_batching:
+        from embedding_batcher import MicroBatchingEmbeddings
+        embeddings = MicroBatchingEmbeddings(
+            embeddings,
+            window_ms=EMBEDDING_MICROBATCH_WINDOW_MS,
+            max_batch_size=EMBEDDING_MICROBATCH_MAX_SIZE
+        )
+    if not EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    return CachedEmbeddings(embeddings, get_embedding_store(EMBEDDING_MODEL, llm_config.get("base_url")))
@@ -0,0 +1,176 @@
+"""
+Concurrent, batched embedding stage for ingestion.
+
+Chunks are grouped into batches by token count, several batches are embedded
+concurrently (bounded by a semaphore), rate limits and server errors are
+retried with jittered exponential backoff, and each batch is handed to a sink
+(the vector store writer) as soon as it is embedded.
+"""
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from context_packer import count_tokens
+
+# Called with each embedded batch and its vectors, in completion order
+BatchSink = Callable[[List[Document], List[List[float]]], None]
+
+
+def batch_by_tokens(chunks: Iterable[Document], max_tokens: int, max_items: int,
+                    model: str = "",
+                    on_batch: Optional[Callable[[List[Document], int], None]] = None) -> Iterator[List[Document]]:
+    """
+    Group chunks into batches bounded by total tokens and number of chunks.
+
+    Args:
+        chunks: Chunks to embed (consumed lazily)
+        max_tokens: Maximum tokens per batch (a larger single chunk gets its
+            own batch)
+        max_items: Maximum chunks per batch
+        model: Embedding model name used to pick the tokenizer
+        on_batch: Called with each batch and its token count before it is
+            yielded (e.g. to total the tokens sent)
+
+    Yields:
+        Lists of chunks
+    """
+    batch: List[Document] = []
+    batch_tokens = 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk.page_content, model)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            if on_batch is not None:
+                on_batch(batch, batch_tokens)
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        if on_batch is not None:
+            on_batch(batch, batch_tokens)
+        yield batch
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate limits (429), server errors (5xx), timeouts and connection errors."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds requested by a Retry-After header, when the server sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class EmbeddingPipeline:
+    """Embeds chunk batches concurrently with retry and streams them to a sink."""
+
+    def __init__(self, embeddings: Embeddings, concurrency: int = 4, max_retries: int = 6,
+                 base_delay: float = 0.5, max_delay: float = 30.0):
+        """
+        Initialize the pipeline.
+
+        Args:
+            embeddings: Embeddings client (its own retries should be disabled)
+            concurrency: Maximum number of batches in flight
+            max_retries: Retries per batch before ingestion fails
+            base_delay: First backoff delay in seconds (doubles per attempt)
+            max_delay: Upper bound of a single backoff delay
+        """
+        self.embeddings = embeddings
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.requests = 0
+
+    async def _embed_batch(self, batch: List[Document]) -> List[List[float]]:
+        """Embed one batch, retrying transient failures with full-jitter backoff."""
+        texts = [chunk.page_content for chunk in batch]
+        for attempt in range(self.max_retries + 1):
+            self.requests += 1
+            try:
+                return await self.embeddings.aembed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                await asyncio.sleep(max(delay, _retry_after(e) or 0.0))
+        raise AssertionError("unreachable")
+
+    async def arun(self, batches: Iterable[List[Document]], sink: BatchSink) -> Dict[str, Any]:
+        """
+        Embed every batch and pass it to the sink as soon as it completes.
+
+        Batches are pulled from the iterable only when a slot frees up, so at
+        most `concurrency` batches are held in memory.
+
+        Args:
+            batches: Batches of chunks, e.g. from batch_by_tokens()
+            sink: Receives each batch with its vectors
+
+        Returns:
+            Stats: chunks, batches, requests (attempts, including retries),
+            retries, seconds and chunks_per_second
+        """
+        started = time.perf_counter()
+        self.retries = 0
+        self.requests = 0
+        chunks = 0
+        batch_count = 0
+        pending = set()
+        batch_iter = iter(batches)
+
+        async def embed(batch: List[Document]) -> Tuple[List[Document], List[List[float]]]:
+            return batch, await self._embed_batch(batch)
+
+        try:
+            while True:
+                while len(pending) < self.concurrency:
+                    batch = next(batch_iter, None)
+                    if batch is None:
+                        break
+                    pending.add(asyncio.ensure_future(embed(batch)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    batch, vectors = task.result()
+                    sink(batch, vectors)
+                    chunks += len(batch)
+                    batch_count += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+        seconds = time.perf_counter() - started
+        return {
+            "chunks": chunks,
+            "batches": batch_count,
+            "requests": self.requests,
+            "retries": self.retries,
+            "seconds": seconds,
+            "chunks_per_second": chunks / seconds if seconds > 0 else 0.0
+        }
+
+    def run(self, batches: Iterable[List[Document]], sink: BatchSink) -> Dict[str, Any]:
+        """Synchronous wrapper around arun()."""
+        return asyncio.run(self.arun(batches, sink))
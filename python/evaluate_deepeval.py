@@ -12,7 +12,7 @@ from deepeval.metrics import (
 )
 from deepeval.test_case import LLMTestCase
 from deepeval.dataset import EvaluationDataset
-from rag_agent import PetrobrasRAGAgent
+from agent_pool import get_agent
 from config import GOLDEN_SET_CSV, EVALUATION_METRICS, validate_config
 
 def load_golden_set() -> pd.DataFrame:
@@ -35,14 +35,18 @@ def create_test_cases(df: pd.DataFrame, split: str = "dev", max_cases: int = 10)
     print(f"📋 Creating {len(split_df)} test cases for split '{split}'")
     
     # Initialize RAG agent
-    agent = PetrobrasRAGAgent()
+    agent = get_agent()
     
     test_cases = []
     
-    for _, row in split_df.iterrows():
+    # Answer every question in one batch (deduplicated, shared embedding and
+    # retrieval calls, concurrent generation)
+    results = agent.query_batch(split_df["Pergunta"].tolist())
+    
+    for (_, row), result in zip(split_df.iterrows(), results):
         try:
-            # Get answer from RAG agent
-            result = agent.query(row["Pergunta"])
+            if result.get("error"):
+                raise RuntimeError(result["error"])
             actual_output = result["answer"]
             
             # Get retrieval context (simplified)
@@ -6,7 +6,7 @@ from typing import Dict, Any, List
 from langsmith import Client
 from langsmith.evaluation import evaluate
 from langsmith.schemas import Run, Example
-from rag_agent import PetrobrasRAGAgent
+from agent_pool import get_agent
 from config import GOLDEN_SET_CSV, LANGCHAIN_PROJECT, validate_config
 
 def load_golden_set() -> pd.DataFrame:
@@ -169,7 +169,7 @@ def run_evaluation(client: Client, dataset_id: str, split: str = "dev"):
     
     # Initialize RAG agent
     print("🤖 Initializing RAG agent...")
-    agent = PetrobrasRAGAgent()
+    agent = get_agent()
     
     def rag_function(inputs: Dict[str, Any]) -> Dict[str, Any]:
         """Wrapper function for RAG agent to work with LangSmith evaluation."""
@@ -0,0 +1,317 @@
+"""
+Structured fact index over the markdown tables of the reports.
+
+Most metric questions ("Qual foi o EBITDA Ajustado no 1T25?") are answered by
+a single table cell. At ingest time every table row is parsed into facts
+(metric, period, value, unit, section); at query time a question that names
+exactly one period and whose words are all explained by one metric (and
+optionally its section) is answered straight from the index, without
+retrieval or an LLM call. Anything ambiguous returns None so the agent falls
+back to the full RAG graph.
+"""
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from portuguese_text import tokenize
+
+HEADER_PREFIXES = (("### ", 3), ("## ", 2), ("# ", 1))
+
+# Column headers that are periods: quarters (1T25), dates (31.03.2025), years
+PERIOD_PATTERN = re.compile(r"^(?:[1-4]T\d{2}|\d{2}\.\d{2}\.\d{4}|(?:19|20)\d{2})$")
+# Periods written in questions: "1T25", "31/03/2025", "2024"
+QUESTION_PERIOD_PATTERN = re.compile(
+    r"\b([1-4])T(\d{2})\b|\b(\d{2})[/.](\d{2})[/.](\d{4})\b|\b((?:19|20)\d{2})\b",
+    re.IGNORECASE
+)
+NUMBER_PATTERN = re.compile(r"^(\()?(-)?(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d+))?(%)?(\))?$")
+# Parenthesized units in row labels, e.g. "(US$ milhões)", "(%)", "(x)", "(anos)"
+UNIT_PATTERN = re.compile(r"\(([^()]*(?:\$|%|milhões|anos|bbl|boe|MWh|MMBtu)[^()]*|x)\)")
+# Footnote markers, e.g. "(*)", "(**)", "(1)", "(3)(4)"
+FOOTNOTE_PATTERN = re.compile(r"\((?:\*+|\d+)\)")
+
+# Question words that never identify a metric
+GENERIC_WORDS = frozenset({
+    "qual", "quais", "foi", "foram", "era", "eram", "valor", "petrobras",
+    "companhia", "atribuivel", "registrado", "registrada"
+})
+
+
+def _cells(line: str) -> List[str]:
+    """Cells of a markdown table row, without bold markers."""
+    cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+    return [cell[2:-2].strip() if len(cell) > 4 and cell.startswith("**") and cell.endswith("**") else cell
+            for cell in cells]
+
+
+def parse_number(text: str) -> Optional[float]:
+    """Parse a pt-BR table number: "123.144" -> 123144, "(1.197)" -> -1197, "6,5%" -> 6.5."""
+    match = NUMBER_PATTERN.match(text.replace(" ", ""))
+    if match is None:
+        return None
+    opening, minus, integer, decimals, _, closing = match.groups()
+    if bool(opening) != bool(closing):
+        return None
+    value = float(integer.replace(".", "") + ("." + decimals if decimals else ""))
+    return -value if opening or minus else value
+
+
+def split_label(label: str) -> Tuple[str, Optional[str]]:
+    """Split a row label into the metric name and its parenthesized unit, if any."""
+    unit_match = UNIT_PATTERN.search(label)
+    unit = unit_match.group(1).strip() if unit_match else None
+    metric = UNIT_PATTERN.sub("", label) if unit_match else label
+    metric = FOOTNOTE_PATTERN.sub("", metric)
+    metric = re.sub(r"\s+", " ", metric).strip(" -:")
+    return metric, unit
+
+
+def _table_unit(label: str) -> Optional[str]:
+    """Unit named in a table's corner cell, e.g. "ATIVO - R$ milhões" -> "R$ milhões"."""
+    match = re.search(r"(R\$|US\$)\s*(milhões|bilhões|mil)", label)
+    return f"{match.group(1)} {match.group(2)}" if match else None
+
+
+def question_periods(question: str) -> List[Tuple[str, Tuple[int, int]]]:
+    """Periods named in a question, normalized to the table header format, with their spans."""
+    periods = []
+    for match in QUESTION_PERIOD_PATTERN.finditer(question):
+        quarter, year, day, month, full_year, plain_year = match.groups()
+        if quarter:
+            period = f"{quarter}T{year}"
+        elif day:
+            period = f"{day}.{month}.{full_year}"
+        else:
+            period = plain_year
+        periods.append((period, match.span()))
+    return periods
+
+
+def _terms(text: str) -> Set[str]:
+    """Content tokens of a metric, section or question."""
+    return set(tokenize(text)) - GENERIC_WORDS
+
+
+def iter_table_facts(lines: Iterable[str], metadata: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Parse the facts of every markdown table in a report.
+
+    Args:
+        lines: Report lines (e.g. an open file)
+        metadata: Report metadata; source and report_name are copied to facts
+
+    Yields:
+        Facts with metric, period, value, raw text, unit (None when the table
+        does not say), section (header path) and report fields
+    """
+    headers: Dict[int, str] = {}
+    periods: Dict[int, str] = {}
+    unit: Optional[str] = None
+    for line in lines:
+        stripped = line.strip()
+        for prefix, level in HEADER_PREFIXES:
+            if stripped.startswith(prefix):
+                headers = {lvl: text for lvl, text in headers.items() if lvl < level}
+                headers[level] = stripped[len(prefix):].strip()
+                break
+
+        if not stripped.startswith("|"):
+            periods, unit = {}, None
+            continue
+
+        cells = _cells(stripped)
+        label, values = cells[0], cells[1:]
+        header_periods = {i: cell for i, cell in enumerate(values) if PERIOD_PATTERN.match(cell)}
+        if header_periods:
+            periods, unit = header_periods, _table_unit(label)
+            continue
+        if not label or not periods:
+            continue
+        if not any(values):
+            # Sub-header such as "R$ milhões |  |  |" switches the unit
+            unit = _table_unit(label) or unit
+            continue
+
+        metric, row_unit = split_label(label)
+        for i, period in periods.items():
+            raw = values[i] if i < len(values) else ""
+            value = parse_number(raw)
+            if value is None or not metric:
+                continue
+            fact_unit = row_unit or unit
+            if raw.endswith("%"):
+                fact_unit = "%"
+            elif row_unit is None and unit and "," in raw:
+                # Ratios and prices inside a "R$ milhões" table (e.g. the
+                # exchange rate) carry no unit of their own
+                fact_unit = None
+            yield {
+                "metric": metric,
+                "period": period,
+                "value": value,
+                "raw": raw.strip("()%"),
+                "unit": fact_unit,
+                "section": [headers[level] for level in sorted(headers)],
+                "source": metadata.get("source", ""),
+                "report_name": metadata.get("report_name", "")
+            }
+
+
+def _format_number(value: float, decimals: int) -> str:
+    """pt-BR number formatting: 62281.0 -> "62.281", 62.281 -> "62,281"."""
+    text = f"{value:,.{decimals}f}"
+    return text.replace(",", "\x00").replace(".", ",").replace("\x00", ".")
+
+
+def format_value(fact: Dict[str, Any]) -> str:
+    """Human-readable value, e.g. "R$ 62,281 bilhões", "5%", "US$ 75,66/bbl"."""
+    unit = fact["unit"]
+    value = fact["value"]
+    sign = " (negativo)" if value < 0 else ""
+    if unit and unit.endswith("milhões"):
+        currency = unit.split()[0]
+        if abs(value) >= 1000:
+            return f"{currency} {_format_number(abs(value) / 1000, 3)} bilhões{sign}"
+        return f"{currency} {fact['raw']} milhões{sign}"
+    if unit == "%":
+        return f"{'-' if value < 0 else ''}{fact['raw']}%"
+    if unit == "x":
+        return f"{fact['raw']}x"
+    if unit and "$/" in unit:
+        currency, per = unit.split("/", 1)
+        return f"{currency.strip()} {'-' if value < 0 else ''}{fact['raw']}/{per.strip()}"
+    return f"{'-' if value < 0 else ''}{fact['raw']} {unit}"
+
+
+def display_period(period: str) -> str:
+    """Period as written in answers: "31.03.2025" -> "31/03/2025"."""
+    return period.replace(".", "/")
+
+
+class FactIndex:
+    """Table facts indexed by period for millisecond metric lookups."""
+
+    def __init__(self, facts: List[Dict[str, Any]]):
+        """Create an index from fact records (use build() or load())."""
+        self.facts = facts
+        self.by_period: Dict[str, List[Tuple[int, Set[str], Set[str]]]] = {}
+        for position, fact in enumerate(facts):
+            self.by_period.setdefault(fact["period"], []).append(
+                (position, _terms(fact["metric"]), _terms(" ".join(fact["section"])))
+            )
+
+    def __len__(self) -> int:
+        return len(self.facts)
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[Path, Dict[str, Any]]]) -> "FactIndex":
+        """
+        Build the index from markdown/text reports.
+
+        Args:
+            documents: (file path, report metadata) pairs; PDFs are skipped
+                since their extracted text has no markdown tables (ingest.py
+                keeps the .txt copy of a report shipped in both formats)
+        """
+        facts: List[Dict[str, Any]] = []
+        for file_path, metadata in documents:
+            if Path(file_path).suffix.lower() == ".pdf":
+                continue
+            with open(file_path, "r", encoding="utf-8") as f:
+                facts.extend(iter_table_facts(f, metadata))
+        return cls(facts)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Write the facts to a JSON file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.facts, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "FactIndex":
+        """Load an index written by save()."""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the single fact a question asks for.
+
+        The question must name exactly one period, and every content word
+        must belong to the metric or its section. The most specific metric
+        wins (then the best section match); breakdowns of the metric by
+        sibling sections the question does not name (business segments) are
+        ignored; and the remaining facts must agree on value and unit.
+
+        Returns:
+            The fact (the first one in document order), or None when the
+            question is not a confident single-metric lookup
+        """
+        periods = question_periods(question)
+        if len({period for period, _ in periods}) != 1:
+            return None
+        period = periods[0][0]
+        for _, (start, end) in reversed(periods):
+            question = question[:start] + " " + question[end:]
+        question_terms = _terms(question)
+        if not question_terms:
+            return None
+
+        best_score = None
+        group: List[Tuple[int, int]] = []
+        for position, metric_terms, section_terms in self.by_period.get(period, []):
+            if not metric_terms or not metric_terms <= question_terms:
+                continue
+            section_matches = section_terms & question_terms
+            if not question_terms <= metric_terms | section_matches:
+                continue
+            score = (len(metric_terms), len(section_matches))
+            if best_score is None or score > best_score:
+                best_score, group = score, []
+            if score == best_score:
+                group.append((position, len(section_matches)))
+        if not group:
+            return None
+
+        facts = [self.facts[position] for position, _ in group]
+        if best_score[1] == 0:
+            # Different values for the metric in sibling sections (e.g. one
+            # per business segment) the question names none of: a breakdown,
+            # not what was asked
+            siblings: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+            for fact in facts:
+                siblings.setdefault(tuple(fact["section"][:-1]), []).append(fact)
+            facts = [
+                fact for group_facts in siblings.values()
+                if len({tuple(f["section"]) for f in group_facts}) < 2
+                or len({(f["value"], f["unit"]) for f in group_facts}) == 1
+                for fact in group_facts
+            ]
+            facts.sort(key=self.facts.index)
+
+        answers = {(fact["value"], fact["unit"]) for fact in facts}
+        if len(answers) != 1 or facts[0]["unit"] is None:
+            return None
+        return facts[0]
+
+
+def format_answer(fact: Dict[str, Any], report_name: str) -> str:
+    """
+    Answer text for a fact, in the agent's output format.
+
+    Args:
+        fact: Fact returned by FactIndex.lookup()
+        report_name: Report name used in the citation
+    """
+    period = display_period(fact["period"])
+    section = fact["section"][-1] if fact["section"] else report_name
+    return (
+        f"**RESPOSTA:**\n"
+        f"{fact['metric']} ({period}): {format_value(fact)} "
+        f"**[{report_name}, Seção: {section}]**\n\n"
+        f"**FONTES:**\n- {report_name}\n\n"
+        f"**CONFIANÇA:** alta\n\n"
+        f"**PERÍODO DE REFERÊNCIA:** {period}"
+    )
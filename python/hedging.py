@@ -0,0 +1,316 @@
+"""
+Per-query deadlines and hedged LLM requests.
+
+Every query gets a deadline (QUERY_TIMEOUT_SECONDS after it starts) that
+travels in the graph state. The retrieve and generate nodes stop waiting once
+it has passed and report a timeout, instead of letting one slow completion
+block query() indefinitely.
+
+Hedging cuts the latency tail of generation. HedgedRunner tracks how long
+primary completions take; when one is still running after the HEDGE_PERCENTILE
+(p95 by default) of recent latencies, the same prompt is sent to the hedge
+model or provider and whichever answer arrives first is used. A primary call
+that fails early is hedged right away. stats() counts hedges fired and won.
+
+Blocking calls run in a shared pool of DEADLINE_WORKERS threads, so the
+caller can stop waiting at the deadline. A call abandoned that way keeps its
+thread until its own request timeout; when every worker is busy, new calls
+queue behind them. worker_stats() reports how busy the pool is.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from config import DEADLINE_WORKERS
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """A query ran past its deadline."""
+
+
+def time_left(deadline: float, stage: str) -> Optional[float]:
+    """
+    Seconds left before a deadline.
+
+    Args:
+        deadline: time.monotonic() value, or 0.0 for no deadline
+        stage: Name of the step about to run, for the error message
+
+    Returns:
+        Seconds left, or None without a deadline
+
+    Raises:
+        DeadlineExceeded: The deadline has already passed
+    """
+    if not deadline:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded(f"Query deadline exceeded before {stage}")
+    return left
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Calls submitted and not finished, calls running on a worker, calls that
+# had to wait for a worker, and calls whose caller gave up at the deadline
+_workers: Counter = Counter()
+
+
+def _submit(fn: Callable[[], T]) -> "Future[T]":
+    """Run fn in the shared worker pool, in a copy of the caller's context (tracing callbacks)."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(DEADLINE_WORKERS, thread_name_prefix="deadline-call")
+    context = contextvars.copy_context()
+
+    def run() -> T:
+        with _executor_lock:
+            _workers["running"] += 1
+        try:
+            return context.run(fn)
+        finally:
+            with _executor_lock:
+                _workers["running"] -= 1
+                _workers["in_flight"] -= 1
+
+    with _executor_lock:
+        if _workers["in_flight"] >= DEADLINE_WORKERS:
+            _workers["queued_total"] += 1
+        _workers["in_flight"] += 1
+    return _executor.submit(run)
+
+
+def worker_stats() -> Dict[str, Any]:
+    """
+    Saturation of the deadline worker pool.
+
+    Returns:
+        max_workers, busy (calls running now, including abandoned ones),
+        queued (calls waiting for a worker now), queued_total (calls that
+        ever had to wait) and abandoned_total (calls given up at a deadline)
+    """
+    with _executor_lock:
+        in_flight, running = _workers["in_flight"], _workers["running"]
+        return {
+            "max_workers": DEADLINE_WORKERS,
+            "busy": running,
+            "queued": max(in_flight - running, 0),
+            "queued_total": _workers["queued_total"],
+            "abandoned_total": _workers["abandoned_total"]
+        }
+
+
+def _abandon(future: Future) -> None:
+    """Stop waiting for a call; a call that has not started yet is dropped."""
+    with _executor_lock:
+        if future.cancel():
+            _workers["in_flight"] -= 1
+        elif not future.done():
+            _workers["abandoned_total"] += 1
+
+
+def call_with_timeout(fn: Callable[[], T], timeout: Optional[float], stage: str) -> T:
+    """
+    Run a blocking call, but stop waiting for it after timeout seconds.
+
+    The abandoned call finishes in the background (bounded by its own
+    request timeout) and holds a worker until then.
+
+    Raises:
+        DeadlineExceeded: fn did not finish in time
+    """
+    if timeout is None:
+        return fn()
+    future = _submit(fn)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        _abandon(future)
+        raise DeadlineExceeded(f"Query deadline exceeded during {stage}") from None
+
+
+async def await_with_timeout(awaitable: Awaitable[T], timeout: Optional[float], stage: str) -> T:
+    """Async version of call_with_timeout(); the awaitable is cancelled at the deadline."""
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"Query deadline exceeded during {stage}") from None
+
+
+class HedgedRunner:
+    """Runs a primary call and, when it is slow or fails, a hedge call; the first answer wins."""
+
+    def __init__(self, percentile: float = 95.0, initial_delay: float = 2.0, min_samples: int = 20,
+                 window: int = 500):
+        """
+        Args:
+            percentile: Latency percentile of recent primary calls after which a hedge is sent
+            initial_delay: Hedge delay until min_samples latencies were observed
+            min_samples: Latencies needed before the percentile is used
+            window: Number of recent latencies kept
+        """
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._latencies: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._counters: Counter = Counter()
+
+    def delay(self) -> float:
+        """Seconds a primary call may run before it is hedged."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))]
+
+    def _record(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _hedge_wait(self, deadline: Optional[float]) -> float:
+        """Seconds to wait for the primary call before hedging (never past the deadline)."""
+        delay = self.delay()
+        return delay if deadline is None else max(min(delay, deadline - time.monotonic()), 0)
+
+    @staticmethod
+    def _time_left(deadline: Optional[float]) -> Optional[float]:
+        """Seconds to wait for either call (None without a deadline)."""
+        if deadline is None:
+            return None
+        if deadline <= time.monotonic():
+            raise DeadlineExceeded("Query deadline exceeded during generate")
+        return deadline - time.monotonic()
+
+    def invoke(self, primary: Callable[[], T], hedge: Callable[[], T], timeout: Optional[float] = None) -> T:
+        """
+        Run primary(), hedged with hedge() when it is slow or fails.
+
+        Args:
+            primary: Blocking call to the primary model
+            hedge: The same request to the hedge model
+            timeout: Seconds until the query deadline (None for no deadline)
+
+        Returns:
+            The first successful answer
+
+        Raises:
+            DeadlineExceeded: No answer before the deadline
+            Exception: The primary call's error when both calls failed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        started = time.monotonic()
+        self._count("calls")
+        primary_future = _submit(primary)
+        # Slow primaries are still measured once they finish, so the
+        # percentile is not biased towards the fast calls
+        primary_future.add_done_callback(
+            lambda future: future.exception() is None and self._record(time.monotonic() - started)
+        )
+        wait([primary_future], timeout=self._hedge_wait(deadline))
+        if primary_future.done() and primary_future.exception() is None:
+            return primary_future.result()
+
+        pending = {primary_future}
+        try:
+            self._time_left(deadline)
+            self._count("hedges_fired")
+            hedge_future = _submit(hedge)
+            pending.add(hedge_future)
+            while pending:
+                done, pending = wait(pending, timeout=self._time_left(deadline), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded("Query deadline exceeded during generate")
+                for future in (primary_future, hedge_future):
+                    if future in done and future.exception() is None:
+                        if future is hedge_future:
+                            self._count("hedges_won")
+                        return future.result()
+            raise primary_future.exception()
+        except DeadlineExceeded:
+            for future in pending:
+                _abandon(future)
+            raise
+
+    async def ainvoke(self, primary: Callable[[], Awaitable[T]], hedge: Callable[[], Awaitable[T]],
+                      timeout: Optional[float] = None) -> T:
+        """Async version of invoke(); the losing request is cancelled."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        started = time.monotonic()
+        self._count("calls")
+        primary_task = asyncio.ensure_future(primary())
+        hedge_task: Optional[asyncio.Future] = None
+        try:
+            await asyncio.wait({primary_task}, timeout=self._hedge_wait(deadline))
+            if primary_task.done() and primary_task.exception() is None:
+                self._record(time.monotonic() - started)
+                return primary_task.result()
+
+            self._time_left(deadline)
+            self._count("hedges_fired")
+            hedge_task = asyncio.ensure_future(hedge())
+            pending = {primary_task, hedge_task}
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=self._time_left(deadline), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise DeadlineExceeded("Query deadline exceeded during generate")
+                for task in (primary_task, hedge_task):
+                    if task in done and task.exception() is None:
+                        if task is hedge_task:
+                            self._count("hedges_won")
+                        else:
+                            self._record(time.monotonic() - started)
+                        return task.result()
+            raise primary_task.exception()
+        finally:
+            if not primary_task.done():
+                # The primary lost the race: its latency is at least this long
+                self._record(time.monotonic() - started)
+            for task in (primary_task, hedge_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls, hedges fired and won, hedge rate, the current hedge delay and worker_stats()."""
+        delay = self.delay()
+        with self._lock:
+            calls, fired, won = (self._counters[name] for name in ("calls", "hedges_fired", "hedges_won"))
+        return {
+            "calls": calls,
+            "hedges_fired": fired,
+            "hedges_won": won,
+            "hedge_rate": fired / calls if calls else 0.0,
+            "delay_seconds": delay,
+            "workers": worker_stats()
+        }
+
+
+def _reset_after_fork() -> None:
+    """Worker threads do not survive fork(); the child starts its own pool."""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _workers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
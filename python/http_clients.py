@@ -0,0 +1,247 @@
+"""
+Process-wide pooled HTTP clients for the LLM and embeddings APIs.
+
+Left alone, every ChatOpenAI and OpenAIEmbeddings builds its own httpx
+client, so each agent (and each ingestion run) opens its own connections and
+pays its own TCP and TLS handshakes. get_http_clients() instead hands out one
+keep-alive httpx.Client and one httpx.AsyncClient per provider base URL,
+shared by the LLM and the embeddings of every agent in the process. Pool
+sizes come from HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS and
+HTTP_KEEPALIVE_EXPIRY_SECONDS; HTTP2_ENABLED negotiates HTTP/2 when the h2
+package is installed (the "http2" extra).
+
+Async connections belong to the event loop that opened them, so the shared
+async client keeps one connection pool per running event loop. Both clients
+count requests and newly opened connections; http_client_stats() reports how
+often a pooled connection was reused.
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    HTTP2_ENABLED
+)
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+# Same as the OpenAI SDK default; per-request timeouts still override it
+_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+# httpcore trace event emitted once per newly opened connection
+_CONNECT_EVENT = "connection.connect_tcp.complete"
+
+
+class _PoolStats:
+    """Request and connection counters of one base URL (sync and async clients together)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def count_connection(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def snapshot(self) -> Tuple[int, int]:
+        with self._lock:
+            return self.requests, self.connections
+
+
+class _CountingTransport(httpx.BaseTransport):
+    """Sync transport that counts requests and the connections opened for them."""
+
+    def __init__(self, transport: httpx.BaseTransport, stats: _PoolStats):
+        self.transport = transport
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.count_request()
+        previous = request.extensions.get("trace")
+
+        def trace(name: str, info: Dict[str, Any]) -> None:
+            if name == _CONNECT_EVENT:
+                self.stats.count_connection()
+            if previous is not None:
+                previous(name, info)
+
+        request.extensions["trace"] = trace
+        return self.transport.handle_request(request)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class _LoopLocalTransport(httpx.AsyncBaseTransport):
+    """Async transport with one connection pool per event loop, counting like _CountingTransport."""
+
+    def __init__(self, factory: Callable[[], httpx.AsyncBaseTransport], stats: _PoolStats):
+        self.factory = factory
+        self.stats = stats
+        self._transports: Dict[asyncio.AbstractEventLoop, httpx.AsyncBaseTransport] = {}
+        self._lock = threading.Lock()
+
+    def _transport(self) -> httpx.AsyncBaseTransport:
+        """Pool of the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                # Pools of closed loops (e.g. finished asyncio.run() calls) can
+                # no longer be used or closed cleanly; drop them
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = self._transports[loop] = self.factory()
+        return transport
+
+    @property
+    def event_loops(self) -> int:
+        with self._lock:
+            return sum(1 for loop in self._transports if not loop.is_closed())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.stats.count_request()
+        previous = request.extensions.get("trace")
+
+        async def trace(name: str, info: Dict[str, Any]) -> None:
+            if name == _CONNECT_EVENT:
+                self.stats.count_connection()
+            if previous is not None:
+                await previous(name, info)
+
+        request.extensions["trace"] = trace
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Close the pool of the running loop; the others are dropped."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transports, self._transports = self._transports, {}
+        if loop in transports:
+            await transports[loop].aclose()
+
+
+class _ClientPool:
+    """The shared sync and async clients of one base URL."""
+
+    def __init__(self, http2: bool):
+        self.http2 = http2
+        self.stats = _PoolStats()
+        self.sync_client = httpx.Client(
+            transport=_CountingTransport(httpx.HTTPTransport(limits=_limits(), http2=http2), self.stats),
+            timeout=_TIMEOUT,
+            follow_redirects=True
+        )
+        self.async_transport = _LoopLocalTransport(
+            lambda: httpx.AsyncHTTPTransport(limits=_limits(), http2=http2),
+            self.stats
+        )
+        self.async_client = httpx.AsyncClient(transport=self.async_transport, timeout=_TIMEOUT, follow_redirects=True)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+def _http2_available() -> bool:
+    """Whether the h2 package httpx needs for HTTP/2 is installed."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+_pools: Dict[str, _ClientPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_http_clients(base_url: Optional[str] = None) -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    Return the process-wide HTTP clients for a provider.
+
+    Args:
+        base_url: API base URL (None for the OpenAI API)
+
+    Returns:
+        (sync client, async client), to pass as http_client and
+        http_async_client to ChatOpenAI / OpenAIEmbeddings
+    """
+    base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
+    with _pools_lock:
+        if base_url not in _pools:
+            http2 = HTTP2_ENABLED
+            if http2 and not _http2_available():
+                print("⚠️ HTTP2_ENABLED is set but the h2 package is missing; using HTTP/1.1 (install the 'http2' extra)")
+                http2 = False
+            _pools[base_url] = _ClientPool(http2)
+        pool = _pools[base_url]
+    return pool.sync_client, pool.async_client
+
+
+def http_client_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Connection reuse of the shared clients.
+
+    Returns:
+        Per base URL: requests, connections_opened, reused (requests served
+        on an already open connection), reuse_ratio, http2 and the number of
+        event loops with an async pool
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    stats = {}
+    for base_url, pool in pools.items():
+        requests, connections = pool.stats.snapshot()
+        reused = max(requests - connections, 0)
+        stats[base_url] = {
+            "requests": requests,
+            "connections_opened": connections,
+            "reused": reused,
+            "reuse_ratio": reused / requests if requests else 0.0,
+            "http2": pool.http2,
+            "event_loops": pool.async_transport.event_loops
+        }
+    return stats
+
+
+def close_http_clients() -> None:
+    """
+    Close the sync clients and drop every pool; the next get_http_clients() starts fresh.
+
+    Async pools are tied to their event loops and are released with them.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.sync_client.close()
+
+
+def _reset_after_fork() -> None:
+    """
+    Forget the parent's pools in a forked child.
+
+    Their sockets are shared with the parent, so they are dropped without
+    being closed; the child opens its own connections.
+    """
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,146 +1,1000 @@
 """
 Document ingestion script for RAG evaluation demo.
 Loads Petrobras reports into Chroma DB for vector search.
+
+Ingestion is incremental: every chunk gets a stable ID from its source,
+header path and position within that section, plus a hash of its content.
+Re-running only embeds and upserts new or changed chunks and deletes chunks
+that no longer exist.
+
+The reports are split once per run (spool_corpus()); one pass over the
+chunks then feeds the vector store and the BM25 index.
+
+Each run builds a complete new index version in a snapshot directory, starting
+from a copy of the published one, and publishes it with an atomic pointer
+swap (see snapshots.py), so agents serving queries never see a half-written
+index.
 """
+import argparse
+import cProfile
+import hashlib
+import itertools
+import json
 import os
+import pstats
+import shutil
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from langchain_text_splitters import MarkdownHeaderTextSplitter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from embedding_cache import create_embeddings
+from embedding_pipeline import BatchSink, EmbeddingPipeline, batch_by_tokens
+from vector_index import NumpyIndexWriter, NumpyVectorStore
+from lexical_index import LexicalIndex, LexicalIndexBuilder
+from portuguese_text import fold_accents
+from fact_index import FactIndex
+from dedup import DedupPlan, find_duplicate_documents, find_near_duplicates
+from ingest_profile import IngestProfile, print_report, save_report, stage, timed
+from snapshots import SnapshotStore, index_paths
+import pdf_loader
 from config import (
     CHROMA_DB_PATH, 
-    RELATORIO_FINANCEIRO, 
-    RELATORIO_ADMINISTRACAO,
+    NUMPY_INDEX_PATH,
+    LEXICAL_INDEX_PATH,
+    FACT_INDEX_PATH,
+    INDEX_SNAPSHOTS_DIR,
+    SNAPSHOT_GC_GRACE_SECONDS,
+    VECTOR_BACKEND,
+    EMBEDDING_MODEL,
+    EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    DATASETS_DIR,
+    INGEST_MANIFEST,
+    INGEST_PATTERNS,
+    INGEST_WORKERS,
+    INGEST_PROFILE_PATH,
+    DEDUP_ENABLED,
+    DEDUP_THRESHOLD,
+    DEDUP_NUM_PERM,
+    DEDUP_DOCUMENT_THRESHOLD,
+    PDF_TEXT_CACHE_DIR,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
     get_llm_config,
     validate_config
 )
 
-def load_document(file_path: Path, source_name: str) -> str:
-    """Load document from file."""
+# Report type derived from keywords in the (accent-folded) file name
+TYPE_KEYWORDS = [
+    ("financeiro", "financial"),
+    ("desempenho", "financial"),
+    ("administracao", "administrative"),
+]
+
+HEADERS_TO_SPLIT_ON = [
+    ("###", "Header 3"),
+    ("##", "Header 2"),
+    ("#", "Header 1"),
+]
+
+def _split_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Yield lines like str.split("\\n"), including the empty line after a final newline."""
+    last = "\n"
+    for line in lines:
+        yield line.rstrip("\n")
+        last = line
+    if last.endswith("\n"):
+        yield ""
+
+def iter_markdown_sections(lines: Iterable[str], metadata: Dict[str, Any]) -> Iterator[Document]:
+    """
+    Split markdown into header sections while reading it line by line.
+    
+    Streaming equivalent of MarkdownHeaderTextSplitter(strip_headers=False)
+    with "#", "##" and "###" headers: yields the same Documents, but only
+    one section is held in memory at a time.
+    
+    Args:
+        lines: Lines of the markdown file
+        metadata: Metadata added to every section (e.g. source)
+    
+    Yields:
+        One Document per section, with "Header 1/2/3" metadata
+    """
+    header_stack: List[Tuple[int, str]] = []
+    headers: Dict[str, str] = {}
+    current_headers: Dict[str, str] = {}
+    current_content: List[str] = []
+    in_code_block = False
+    opening_fence = ""
+    pending: Optional[Dict[str, Any]] = None
+    
+    def aggregate(block: Dict[str, Any]) -> Optional[Document]:
+        """Merge a block into the pending section; return the section it closes."""
+        nonlocal pending
+        if pending is not None and pending["headers"] == block["headers"]:
+            pending["content"] += "  \n" + block["content"]
+            return None
+        if (pending is not None
+                and len(pending["headers"]) < len(block["headers"])
+                and pending["content"].split("\n")[-1][0] == "#"):
+            # A header with no content of its own joins its first subsection
+            pending["content"] += "  \n" + block["content"]
+            pending["headers"] = block["headers"]
+            return None
+        closed, pending = pending, block
+        if closed is None:
+            return None
+        return Document(page_content=closed["content"], metadata={**closed["headers"], **metadata})
+    
+    def flush() -> Optional[Document]:
+        """Close the current block of lines."""
+        block = {"content": "\n".join(current_content), "headers": current_headers.copy()}
+        current_content.clear()
+        return aggregate(block)
+    
+    for line in _split_lines(lines):
+        stripped = "".join(filter(str.isprintable, line.strip()))
+        if not in_code_block:
+            if stripped.startswith("```") and stripped.count("```") == 1:
+                in_code_block, opening_fence = True, "```"
+            elif stripped.startswith("~~~"):
+                in_code_block, opening_fence = True, "~~~"
+        elif stripped.startswith(opening_fence):
+            in_code_block, opening_fence = False, ""
+        
+        if in_code_block:
+            current_content.append(stripped)
+            continue
+        
+        for sep, name in HEADERS_TO_SPLIT_ON:
+            if stripped.startswith(sep) and (len(stripped) == len(sep) or stripped[len(sep)] == " "):
+                level = len(sep)
+                while header_stack and header_stack[-1][0] >= level:
+                    headers.pop(header_stack.pop()[1], None)
+                header_stack.append((level, name))
+                headers[name] = stripped[len(sep):].strip()
+                if current_content:
+                    section = flush()
+                    if section is not None:
+                        yield section
+                current_content.append(stripped)
+                break
+        else:
+            if stripped:
+                current_content.append(stripped)
+            elif current_content:
+                section = flush()
+                if section is not None:
+                    yield section
+        current_headers = headers.copy()
+    
+    if current_content:
+        section = flush()
+        if section is not None:
+            yield section
+    if pending is not None:
+        yield Document(page_content=pending["content"], metadata={**pending["headers"], **metadata})
+
+def iter_source_chunks(file_path: Path, source_name: str, metadata: Dict[str, Any],
+                       text_splitter: RecursiveCharacterTextSplitter,
+                       profile: Optional[IngestProfile] = None) -> Iterator[Document]:
+    """Stream the chunks of one report, reading the file line by line."""
+    characters = 0
+    chunk_count = 0
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        print(f"✅ Loaded {source_name}: {len(content)} characters")
-        return content
+            sections = iter_markdown_sections(timed(profile, "read", f), metadata)
+            for section in timed(profile, "header_split", sections):
+                characters += len(section.page_content)
+                with stage(profile, "text_split"):
+                    chunks = text_splitter.split_documents([section])
+                for chunk in chunks:
+                    chunk_count += 1
+                    yield chunk
     except Exception as e:
         print(f"❌ Error loading {source_name}: {e}")
         raise
+    print(f"✅ Loaded {source_name}: {characters} characters, {chunk_count} chunks")
 
-def create_documents():
-    """Create document chunks from source files."""
-    print("📄 Loading documents...")
+def iter_pdf_chunks(file_path: Path, source_name: str, metadata: Dict[str, Any],
+                    text_splitter: RecursiveCharacterTextSplitter,
+                    profile: Optional[IngestProfile] = None) -> Iterator[Document]:
+    """
+    Stream the chunks of a PDF report page by page.
     
-    # Load financial report
-    financial_content = load_document(RELATORIO_FINANCEIRO, "Financial Report")
+    Page texts come from the PDF text cache (filled by prepare_pdfs()), and
+    every chunk gets the 1-based number of the page it came from.
+    """
+    with stage(profile, "read"):
+        pages, _ = pdf_loader.load_pdf_pages(file_path, PDF_TEXT_CACHE_DIR)
+    characters = 0
+    chunk_count = 0
+    for page_number, text in enumerate(pages, start=1):
+        if not text.strip():
+            continue
+        characters += len(text)
+        with stage(profile, "text_split"):
+            chunks = text_splitter.create_documents([text], [{**metadata, "page": page_number}])
+        for chunk in chunks:
+            chunk_count += 1
+            yield chunk
+    print(f"✅ Loaded {source_name}: {characters} characters, {len(pages)} pages, {chunk_count} chunks")
+
+def iter_document_chunks(file_path: Path, metadata: Dict[str, Any],
+                         text_splitter: RecursiveCharacterTextSplitter,
+                         profile: Optional[IngestProfile] = None) -> Iterator[Document]:
+    """Stream the chunks of a report, PDF or markdown/text."""
+    if file_path.suffix.lower() == ".pdf":
+        return iter_pdf_chunks(file_path, metadata["report_name"], metadata, text_splitter, profile)
+    return iter_source_chunks(file_path, metadata["report_name"], metadata, text_splitter, profile)
+
+def prepare_pdfs(documents: List[Tuple[Path, Dict[str, Any]]],
+                 workers: int = INGEST_WORKERS,
+                 dedup: bool = DEDUP_ENABLED) -> List[Tuple[Path, Dict[str, Any]]]:
+    """
+    Extract the text of PDF reports that are not in the text cache yet.
     
-    # Load administration report  
-    admin_content = load_document(RELATORIO_ADMINISTRACAO, "Administration Report")
+    Pages of each PDF are extracted in parallel in this process, before the
+    reports are split, so splitting workers only read the cache.
     
-    # Split documents into chunks
-    print("✂️ Splitting documents into chunks...")
-    headers_to_split_on = [
-        ("#", "Header 1"),
-        ("##", "Header 2"),
-        ("###", "Header 3"),
-    ]
-    markdown_splitter = MarkdownHeaderTextSplitter(
-        headers_to_split_on=headers_to_split_on, strip_headers=False
+    Args:
+        documents: Reports from discover_documents()
+        workers: Worker processes used to extract pages
+        dedup: Also drop PDFs that are another copy of a markdown/text report
+            (see drop_duplicate_reports())
+    
+    Returns:
+        The documents, without PDFs when pypdf is not installed
+    """
+    pdfs = [file_path for file_path, _ in documents if file_path.suffix.lower() == ".pdf"]
+    if not pdfs:
+        return documents
+    if not pdf_loader.is_available():
+        print(f"⚠️ pypdf not installed, skipping {len(pdfs)} PDF reports (uv sync --extra pdf)")
+        return [(file_path, metadata) for file_path, metadata in documents if file_path.suffix.lower() != ".pdf"]
+    for file_path in pdfs:
+        pdf_loader.load_pdf_pages(file_path, PDF_TEXT_CACHE_DIR, workers)
+    return drop_duplicate_reports(documents) if dedup else documents
+
+def drop_duplicate_reports(documents: List[Tuple[Path, Dict[str, Any]]],
+                           threshold: float = DEDUP_DOCUMENT_THRESHOLD) -> List[Tuple[Path, Dict[str, Any]]]:
+    """
+    Drop PDF reports that are another copy of a markdown/text report.
+    
+    datasets/ ships the original PDFs next to their .txt conversions (under
+    other file names), and ingesting both would index every report twice.
+    The text version is kept: its markdown headers and tables give better
+    chunks, and the fact index only reads markdown tables. PDF text must be
+    in the cache (see prepare_pdfs()).
+    
+    Returns:
+        The documents without the duplicate PDFs
+    """
+    pdfs = {str(file_path): file_path for file_path, _ in documents if file_path.suffix.lower() == ".pdf"}
+    texts = {str(file_path): file_path for file_path, _ in documents if file_path.suffix.lower() != ".pdf"}
+    if not pdfs or not texts:
+        return documents
+    duplicates = find_duplicate_documents(
+        {key: "\n".join(pdf_loader.load_pdf_pages(path, PDF_TEXT_CACHE_DIR)[0]) for key, path in pdfs.items()},
+        {key: path.read_text(encoding="utf-8") for key, path in texts.items()},
+        threshold
     )
+    for key, (original, score) in duplicates.items():
+        print(f"🧹 Skipping {pdfs[key].name}: same report as {texts[original].name} ({score:.0%} overlap)")
+    return [(file_path, metadata) for file_path, metadata in documents if str(file_path) not in duplicates]
+
+def _first_title(file_path: Path) -> Optional[str]:
+    """Text of the first "# " header of a markdown file, if any."""
+    if file_path.suffix.lower() == ".pdf":
+        return None
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith("# "):
+                return line[2:].strip()
+    return None
+
+def document_metadata(file_path: Path, root: Path, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Derive the metadata added to every chunk of a file.
+    
+    Args:
+        file_path: Report file
+        root: Datasets directory; "source" is the path relative to it
+        overrides: Manifest fields that replace the derived values
+    
+    Returns:
+        Metadata with source, type and report_name
+    """
+    source = file_path.relative_to(root).as_posix() if file_path.is_relative_to(root) else file_path.name
+    folded = fold_accents(file_path.name)
+    doc_type = next((t for keyword, t in TYPE_KEYWORDS if keyword in folded), "report")
+    metadata = {
+        "source": source,
+        "type": doc_type,
+        "report_name": _first_title(file_path) or file_path.stem
+    }
+    metadata.update(overrides or {})
+    return metadata
+
+def discover_documents(root: Path = DATASETS_DIR, manifest: Optional[Path] = INGEST_MANIFEST,
+                       patterns: List[str] = INGEST_PATTERNS) -> List[Tuple[Path, Dict[str, Any]]]:
+    """
+    List the reports to ingest, in a deterministic order.
+    
+    With a manifest (JSON list of {"path": ..., optional metadata}), exactly
+    the listed files are ingested, paths relative to the manifest. Otherwise
+    every file under root matching one of the glob patterns is ingested.
+    
+    Returns:
+        (file path, chunk metadata) for every report
+    """
+    if manifest is not None:
+        entries = json.loads(Path(manifest).read_text(encoding="utf-8"))
+        documents = []
+        for entry in entries:
+            overrides = {key: value for key, value in entry.items() if key != "path"}
+            file_path = (Path(manifest).parent / entry["path"]).resolve()
+            documents.append((file_path, document_metadata(file_path, root.resolve(), overrides)))
+        return documents
+    
+    files = sorted({path for pattern in patterns for path in root.rglob(pattern) if path.is_file()})
+    return [(file_path, document_metadata(file_path, root)) for file_path in files]
+
+def split_document(file_path: Path, metadata: Dict[str, Any],
+                   profile: Optional[IngestProfile] = None) -> List[Document]:
+    """Chunk one report (runs in a worker process)."""
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
     )
+    return list(iter_document_chunks(file_path, metadata, text_splitter, profile))
+
+def split_document_profiled(file_path: Path, metadata: Dict[str, Any]) -> Tuple[List[Document], Dict[str, float]]:
+    """Chunk one report and return the time of each stage (runs in a worker process)."""
+    profile = IngestProfile()
+    return split_document(file_path, metadata, profile), profile.stage_seconds
+
+def _iter_parallel_chunks(documents: List[Tuple[Path, Dict[str, Any]]], workers: int,
+                          profile: Optional[IngestProfile] = None) -> Iterator[Document]:
+    """
+    Chunk reports in a process pool and yield their chunks in input order.
     
-    all_chunks = []
+    At most 2 * workers reports are in flight or waiting to be consumed, so
+    memory is bounded by a few reports, not by the corpus. When profiling,
+    workers report their stage times and the time spent waiting for them is
+    charged to "split_wait".
+    """
+    split = split_document if profile is None else split_document_profiled
+    documents = iter(documents)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(
+            executor.submit(split, file_path, metadata)
+            for file_path, metadata in itertools.islice(documents, 2 * workers)
+        )
+        while pending:
+            with stage(profile, "split_wait"):
+                result = pending.popleft().result()
+            if profile is None:
+                chunks = result
+            else:
+                chunks, stage_seconds = result
+                profile.add_worker_stages(stage_seconds)
+            for file_path, metadata in itertools.islice(documents, 1):
+                pending.append(executor.submit(split, file_path, metadata))
+            yield from chunks
+
+def _iter_identified_chunks(documents: List[Tuple[Path, Dict[str, Any]]], workers: int,
+                            profile: Optional[IngestProfile]) -> Iterator[Document]:
+    """Split the reports and give every chunk its ID and content hash."""
+    if workers > 1 and len(documents) > 1:
+        chunks = _iter_parallel_chunks(documents, min(workers, len(documents)), profile)
+    else:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+        )
+        chunks = itertools.chain.from_iterable(
+            iter_document_chunks(file_path, metadata, text_splitter, profile)
+            for file_path, metadata in documents
+        )
+    return timed(profile, "chunk_ids", with_chunk_ids(chunks))
+
+def drop_near_duplicates(chunks: Iterable[Document], plan: DedupPlan) -> Iterator[Document]:
+    """
+    Drop the chunks a DedupPlan marks as near-duplicates.
     
-    # Process financial report
-    print("📊 Processing financial report...")
-    financial_doc = Document(
-        page_content=financial_content,
-        metadata={"source": "relatorio-financeiro.txt", "type": "financial"}
-    )
+    Representatives get the locations of the chunks they replace in
+    duplicate_sources ("source#chunk_index" entries joined by "; ") and
+    duplicate_count, and their content hash is updated to match.
+    """
+    for chunk in chunks:
+        if chunk.id in plan.representative_of:
+            continue
+        locations = plan.duplicate_sources.get(chunk.id)
+        if locations:
+            chunk.metadata["duplicate_sources"] = "; ".join(locations)
+            chunk.metadata["duplicate_count"] = len(locations)
+            set_content_hash(chunk)
+        yield chunk
+
+def plan_near_duplicates(documents: Optional[List[Tuple[Path, Dict[str, Any]]]] = None,
+                         workers: int = INGEST_WORKERS,
+                         profile: Optional[IngestProfile] = None,
+                         chunks: Optional[Iterable[Document]] = None) -> DedupPlan:
+    """
+    Find the near-duplicate chunks of the corpus with one pass over it.
+    
+    Only the MinHash signatures are kept, so memory does not grow with the
+    chunk texts. Compute the plan once per ingestion run and pass it to
+    every iter_chunks() call of that run.
     
-    # First split by markdown headers to preserve structure
-    financial_header_splits = markdown_splitter.split_text(financial_content)
-    # Add source metadata to each header split
-    for split in financial_header_splits:
-        split.metadata.update(financial_doc.metadata)
-    # The split_text method returns Document objects, so we can use them directly
-    financial_chunks = text_splitter.split_documents(financial_header_splits)
-    all_chunks.extend(financial_chunks)
-    print(f"   Created {len(financial_chunks)} chunks from financial report")
-    
-    # Process administration report
-    print("📋 Processing administration report...")
-    admin_doc = Document(
-        page_content=admin_content,
-        metadata={"source": "Relatorio-da-administracao.txt", "type": "administrative"}
+    Args:
+        documents: Reports from discover_documents() (discovered when None)
+        workers: Worker processes used to split reports
+        profile: Records the dedup stage and its counters when given
+        chunks: Identified chunks of the documents when the caller splits
+            them already (see spool_corpus()); documents are split otherwise
+    """
+    if chunks is None:
+        with stage(profile, "discover"):
+            if documents is None:
+                documents = discover_documents()
+        with stage(profile, "pdf_extract"):
+            documents = prepare_pdfs(documents, workers)
+        chunks = _iter_identified_chunks(documents, workers, profile)
+    with stage(profile, "dedup"):
+        plan = find_near_duplicates(chunks, DEDUP_THRESHOLD, DEDUP_NUM_PERM, EMBEDDING_MODEL)
+    print(
+        f"🧹 Near-duplicates: removed {plan.removed} of {plan.total} chunks "
+        f"({plan.removed_tokens} tokens, threshold {DEDUP_THRESHOLD})"
     )
+    if profile is not None:
+        profile.dedup = {"chunks": plan.total, "removed_chunks": plan.removed, "removed_tokens": plan.removed_tokens}
+    return plan
+
+def iter_chunks(documents: Optional[List[Tuple[Path, Dict[str, Any]]]] = None,
+                workers: int = INGEST_WORKERS,
+                profile: Optional[IngestProfile] = None,
+                dedup: bool = DEDUP_ENABLED,
+                dedup_plan: Optional[DedupPlan] = None) -> Iterator[Document]:
+    """
+    Stream the chunks of every report with stable IDs and content hashes.
     
-    # First split by markdown headers to preserve structure
-    admin_header_splits = markdown_splitter.split_text(admin_content)
-    # Add source metadata to each header split
-    for split in admin_header_splits:
-        split.metadata.update(admin_doc.metadata)
-    # The split_text method returns Document objects, so we can use them directly
-    admin_chunks = text_splitter.split_documents(admin_header_splits)
-    all_chunks.extend(admin_chunks)
-    print(f"   Created {len(admin_chunks)} chunks from administration report")
+    Reports are split in a process pool when there are several of them and
+    more than one worker; otherwise they are streamed line by line in this
+    process. Either way chunks come out in discovery order, so chunk indexes
+    and IDs do not depend on scheduling.
     
-    print(f"📦 Total chunks created: {len(all_chunks)}")
+    With dedup, the stream skips near-duplicates, so the representatives
+    already carry the sources of their duplicates when they reach the
+    store. Finding them takes a pass of its own (plan_near_duplicates());
+    callers that stream the corpus several times split it once with
+    spool_corpus() instead.
+    
+    Args:
+        documents: Reports from discover_documents() (discovered when None)
+        workers: Worker processes used to split reports
+        profile: Records stage times and chunk sizes when given
+        dedup: Remove near-duplicate chunks (see dedup.py)
+        dedup_plan: Plan from plan_near_duplicates() for these documents
+            (computed here when dedup is on and none is given)
+    """
+    with stage(profile, "discover"):
+        if documents is None:
+            documents = discover_documents()
+    with stage(profile, "pdf_extract"):
+        documents = prepare_pdfs(documents, workers, dedup)
+    if dedup and dedup_plan is None:
+        dedup_plan = plan_near_duplicates(documents, workers, profile)
+    chunks = _iter_identified_chunks(documents, workers, profile)
+    if dedup:
+        chunks = drop_near_duplicates(chunks, dedup_plan)
+    return chunks if profile is None else profile.record_chunks(chunks)
+
+def _write_spool(chunks: Iterable[Document], path: Path,
+                 profile: Optional[IngestProfile] = None) -> Iterator[Document]:
+    """Pass chunks through, appending each one to a JSONL file."""
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            with stage(profile, "spool"):
+                f.write(json.dumps(
+                    {"id": chunk.id, "text": chunk.page_content, "metadata": chunk.metadata},
+                    ensure_ascii=False
+                ) + "\n")
+            yield chunk
+
+def _read_spool(path: Path) -> Iterator[Document]:
+    """Stream the chunks written by _write_spool()."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            yield Document(id=record["id"], page_content=record["text"], metadata=record["metadata"])
+
+def spool_corpus(documents: List[Tuple[Path, Dict[str, Any]]], path: Path,
+                 workers: int = INGEST_WORKERS,
+                 profile: Optional[IngestProfile] = None,
+                 dedup: bool = DEDUP_ENABLED) -> Callable[[], Iterator[Document]]:
+    """
+    Split the reports once per ingestion run.
     
-    # Add chunk index to metadata
-    for i, chunk in enumerate(all_chunks):
-        chunk.metadata["chunk_index"] = i
+    Splitting (reading, PDF pages, header and text splitting) is the
+    expensive part of a pass over the corpus. The reports are split once;
+    the near-duplicates are found in the same pass and every chunk is
+    written to a JSONL file, which later passes read back instead of
+    splitting again. Memory still does not grow with the corpus.
     
+    Args:
+        documents: Reports from prepare_pdfs()
+        path: JSONL file the chunks are written to (deleted by the caller)
+        workers: Worker processes used to split reports
+        profile: Records stage times, chunk sizes and dedup counters when given
+        dedup: Remove near-duplicate chunks (see dedup.py)
+    
+    Returns:
+        A function returning a fresh stream of the chunks, like iter_chunks()
+    """
+    chunks = _write_spool(_iter_identified_chunks(documents, workers, profile), path, profile)
+    if dedup:
+        dedup_plan = plan_near_duplicates(documents, workers, profile, chunks)
+    else:
+        dedup_plan = None
+        for _ in chunks:
+            pass
+    
+    def corpus() -> Iterator[Document]:
+        chunks = timed(profile, "spool", _read_spool(path))
+        if dedup_plan is not None:
+            chunks = drop_near_duplicates(chunks, dedup_plan)
+        return chunks if profile is None else profile.record_chunks(chunks)
+    
+    return corpus
+
+def count_terms(chunks: Iterable[Document], lexical: Optional[LexicalIndexBuilder],
+                profile: Optional[IngestProfile] = None) -> Iterator[Document]:
+    """Pass chunks through, counting their terms into a BM25 builder when given."""
+    for chunk in chunks:
+        if lexical is not None:
+            with stage(profile, "lexical_index"):
+                lexical.add(chunk.id, chunk.page_content)
+        yield chunk
+
+def create_documents() -> List[Document]:
+    """Create document chunks from source files, without near-duplicates (loads every chunk in memory)."""
+    print("📄 Loading documents...")
+    all_chunks = list(iter_chunks())
+    print(f"📦 Total chunks created: {len(all_chunks)}")
     return all_chunks
 
-def create_embeddings_and_store(chunks):
-    """Create embeddings and store in Chroma DB."""
+def header_path(chunk: Document) -> str:
+    """Markdown header path of a chunk, e.g. "Relatório > Destaques"."""
+    return " > ".join(
+        chunk.metadata[key] for key in ("Header 1", "Header 2", "Header 3") if chunk.metadata.get(key)
+    )
+
+def with_chunk_ids(chunks: Iterable[Document]) -> Iterator[Document]:
+    """
+    Give every chunk a stable ID and a content hash as it streams by.
+    
+    The ID depends on the source, the header path (and page, for PDFs) and
+    the chunk's position within that section, so editing one section leaves
+    the IDs of every other section untouched. chunk_index is the position within the source and
+    content_hash covers the text and the remaining metadata.
+    
+    Args:
+        chunks: Chunks in document order
+    
+    Yields:
+        The same chunks, with id, chunk_index and content_hash set
+    """
+    per_source = Counter()
+    per_section = Counter()
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "")
+        location = header_path(chunk)
+        if chunk.metadata.get("page") is not None:
+            location += f"\x1fp{chunk.metadata['page']}"
+        section = (source, location)
+        chunk.metadata["chunk_index"] = per_source[source]
+        per_source[source] += 1
+        
+        key = "\x1f".join([source, section[1], str(per_section[section])])
+        per_section[section] += 1
+        chunk.id = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+        set_content_hash(chunk)
+        yield chunk
+
+def set_content_hash(chunk: Document) -> None:
+    """Set metadata["content_hash"] from the chunk's text and remaining metadata."""
+    payload = json.dumps(
+        [chunk.page_content, {k: v for k, v in chunk.metadata.items() if k != "content_hash"}],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    chunk.metadata["content_hash"] = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+class SyncPlan:
+    """Streaming comparison of the current chunks with what the store holds."""
+    
+    def __init__(self, existing: Dict[str, str]):
+        """
+        Args:
+            existing: Content hash of every chunk ID already stored
+        """
+        self.existing = existing
+        self.seen = set()
+        self.counts = Counter({"added": 0, "updated": 0, "unchanged": 0})
+        self._version = hashlib.blake2b(digest_size=16)
+    
+    def classify(self, chunk: Document) -> str:
+        """Record a chunk and return "added", "updated" or "unchanged"."""
+        self.seen.add(chunk.id)
+        self._version.update(f"{chunk.id}:{chunk.metadata['content_hash']}\n".encode("utf-8"))
+        stored_hash = self.existing.get(chunk.id)
+        if stored_hash is None:
+            status = "added"
+        elif stored_hash != chunk.metadata["content_hash"]:
+            status = "updated"
+        else:
+            status = "unchanged"
+        self.counts[status] += 1
+        return status
+    
+    def changed(self, chunks: Iterable[Document]) -> Iterator[Document]:
+        """Yield only the new or changed chunks, recording every chunk seen."""
+        for chunk in chunks:
+            if self.classify(chunk) != "unchanged":
+                yield chunk
+    
+    @property
+    def removed(self) -> List[str]:
+        """Stored IDs not seen in the current chunks (valid once consumed)."""
+        return [chunk_id for chunk_id in self.existing if chunk_id not in self.seen]
+    
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.counts["added"] or self.counts["updated"] or self.removed)
+    
+    @property
+    def total(self) -> int:
+        return len(self.seen)
+    
+    @property
+    def content_version(self) -> str:
+        """Hash of every chunk ID and content hash; changes whenever the corpus does."""
+        return self._version.hexdigest()
+    
+    def print_summary(self) -> None:
+        """Print how many chunks were added, updated, removed and left unchanged."""
+        print(
+            f"📊 Sync summary: ➕ {self.counts['added']} added | 🔄 {self.counts['updated']} updated | "
+            f"🗑️ {len(self.removed)} removed | ✅ {self.counts['unchanged']} unchanged"
+        )
+
+def plan_sync(chunks: List[Document], existing: Dict[str, str]) -> Dict[str, List]:
+    """
+    Compare a list of chunks with what the store already holds.
+    
+    Args:
+        chunks: Current chunks with IDs and content hashes
+        existing: Content hash of every chunk ID already stored
+    
+    Returns:
+        Dictionary with the "added" and "updated" chunks, the "removed" IDs
+        and the "unchanged" chunks
+    """
+    plan = SyncPlan(existing)
+    result = {"added": [], "updated": [], "removed": [], "unchanged": []}
+    for chunk in chunks:
+        result[plan.classify(chunk)].append(chunk)
+    result["removed"] = plan.removed
+    return result
+
+def _link_or_copy(source: str, destination: str) -> None:
+    """Hard-link a file (index files are never modified in place), copying where links are unsupported."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+def create_embeddings_and_store(profile: Optional[IngestProfile] = None,
+                                paths: Optional[Dict[str, Path]] = None,
+                                base_paths: Optional[Dict[str, Path]] = None,
+                                chunks: Optional[Callable[[], Iterator[Document]]] = None,
+                                lexical: Optional[LexicalIndexBuilder] = None) -> Tuple[VectorStore, SyncPlan]:
+    """
+    Create embeddings and store them in the configured vector backend.
+    
+    Chunks are streamed from the reports straight into the embedding stage,
+    so memory use does not grow with the size of the corpus. The corpus is
+    streamed once; every chunk also reaches the BM25 builder on its way.
+    
+    Args:
+        profile: Records stage times, chunk sizes and embedding counters when given
+        paths: Index locations to write (see snapshots.index_paths; defaults
+            to CHROMA_DB_PATH / NUMPY_INDEX_PATH)
+        base_paths: Index locations of the published version to start from
+            (defaults to paths, i.e. update in place)
+        chunks: Returns a fresh stream of the corpus chunks on every call
+            (defaults to iter_chunks())
+        lexical: Counts the terms of every chunk for the BM25 index when given
+    
+    Returns:
+        The vector store and the SyncPlan describing what changed
+    """
     print("🔗 Creating embeddings...")
+    chunks = chunks or (lambda: iter_chunks(profile=profile))
     
     # Get LLM configuration
     llm_config = get_llm_config()
     
-    # Create embeddings
-    if llm_config["provider"] == "openai":
-        embeddings = OpenAIEmbeddings(
-            openai_api_key=llm_config["api_key"],
-            model="text-embedding-3-small"
+    # Create embeddings (OpenAI embeddings for both providers), served from
+    # the persistent embedding cache for chunks that were embedded before.
+    # Retries are handled by the embedding stage, not the client.
+    with stage(profile, "setup"):
+        embeddings = create_embeddings(llm_config, max_retries=0)
+    
+    paths = paths or {"chroma": CHROMA_DB_PATH, "numpy": NUMPY_INDEX_PATH}
+    base_paths = base_paths or paths
+    if VECTOR_BACKEND == "numpy":
+        return create_numpy_index(embeddings, profile, paths["numpy"], base_paths["numpy"], chunks, lexical)
+    
+    # Start from a copy of the published Chroma DB and sync the copy, so only
+    # new or changed chunks are embedded and the published one is untouched
+    chroma_path = paths["chroma"]
+    print(f"💾 Syncing Chroma DB at {chroma_path}")
+    with stage(profile, "store_open"):
+        if base_paths["chroma"] != chroma_path and base_paths["chroma"].exists() and not chroma_path.exists():
+            shutil.copytree(base_paths["chroma"], chroma_path)
+        vectorstore = Chroma(
+            collection_name="petrobras_docs",
+            embedding_function=embeddings,
+            persist_directory=str(chroma_path)
         )
-    else:
-        # For OpenRouter, we'll use OpenAI embeddings through their API
-        embeddings = OpenAIEmbeddings(
-            openai_api_key=llm_config["api_key"],
-            model="text-embedding-3-small"
+        collection = vectorstore._collection
+    
+    with stage(profile, "sync_plan"):
+        stored = vectorstore.get(include=["metadatas"])
+        existing = {
+            chunk_id: (metadata or {}).get("content_hash", "")
+            for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])
+        }
+    plan = SyncPlan(existing)
+    
+    def upsert(batch: List[Document], vectors: List[List[float]]) -> None:
+        collection.upsert(
+            ids=[chunk.id for chunk in batch],
+            embeddings=vectors,
+            documents=[chunk.page_content for chunk in batch],
+            metadatas=[chunk.metadata for chunk in batch]
         )
     
-    # Create Chroma DB
-    print(f"💾 Storing in Chroma DB at {CHROMA_DB_PATH}")
-    
-    # Remove existing DB if it exists
-    if CHROMA_DB_PATH.exists():
-        import shutil
-        shutil.rmtree(CHROMA_DB_PATH)
-        print("🗑️ Removed existing Chroma DB")
-    
-    # Create new Chroma DB
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=str(CHROMA_DB_PATH),
-        collection_name="petrobras_docs"
+    # Only new or changed chunks reach the embedding stage
+    changed = timed(profile, "sync_plan", plan.changed(count_terms(chunks(), lexical, profile)))
+    embed_and_store(changed, embeddings, upsert, profile)
+    
+    with stage(profile, "persist"):
+        removed = plan.removed
+        if removed:
+            vectorstore.delete(ids=removed)
+        
+        # Record the corpus version so the agent's answer cache notices in-place updates
+        collection.modify(metadata={**(collection.metadata or {}), "content_version": plan.content_version})
+    
+    plan.print_summary()
+    print(f"✅ Chroma DB holds {collection.count()} documents")
+    print(f"📁 Database location: {chroma_path}")
+    
+    return vectorstore, plan
+
+def embed_and_store(chunks: Iterable[Document], embeddings: Embeddings, sink: BatchSink,
+                    profile: Optional[IngestProfile] = None) -> Dict[str, Any]:
+    """
+    Embed chunks in concurrent, token-bounded batches and write each batch
+    to the store as soon as it is embedded.
+    
+    Args:
+        chunks: Chunks to embed (an iterable; consumed lazily)
+        embeddings: Embeddings client
+        sink: Called with each batch of chunks and their vectors
+        profile: Records the embedding and persistence stages when given
+    
+    Returns:
+        Pipeline stats (chunks, batches, requests, retries, tokens, seconds,
+        chunks_per_second, and cache_hits/cache_misses with the embedding cache)
+    """
+    pipeline = EmbeddingPipeline(
+        embeddings,
+        concurrency=EMBEDDING_CONCURRENCY,
+        max_retries=EMBEDDING_MAX_RETRIES
+    )
+    sent_tokens = Counter()
+    batches = batch_by_tokens(
+        chunks, EMBEDDING_BATCH_TOKENS, EMBEDDING_BATCH_SIZE, EMBEDDING_MODEL,
+        on_batch=lambda batch, tokens: sent_tokens.update(tokens=tokens)
     )
     
-    print(f"✅ Chroma DB created with {len(chunks)} documents")
-    print(f"📁 Database location: {CHROMA_DB_PATH}")
+    def store(batch: List[Document], vectors: List[List[float]]) -> None:
+        with stage(profile, "persist"):
+            sink(batch, vectors)
     
-    return vectorstore
+    cache = getattr(embeddings, "store", None)
+    cache_before = cache.stats() if cache is not None else None
+    with stage(profile, "embedding"):
+        stats = pipeline.run(timed(profile, "batching", batches), store)
+    stats["tokens"] = sent_tokens["tokens"]
+    if cache is not None:
+        cache_after = cache.stats()
+        stats["cache_hits"] = cache_after["hits"] - cache_before["hits"]
+        stats["cache_misses"] = cache_after["misses"] - cache_before["misses"]
+    if profile is not None:
+        profile.record_embedding(stats)
+    if stats["chunks"]:
+        print(
+            f"⚡ Embedded {stats['chunks']} chunks ({stats['tokens']} tokens) in {stats['batches']} batches, "
+            f"{stats['seconds']:.1f}s ({stats['chunks_per_second']:.1f} chunks/s, {stats['retries']} retries)"
+        )
+    return stats
 
-def test_retrieval(vectorstore):
+def create_numpy_index(embeddings: Embeddings, profile: Optional[IngestProfile] = None,
+                       directory: Optional[Path] = None, base: Optional[Path] = None,
+                       chunks: Optional[Callable[[], Iterator[Document]]] = None,
+                       lexical: Optional[LexicalIndexBuilder] = None) -> Tuple[NumpyVectorStore, SyncPlan]:
+    """
+    Create the in-process NumPy index (alternative to Chroma).
+    
+    The index is read-only, so it is rewritten in a single streaming pass:
+    unchanged chunks are copied with their stored vectors and only new or
+    changed ones are embedded. When nothing changed, the new copy is
+    dropped and the published index is kept (hard-linked into directory).
+    
+    Args:
+        embeddings: Embeddings client
+        profile: Records stage times when given
+        directory: Where to write the index (defaults to NUMPY_INDEX_PATH)
+        base: Published index compared against (defaults to directory); an
+            unchanged one is hard-linked into directory instead of rewritten
+        chunks: Returns a fresh stream of the corpus chunks on every call
+            (defaults to iter_chunks())
+        lexical: Counts the terms of every chunk for the BM25 index when given
+    
+    Returns:
+        The vector store and the SyncPlan describing what changed
+    """
+    chunks = chunks or (lambda: iter_chunks(profile=profile))
+    directory = directory or NUMPY_INDEX_PATH
+    base = base or directory
+    print(f"💾 Storing in NumPy index at {directory}")
+    
+    current = None
+    existing = {}
+    with stage(profile, "store_open"):
+        if (base / "manifest.json").exists():
+            current = NumpyVectorStore(base, embeddings)
+            existing = current.content_hashes()
+    plan = SyncPlan(existing)
+    
+    # Updating in place: write next to the index still being read from
+    build_directory = directory if base != directory else directory.with_name(f"{directory.name}.building")
+    writer = NumpyIndexWriter(build_directory, embedding_model=EMBEDDING_MODEL)
+    
+    def write(batch: List[Document], vectors: Union[List[List[float]], np.ndarray]) -> None:
+        writer.add(
+            [chunk.id for chunk in batch],
+            [chunk.page_content for chunk in batch],
+            [chunk.metadata for chunk in batch],
+            vectors
+        )
+    
+    unchanged: List[Document] = []
+    
+    def copy_unchanged() -> None:
+        assert current is not None  # only chunks of the base index are unchanged
+        with stage(profile, "persist"):
+            write(unchanged, current.get_vectors([chunk.id for chunk in unchanged]))
+        unchanged.clear()
+    
+    def changed(stream: Iterable[Document]) -> Iterator[Document]:
+        for chunk in stream:
+            if plan.classify(chunk) != "unchanged":
+                yield chunk
+                continue
+            unchanged.append(chunk)
+            if len(unchanged) >= EMBEDDING_BATCH_SIZE:
+                copy_unchanged()
+        if unchanged:
+            copy_unchanged()
+    
+    embed_and_store(
+        timed(profile, "sync_plan", changed(count_terms(chunks(), lexical, profile))),
+        embeddings,
+        write,
+        profile
+    )
+    with stage(profile, "persist"):
+        writer.close()
+    plan.print_summary()
+    
+    if current is not None and not plan.has_changes:
+        print("✅ NumPy index is up to date")
+        with stage(profile, "persist"):
+            shutil.rmtree(build_directory)
+            if base != directory:
+                shutil.copytree(base, directory, copy_function=_link_or_copy)
+                current = NumpyVectorStore(directory, embeddings)
+        return current, plan
+    
+    if build_directory != directory:
+        current = None  # release its memory maps before replacing the files
+        with stage(profile, "persist"):
+            shutil.rmtree(directory, ignore_errors=True)
+            build_directory.rename(directory)
+    vectorstore = NumpyVectorStore(directory, embeddings)
+    
+    print(f"✅ NumPy index created with {len(vectorstore)} documents")
+    print(f"📁 Index location: {directory}")
+    
+    return vectorstore, plan
+
+def create_lexical_index(chunks: Iterable[Document] = (), profile: Optional[IngestProfile] = None,
+                         path: Optional[Path] = None,
+                         lexical: Optional[LexicalIndexBuilder] = None) -> LexicalIndex:
+    """
+    Build the BM25 inverted index used by hybrid retrieval (at LEXICAL_INDEX_PATH by default).
+    
+    Only term counts are kept, never the chunk texts.
+    
+    Args:
+        chunks: Chunks to count
+        profile: Records the lexical_index stage when given
+        path: Where to write the index
+        lexical: Builder that already counted chunks during the vector
+            store pass (see count_terms()); chunks are added to it
+    """
+    path = path or LEXICAL_INDEX_PATH
+    lexical = lexical or LexicalIndexBuilder()
+    print(f"🔤 Building lexical index at {path}")
+    
+    with stage(profile, "lexical_index"):
+        for chunk in chunks:
+            lexical.add(chunk.id, chunk.page_content)
+        lexical_index = lexical.build()
+        lexical_index.save(path)
+    
+    print(f"✅ Lexical index created with {len(lexical_index)} documents and {len(lexical_index.terms)} terms")
+    
+    return lexical_index
+
+def create_fact_index(documents: List[Tuple[Path, Dict[str, Any]]], profile: Optional[IngestProfile] = None,
+                      path: Optional[Path] = None) -> FactIndex:
+    """
+    Parse the report tables into the fact index used for metric lookups (at FACT_INDEX_PATH by default).
+    
+    PDF reports have no markdown tables; their metrics are answered by
+    retrieval unless a .txt/.md copy of the report is ingested too.
+    """
+    path = path or FACT_INDEX_PATH
+    print(f"🔢 Building fact index at {path}")
+    pdfs = [file_path.name for file_path, _ in documents if file_path.suffix.lower() == ".pdf"]
+    if pdfs:
+        print(f"⚠️ No facts from {len(pdfs)} PDF reports without a text copy: {', '.join(pdfs)}")
+    
+    with stage(profile, "fact_index"):
+        fact_index = FactIndex.build(documents)
+        fact_index.save(path)
+    
+    print(f"✅ Fact index created with {len(fact_index)} facts")
+    
+    return fact_index
+
+def test_retrieval(vectorstore: VectorStore) -> None:
     """Test retrieval functionality."""
     print("\n🧪 Testing retrieval...")
     
@@ -158,27 +1012,118 @@ def test_retrieval(vectorstore):
             print(f"     Preview: {doc.page_content[:100]}...")
             print()
 
-def main():
+def save_split_profile(profiler: cProfile.Profile, stats_path: Path, chunk_count: int,
+                       limit: int = 25) -> Dict[str, Any]:
+    """
+    Save the cProfile statistics of the splitting pass.
+    
+    Splitting normally runs in worker processes, which a profiler in the
+    main process cannot see, so with --profile the run's only splitting
+    pass runs in this process, under the profiler.
+    
+    Args:
+        profiler: Profiler enabled during spool_corpus()
+        stats_path: Where to write the pstats file (open with pstats or snakeviz)
+        chunk_count: Chunks of the corpus
+        limit: Number of functions listed in the result
+    
+    Returns:
+        The pstats file path and the top functions by cumulative time
+    """
+    stats_path.parent.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(stats_path)
+    stats = pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE)
+    stats.print_stats(limit)
+    top = []
+    for function in stats.fcn_list[:limit]:
+        _, calls, own_seconds, cumulative_seconds, _ = stats.stats[function]
+        file_name, line, name = function
+        top.append({
+            "function": f"{Path(file_name).name}:{line}({name})",
+            "calls": calls,
+            "tottime": own_seconds,
+            "cumtime": cumulative_seconds
+        })
+    print(f"🔬 Splitting profile ({chunk_count} chunks) saved to: {stats_path}")
+    return {"stats_file": str(stats_path), "chunks": chunk_count, "top_cumulative": top}
+
+def main(argv: Optional[List[str]] = None) -> None:
     """Main ingestion process."""
+    parser = argparse.ArgumentParser(description="Ingest the reports into the vector store and search indexes")
+    parser.add_argument("--profile-output", type=Path, default=INGEST_PROFILE_PATH,
+                        help="Where to write the JSON ingestion profile")
+    parser.add_argument("--profile", action="store_true",
+                        help="Also profile the splitting stage with cProfile, in this process (saved next to the JSON profile)")
+    args = parser.parse_args(argv)
+    
     print("🚀 Starting document ingestion...")
+    profile = IngestProfile()
     
     try:
         # Validate configuration
-        validate_config()
+        with stage(profile, "setup"):
+            validate_config()
         print("✅ Configuration validated")
         
-        # Create document chunks
-        chunks = create_documents()
+        # Build the new index version next to the published one
+        snapshots = SnapshotStore(INDEX_SNAPSHOTS_DIR)
+        published = snapshots.current()
+        snapshot = snapshots.create()
+        paths = index_paths(snapshot)
+        print(f"📦 Building index version {snapshot.name} (from {published.name if published else 'the legacy layout'})")
         
-        # Create embeddings and store
-        vectorstore = create_embeddings_and_store(chunks)
+        try:
+            # Discover the reports, then split them once: near-duplicates are
+            # found in the same pass and the chunks are spooled to disk
+            with stage(profile, "discover"):
+                documents = discover_documents()
+            with stage(profile, "pdf_extract"):
+                documents = prepare_pdfs(documents)
+            profiler = cProfile.Profile() if args.profile else None
+            if profiler is not None:
+                profiler.enable()
+            corpus = spool_corpus(
+                documents, snapshot / "chunks.jsonl", 1 if profiler is not None else INGEST_WORKERS, profile
+            )
+            if profiler is not None:
+                profiler.disable()
+            
+            # One pass over the chunks feeds the vector store and the BM25 index
+            print("📄 Streaming documents...")
+            lexical = LexicalIndexBuilder()
+            vectorstore, plan = create_embeddings_and_store(profile, paths, index_paths(published), corpus, lexical)
+            create_lexical_index(profile=profile, path=paths["lexical"], lexical=lexical)
+            (snapshot / "chunks.jsonl").unlink()
+            
+            # Parse the report tables into (metric, period, value) facts
+            create_fact_index(documents, profile, paths["fact"])
+            
+            # Test retrieval
+            with stage(profile, "test_retrieval"):
+                test_retrieval(vectorstore)
+        except BaseException:
+            shutil.rmtree(snapshot, ignore_errors=True)
+            raise
         
-        # Test retrieval
-        test_retrieval(vectorstore)
+        # Agents switch to the new version on their next pointer check;
+        # replaced versions are kept for queries still running on them
+        with stage(profile, "publish"):
+            snapshots.publish(snapshot)
+            removed = snapshots.collect_garbage(SNAPSHOT_GC_GRACE_SECONDS, keep=snapshot)
+        print(f"📌 Published index version {snapshot.name}")
+        if removed:
+            print(f"🧹 Removed {len(removed)} index versions retired over {SNAPSHOT_GC_GRACE_SECONDS:.0f}s ago")
         
         print("\n🎉 Ingestion completed successfully!")
-        print(f"📊 Total chunks: {len(chunks)}")
-        print(f"📁 Database: {CHROMA_DB_PATH}")
+        print(f"📊 Total chunks: {plan.total}")
+        print(f"📁 Database: {paths['numpy'] if VECTOR_BACKEND == 'numpy' else paths['chroma']}")
+        
+        report = profile.report()
+        print_report(report)
+        if profiler is not None:
+            report["cprofile"] = save_split_profile(profiler, args.profile_output.with_suffix(".prof"), plan.total)
+        save_report(report, args.profile_output)
+        print(f"💾 Profile saved to: {args.profile_output}")
         
     except Exception as e:
         print(f"❌ Ingestion failed: {e}")
@@ -0,0 +1,208 @@
+"""
+Per-stage profiling of the ingestion pipeline.
+
+Ingestion is a chain of lazy generators (read lines -> header sections ->
+chunks -> IDs -> batches -> embeddings -> store), so the stages interleave and
+a plain start/stop timer per stage would count the same second several times.
+IngestProfile keeps a stack of active stages and charges elapsed wall time
+only to the innermost one: stage times are exclusive and add up to the run
+time. Chunks split in worker processes report their own stage times, which
+are kept separately from the main process timeline.
+"""
+import json
+import statistics
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Dict, Iterable, Iterator, List, Optional, TypeVar, Union
+
+from langchain_core.documents import Document
+
+T = TypeVar("T")
+
+# Upper bounds (characters) of the chunk size histogram buckets
+SIZE_BUCKETS = (100, 250, 500, 750, 1000, 1500, 2000)
+
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """
+    Peak resident set size of this process (or of its finished children).
+
+    Returns:
+        Megabytes, or None where the resource module is unavailable (Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss * scale / 2 ** 20
+
+
+def size_histogram(sizes: List[int]) -> Dict[str, int]:
+    """Count sizes per SIZE_BUCKETS bucket, e.g. {"<=100": 3, ..., ">2000": 0}."""
+    histogram = {f"<={bound}": 0 for bound in SIZE_BUCKETS}
+    histogram[f">{SIZE_BUCKETS[-1]}"] = 0
+    for size in sizes:
+        bucket = next((f"<={bound}" for bound in SIZE_BUCKETS if size <= bound), f">{SIZE_BUCKETS[-1]}")
+        histogram[bucket] += 1
+    return histogram
+
+
+class IngestProfile:
+    """Exclusive wall time per stage, chunk statistics and embedding counters."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stage_seconds: Dict[str, float] = {}
+        self.worker_stage_seconds: Dict[str, float] = {}
+        self._stack: List[str] = []
+        self._mark = self.started
+        self._chunk_sizes: Dict[str, int] = {}
+        self._chunk_sources: Dict[str, str] = {}
+        self.embedding: Dict[str, Any] = {}
+        self.dedup: Dict[str, int] = {}
+
+    def _charge(self) -> None:
+        """Charge the time since the last stage switch to the innermost stage."""
+        now = time.perf_counter()
+        if self._stack:
+            stage = self._stack[-1]
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + now - self._mark
+        self._mark = now
+
+    def enter(self, stage: str) -> None:
+        self._charge()
+        self._stack.append(stage)
+
+    def exit(self) -> None:
+        self._charge()
+        self._stack.pop()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Attribute the time spent in the block to a stage."""
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def timed(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """Attribute the time spent producing each item of an iterable to a stage."""
+        iterator = iter(iterable)
+        while True:
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            yield item
+
+    def add_worker_stages(self, stage_seconds: Dict[str, float]) -> None:
+        """Merge the stage times measured in a worker process."""
+        for stage, seconds in stage_seconds.items():
+            self.worker_stage_seconds[stage] = self.worker_stage_seconds.get(stage, 0.0) + seconds
+
+    def record_chunks(self, chunks: Iterable[Document]) -> Iterator[Document]:
+        """Pass chunks through, recording their sizes (once per chunk ID across passes)."""
+        for chunk in chunks:
+            self._chunk_sizes[chunk.id] = len(chunk.page_content)
+            self._chunk_sources[chunk.id] = chunk.metadata.get("source", "")
+            yield chunk
+
+    def record_embedding(self, stats: Dict[str, Any]) -> None:
+        """Add the stats of an embedding run (see EmbeddingPipeline.arun())."""
+        for key in ("chunks", "batches", "requests", "retries", "tokens", "cache_hits", "cache_misses", "seconds"):
+            self.embedding[key] = self.embedding.get(key, 0) + stats.get(key, 0)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Build the JSON profile.
+
+        Returns:
+            total_seconds, unattributed_seconds (outside every stage),
+            stages (exclusive seconds and share of the run),
+            worker_stages, chunks (count, per source, size stats and
+            histogram), embedding (requests, tokens, cache hits/misses),
+            dedup (near-duplicate chunks and tokens removed),
+            throughput and peak_rss_mb
+        """
+        total = time.perf_counter() - self.started
+        sizes = list(self._chunk_sizes.values())
+        per_source: Dict[str, int] = {}
+        for source in self._chunk_sources.values():
+            per_source[source] = per_source.get(source, 0) + 1
+        characters = sum(sizes)
+        embedding = dict(self.embedding)
+        embedded_seconds = embedding.get("seconds", 0)
+        ordered = sorted(sizes)
+        return {
+            "total_seconds": total,
+            "unattributed_seconds": max(0.0, total - sum(self.stage_seconds.values())),
+            "stages": {
+                stage: {"seconds": seconds, "share": seconds / total if total else 0.0}
+                for stage, seconds in sorted(self.stage_seconds.items(), key=lambda item: -item[1])
+            },
+            "worker_stages": dict(sorted(self.worker_stage_seconds.items(), key=lambda item: -item[1])),
+            "chunks": {
+                "count": len(sizes),
+                "characters": characters,
+                "per_source": per_source,
+                "size_chars": {
+                    "min": ordered[0] if ordered else 0,
+                    "mean": statistics.mean(ordered) if ordered else 0,
+                    "p50": ordered[len(ordered) // 2] if ordered else 0,
+                    "p95": ordered[int(0.95 * (len(ordered) - 1))] if ordered else 0,
+                    "max": ordered[-1] if ordered else 0
+                },
+                "size_histogram": size_histogram(sizes)
+            },
+            "embedding": embedding,
+            "dedup": dict(self.dedup),
+            "throughput": {
+                "chunks_per_second": len(sizes) / total if total else 0.0,
+                "characters_per_second": characters / total if total else 0.0,
+                "embedded_chunks_per_second": embedding.get("chunks", 0) / embedded_seconds if embedded_seconds else 0.0,
+                "embedded_tokens_per_second": embedding.get("tokens", 0) / embedded_seconds if embedded_seconds else 0.0
+            },
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_workers_mb": peak_rss_mb(children=True)
+        }
+
+
+def save_report(report: Dict[str, Any], path: Union[str, Path]) -> None:
+    """Write a report to a JSON file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+def timed(profile: Optional[IngestProfile], name: str, iterable: Iterable[T]) -> Iterable[T]:
+    """profile.timed(), or the iterable untouched when not profiling."""
+    return iterable if profile is None else profile.timed(name, iterable)
+
+
+def stage(profile: Optional[IngestProfile], name: str) -> ContextManager[None]:
+    """profile.stage(), or a no-op context when not profiling."""
+    return nullcontext() if profile is None else profile.stage(name)
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Print the stage breakdown of a report."""
+    print(f"⏱️ Ingestion profile ({report['total_seconds']:.2f}s, peak RSS {report['peak_rss_mb'] or 0:.0f} MB)")
+    for name, stats in report["stages"].items():
+        print(f"   {name:<14} {stats['seconds']:>8.3f}s {stats['share']:>6.1%}")
+    for name, seconds in report["worker_stages"].items():
+        print(f"   {name:<14} {seconds:>8.3f}s (workers)")
+    embedding = report["embedding"]
+    if embedding:
+        print(
+            f"   {embedding.get('requests', 0)} embedding requests, {embedding.get('tokens', 0)} tokens, "
+            f"{report['chunks']['count']} chunks ({report['throughput']['chunks_per_second']:.1f} chunks/s)"
+        )
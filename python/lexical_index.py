@@ -0,0 +1,230 @@
+"""
+Portuguese BM25 inverted index and hybrid (lexical + vector) retrieval.
+
+Exact tokens such as "FCL", "EBITDA", "1T25" or "Búzios" are often missed by
+pure embedding similarity. The lexical index is built at ingest time with
+accent folding and Portuguese stop-word removal; BM25 weights are precomputed
+per posting, so scoring a query is a handful of vectorized additions.
+Rankings are combined with reciprocal rank fusion (RRF).
+
+The index holds term statistics and chunk IDs only: chunks are streamed into
+a LexicalIndexBuilder without keeping their text, and BM25 hits are read
+back from the vector store of the same index version.
+"""
+import json
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+from portuguese_text import PORTUGUESE_STOP_WORDS, fold_accents, tokenize  # noqa: F401
+
+
+def document_key(doc: Document) -> str:
+    """Identify a chunk independently of the store it came from."""
+    source = doc.metadata.get("source")
+    chunk_index = doc.metadata.get("chunk_index")
+    if source is not None and chunk_index is not None:
+        return f"{source}#{chunk_index}"
+    return doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = 60,
+                           top_n: Optional[int] = None) -> List[Document]:
+    """
+    Fuse several rankings with reciprocal rank fusion.
+
+    Args:
+        rankings: Ranked document lists (best first)
+        k: RRF smoothing constant
+        top_n: Number of fused documents to return (all when None)
+
+    Returns:
+        Documents ordered by fused score
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ordered[:top_n]]
+
+
+class LexicalIndexBuilder:
+    """Streams chunks into BM25 term statistics (chunk texts are not kept)."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            k1: BM25 term-frequency saturation
+            b: BM25 length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.lengths = array("i")
+        self._doc_ids: Dict[str, array] = {}
+        self._tfs: Dict[str, array] = {}
+
+    def add(self, chunk_id: str, text: str) -> None:
+        """Count the terms of one chunk."""
+        counts = Counter(tokenize(text))
+        doc_id = len(self.ids)
+        self.ids.append(chunk_id)
+        self.lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            if term not in self._doc_ids:
+                self._doc_ids[term] = array("i")
+                self._tfs[term] = array("i")
+            self._doc_ids[term].append(doc_id)
+            self._tfs[term].append(tf)
+
+    def build(self) -> "LexicalIndex":
+        """Precompute the BM25 weight of every posting."""
+        k1, b = self.k1, self.b
+        n_docs = len(self.ids)
+        lengths = np.asarray(self.lengths, dtype=np.float32)
+        avg_length = float(lengths.mean()) if n_docs else 0.0
+
+        terms = sorted(self._doc_ids)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_id_parts, weight_parts = [], []
+        for i, term in enumerate(terms):
+            ids = np.asarray(self._doc_ids[term], dtype=np.int32)
+            tf = np.asarray(self._tfs[term], dtype=np.float32)
+            idf = np.log(1.0 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = k1 * (1.0 - b + b * lengths[ids] / avg_length)
+            doc_id_parts.append(ids)
+            weight_parts.append((idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32))
+            term_offsets[i + 1] = term_offsets[i] + len(ids)
+
+        return LexicalIndex(
+            terms,
+            term_offsets,
+            np.concatenate(doc_id_parts) if doc_id_parts else np.zeros(0, dtype=np.int32),
+            np.concatenate(weight_parts) if weight_parts else np.zeros(0, dtype=np.float32),
+            self.ids
+        )
+
+
+class LexicalIndex:
+    """BM25 inverted index over the ingested chunks."""
+
+    def __init__(self, terms: List[str], term_offsets: np.ndarray, doc_ids: np.ndarray,
+                 weights: np.ndarray, ids: Sequence[str]):
+        """Create an index from its arrays (use build(), LexicalIndexBuilder or load())."""
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.ids = list(ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, docs: Iterable[Document], k1: float = 1.5, b: float = 0.75) -> "LexicalIndex":
+        """
+        Build the index from document chunks.
+
+        Args:
+            docs: Chunks with IDs (iterated once, so a generator works)
+            k1: BM25 term-frequency saturation
+            b: BM25 length normalization
+        """
+        builder = LexicalIndexBuilder(k1, b)
+        for doc in docs:
+            builder.add(doc.id, doc.page_content)
+        return builder.build()
+
+    def save(self, directory: Union[str, Path]) -> None:
+        """Write the index arrays and chunk IDs to a directory."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            directory / "postings.npz",
+            terms=np.asarray(self.terms),
+            term_offsets=self.term_offsets,
+            doc_ids=self.doc_ids,
+            weights=self.weights,
+            ids=np.asarray(self.ids)
+        )
+        # Indexes written before chunk IDs moved into postings.npz
+        (directory / "docs.json").unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> "LexicalIndex":
+        """Load an index written by save()."""
+        directory = Path(directory)
+        with np.load(directory / "postings.npz") as data:
+            terms = data["terms"].tolist()
+            term_offsets = data["term_offsets"]
+            doc_ids = data["doc_ids"]
+            weights = data["weights"]
+            ids = data["ids"].tolist() if "ids" in data.files else None
+        if ids is None:
+            # Older indexes kept every chunk in a docs.json sidecar
+            with open(directory / "docs.json", encoding="utf-8") as f:
+                ids = [record["id"] for record in json.load(f)]
+        return cls(terms, term_offsets, doc_ids, weights, ids)
+
+    def search(self, query: str, k: int = 5) -> List[str]:
+        """Return the IDs of the k chunks with the best BM25 score for the query."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        matched = False
+        for term in set(tokenize(query)):
+            i = self.vocabulary.get(term)
+            if i is None:
+                continue
+            start, end = self.term_offsets[i], self.term_offsets[i + 1]
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+            matched = True
+        if not matched:
+            return []
+
+        k = min(k, int(np.count_nonzero(scores)))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [self.ids[int(row)] for row in ranked]
+
+    def search_documents(self, query: str, vectorstore: VectorStore, k: int = 5) -> List[Document]:
+        """
+        Return the k best BM25 hits as Documents, best first.
+
+        Args:
+            query: Question text
+            vectorstore: Vector store of the same index version, which holds
+                the chunk texts and metadata
+            k: Number of hits
+        """
+        ids = self.search(query, k)
+        if not ids:
+            return []
+        found = {doc.id: doc for doc in vectorstore.get_by_ids(ids)}
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever fusing vector similarity and BM25 rankings with RRF."""
+
+    vectorstore: VectorStore
+    lexical_index: Any
+    k: int = 5
+    candidates: int = 20
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector_docs = self.vectorstore.similarity_search(query, k=self.candidates)
+        lexical_docs = self.lexical_index.search_documents(query, self.vectorstore, k=self.candidates)
+        return reciprocal_rank_fusion([vector_docs, lexical_docs], k=self.rrf_k, top_n=self.k)
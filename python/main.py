@@ -1,5 +1,261 @@
-def main():
-    print("Hello from python!")
+"""
+HTTP server for the Petrobras RAG agent.
+
+Holds a single warm PetrobrasRAGAgent and serves it with FastAPI and uvicorn
+(install the "server" extra):
+
+    POST /query          {"question": "..."} -> the query() result (504 past the deadline)
+    POST /query/stream   same body -> Server-Sent Events (sources, token, done)
+    GET  /ready          200 once the index and clients are loaded, else 503
+    GET  /health         200 while the process is up
+
+Admission control keeps overload from turning into unbounded latency: at
+most SERVER_MAX_CONCURRENCY queries run at once, up to SERVER_MAX_QUEUE more
+wait for a slot (for at most SERVER_QUEUE_TIMEOUT_SECONDS), and anything
+beyond is rejected right away with 429 and a Retry-After header.
+
+FastAPI and uvicorn are only imported when the app is built, so this module
+imports without the extra and main() says how to install it.
+"""
+import argparse
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
+
+from config import (
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_MAX_CONCURRENCY,
+    SERVER_MAX_QUEUE,
+    SERVER_QUEUE_TIMEOUT_SECONDS,
+    VECTOR_BACKEND
+)
+from hedging import worker_stats
+from http_clients import http_client_stats
+from rag_agent import PetrobrasRAGAgent
+
+if TYPE_CHECKING:
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+
+SERVER_EXTRA_MISSING = "❌ The HTTP server needs the 'server' extra: uv sync --extra server"
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded wait queue.
+
+    Only used from the event loop thread, so the counters need no lock.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        """
+        Args:
+            max_concurrency: Queries running at once
+            max_queue: Queries waiting for a slot before new ones are rejected
+            queue_timeout: Seconds a query may wait for a slot
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> bool:
+        """
+        Wait for a free slot.
+
+        Returns:
+            True once a slot is held (call release() when done), False when
+            the queue is full or the wait timed out
+        """
+        if self.active + self.queued >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            return False
+        if self._slots is None:
+            # Created on first use so it binds to the server's event loop
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        finally:
+            self.queued -= 1
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        """Free a slot taken by acquire()."""
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Current load and admission counters."""
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue
+        }
+
+
+def _overloaded(admission: AdmissionController) -> "JSONResponse":
+    """429 response for a rejected query."""
+    from fastapi.responses import JSONResponse
+
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Server overloaded, retry later", "admission": admission.stats()},
+        headers={"Retry-After": "1"}
+    )
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    """Encode a query_stream() event as a Server-Sent Event."""
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def create_app(agent: Optional[PetrobrasRAGAgent] = None,
+               max_concurrency: int = SERVER_MAX_CONCURRENCY,
+               max_queue: int = SERVER_MAX_QUEUE,
+               queue_timeout: float = SERVER_QUEUE_TIMEOUT_SECONDS) -> "FastAPI":
+    """
+    Build the FastAPI application.
+
+    The agent is warmed up in a worker thread when the server starts, so
+    /health answers immediately and /ready turns 200 once the LLM,
+    embeddings and index are loaded.
+
+    Args:
+        agent: Agent to serve (a new PetrobrasRAGAgent by default)
+        max_concurrency: Queries running at once
+        max_queue: Queries waiting for a slot before new ones get 429
+        queue_timeout: Seconds a query may wait for a slot before 429
+
+    Returns:
+        The application, to run with uvicorn
+
+    Raises:
+        ImportError: The "server" extra is not installed
+    """
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, StreamingResponse
+    from pydantic import BaseModel, Field
+    from starlette.background import BackgroundTask
+
+    class QueryRequest(BaseModel):
+        """Body of /query and /query/stream."""
+        question: str = Field(min_length=1)
+
+    agent = agent or PetrobrasRAGAgent(max_concurrency=max_concurrency)
+    admission = AdmissionController(max_concurrency, max_queue, queue_timeout)
+    status: Dict[str, Any] = {"ready": False, "error": None}
+
+    async def warm_up() -> None:
+        try:
+            await asyncio.to_thread(agent.warm_up)
+            status["ready"] = True
+            print(f"✅ Agent ready (index version {agent.index.version or 'legacy'})")
+        except Exception as e:
+            status["error"] = str(e)
+            print(f"❌ Agent warm-up failed: {e}")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        warm_up_task = asyncio.create_task(warm_up())
+        yield
+        warm_up_task.cancel()
+
+    app = FastAPI(title="Petrobras RAG Agent", lifespan=lifespan)
+    app.state.agent = agent
+    app.state.admission = admission
+
+    @app.get("/health")
+    async def health() -> Dict[str, str]:
+        return {"status": "ok"}
+
+    @app.get("/ready")
+    async def ready() -> JSONResponse:
+        if not status["ready"]:
+            return JSONResponse(status_code=503, content={"ready": False, "error": status["error"]})
+        return JSONResponse(content={
+            "ready": True,
+            "index_version": agent.index.version,
+            "vector_backend": VECTOR_BACKEND,
+            "admission": admission.stats(),
+            "cache": agent.cache_stats(),
+            "embedding_batches": agent.embedding_batch_stats(),
+            "hedging": agent.hedge_stats(),
+            "deadline_workers": worker_stats(),
+            "http_clients": http_client_stats()
+        })
+
+    @app.post("/query")
+    async def query(request: QueryRequest) -> JSONResponse:
+        if not await admission.acquire():
+            return _overloaded(admission)
+        try:
+            result = await agent.aquery(request.question)
+        finally:
+            admission.release()
+        if result.get("metadata", {}).get("timed_out"):
+            status_code = 504
+        else:
+            status_code = 500 if result.get("error") else 200
+        return JSONResponse(status_code=status_code, content=result)
+
+    @app.post("/query/stream")
+    async def query_stream(request: QueryRequest) -> Any:
+        if not await admission.acquire():
+            return _overloaded(admission)
+        released = False
+
+        def release_once() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                admission.release()
+
+        async def events() -> AsyncIterator[str]:
+            try:
+                async for event in agent.aquery_stream(request.question):
+                    yield _sse(event)
+            finally:
+                release_once()
+
+        # The background task also frees the slot when the client disconnects
+        # before the stream starts
+        return StreamingResponse(events(), media_type="text/event-stream", background=BackgroundTask(release_once))
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the HTTP server."""
+    try:
+        import fastapi  # noqa: F401
+        import uvicorn
+    except ImportError:
+        raise SystemExit(SERVER_EXTRA_MISSING) from None
+
+    parser = argparse.ArgumentParser(description="Serve the Petrobras RAG agent over HTTP")
+    parser.add_argument("--host", default=SERVER_HOST, help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Port to listen on")
+    args = parser.parse_args(argv)
+
+    print(f"🚀 Serving the RAG agent on http://{args.host}:{args.port}")
+    print(f"🚦 Admission: {SERVER_MAX_CONCURRENCY} concurrent queries, {SERVER_MAX_QUEUE} queued")
+    # One process holds one warm agent; scale out with more processes behind a load balancer
+    uvicorn.run(create_app(), host=args.host, port=args.port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""
+PDF text extraction for ingestion.
+
+Text layout extraction is CPU-bound and slow (seconds per report), so pages
+are extracted in parallel: every worker process opens the PDF once and
+extracts a contiguous range of pages. The result is cached on disk keyed by
+the SHA-256 of the file, so re-running ingestion only extracts PDFs that
+changed. Requires the optional `pypdf` dependency (`uv sync --extra pdf`).
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+
+def is_available() -> bool:
+    """True when pypdf is installed."""
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _extractor_version() -> str:
+    """Version tag stored with cached text, so a new pypdf re-extracts."""
+    import pypdf
+    return f"pypdf-{pypdf.__version__}"
+
+
+def file_hash(path: Union[str, Path]) -> str:
+    """SHA-256 of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_count(path: Union[str, Path]) -> int:
+    """Number of pages in a PDF."""
+    from pypdf import PdfReader
+    return len(PdfReader(str(path)).pages)
+
+
+def _extract_range(path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) (runs in a worker process)."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def extract_pages(path: Union[str, Path], workers: int = 1) -> List[str]:
+    """
+    Extract the text of every page of a PDF.
+
+    Args:
+        path: PDF file
+        workers: Worker processes; pages are split into 2 ranges per worker
+            so a slow range does not leave the other workers idle
+
+    Returns:
+        Text of each page, in page order
+    """
+    count = page_count(path)
+    ranges = min(count, 2 * workers)
+    if workers <= 1 or ranges <= 1:
+        return _extract_range(str(path), 0, count)
+
+    bounds = [count * i // ranges for i in range(ranges + 1)]
+    with ProcessPoolExecutor(max_workers=min(workers, ranges)) as executor:
+        parts = executor.map(_extract_range, [str(path)] * ranges, bounds[:-1], bounds[1:])
+        return [page for part in parts for page in part]
+
+
+class PdfTextCache:
+    """Extracted page texts on disk, one JSON file per PDF content hash."""
+
+    def __init__(self, directory: Union[str, Path]):
+        """
+        Args:
+            directory: Cache directory (created on first write)
+        """
+        self.directory = Path(directory)
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / f"{digest}.json"
+
+    def get(self, digest: str) -> Optional[List[str]]:
+        """Cached pages for a file hash, or None on a miss."""
+        try:
+            with open(self._path(digest), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("extractor") != _extractor_version():
+            return None
+        return entry["pages"]
+
+    def put(self, digest: str, pages: List[str]) -> None:
+        """Store the pages of a file hash (atomically, so readers never see a partial file)."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(digest)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"extractor": _extractor_version(), "pages": pages}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def load_pdf_pages(path: Union[str, Path], cache_dir: Union[str, Path],
+                   workers: int = 1) -> Tuple[List[str], bool]:
+    """
+    Return the page texts of a PDF, extracting them only on a cache miss.
+
+    Args:
+        path: PDF file
+        cache_dir: PdfTextCache directory
+        workers: Worker processes used on a cache miss
+
+    Returns:
+        Page texts and whether they came from the cache
+    """
+    cache = PdfTextCache(cache_dir)
+    digest = file_hash(path)
+    pages = cache.get(digest)
+    if pages is not None:
+        return pages, True
+
+    started = time.perf_counter()
+    pages = extract_pages(path, workers)
+    cache.put(digest, pages)
+    print(f"📑 Extracted {len(pages)} pages from {Path(path).name} in {time.perf_counter() - started:.1f}s")
+    return pages, False
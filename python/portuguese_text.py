@@ -0,0 +1,36 @@
+"""
+Portuguese text normalization shared by the lexical and fact indexes.
+
+Kept free of heavy dependencies so the fact index (answered before the agent
+builds its LLM and vector store) stays cheap to import.
+"""
+import re
+import unicodedata
+from typing import List
+
+# Accent-folded, so they match the output of fold_accents()
+PORTUGUESE_STOP_WORDS = frozenset("""
+a ao aos apos aquela aquelas aquele aqueles aquilo as ate cada com como da
+das de dela delas dele deles depois do dos e ela elas ele eles em entre era
+eram essa essas esse esses esta estao estas este estes eu foi foram ha isso
+isto ja la lhe lhes mais mas me mesmo meu minha muito na nas nem no nos
+nossa nosso num numa o os ou para pela pelas pelo pelos por qual quais
+qualquer quando que quem sao se seja sem ser sera serao seu seus so sobre
+sua suas tambem te tem ter teu tua um uma umas uns voce voces
+""".split())
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def fold_accents(text: str) -> str:
+    """Lowercase and strip diacritics ("Búzios" -> "buzios")."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into accent-folded tokens without Portuguese stop words."""
+    return [
+        token for token in _TOKEN_PATTERN.findall(fold_accents(text))
+        if token not in PORTUGUESE_STOP_WORDS and (len(token) > 1 or token.isdigit())
+    ]
@@ -1,84 +1,312 @@
 """
 RAG Agent implementation for Petrobras Q&A system.
+
+Heavy dependencies (langchain_openai, langchain_chroma, langgraph, chromadb,
+numpy) are imported when the agent builds its components on first use, so
+importing this module and creating an agent are cheap.
+
+The agent serves the index version published by ingest.py (see snapshots.py)
+and switches to a newer version between queries without restarting.
 """
-from typing import Dict, List, Any, TypedDict
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
+import asyncio
+import copy
+import hashlib
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Any, AsyncIterator, Iterator, Optional, Tuple, TypedDict
 from langchain_core.documents import Document
-from langgraph.graph import StateGraph, END
 from config import (
-    CHROMA_DB_PATH, 
+    INDEX_SNAPSHOTS_DIR,
+    INDEX_RELOAD_INTERVAL_SECONDS,
+    FACT_INDEX_ENABLED,
+    VECTOR_BACKEND,
+    VECTOR_QUANTIZATION,
+    VECTOR_RESCORE_MULTIPLIER,
+    RETRIEVAL_MODE,
+    HYBRID_CANDIDATES,
+    HYBRID_RRF_K,
+    CHUNK_OVERLAP,
+    CONTEXT_PACKING_ENABLED,
+    CONTEXT_TOKEN_BUDGET,
     TOP_K_RETRIEVAL, 
+    MAX_CONCURRENT_QUERIES,
+    QUERY_BATCH_CONCURRENCY,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_PATH,
+    EMBEDDING_MICROBATCH_ENABLED,
+    OPENROUTER_BASE_URL,
+    QUERY_TIMEOUT_SECONDS,
+    LLM_REQUEST_TIMEOUT_SECONDS,
+    HEDGING_ENABLED,
+    HEDGE_MODEL,
+    HEDGE_BASE_URL,
+    HEDGE_API_KEY,
+    HEDGE_PERCENTILE,
+    HEDGE_INITIAL_DELAY_SECONDS,
+    HEDGE_MIN_SAMPLES,
     get_llm_config,
     validate_config
 )
 from constants import SYSTEM_PROMPT
+from hedging import DeadlineExceeded, await_with_timeout, call_with_timeout, time_left
+from snapshots import SnapshotStore, hold_snapshot, index_paths, release_snapshot
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import RunnableConfig
+
+    from fact_index import FactIndex
 
 class GraphState(TypedDict):
     """State for the RAG agent graph."""
     question: str
+    question_embedding: List[float]
     documents: List[Document]
     answer: str
     sources: List[str]
     error: str
+    timings: Dict[str, float]
+    context_stats: Dict[str, Any]
+    deadline: float  # time.monotonic() deadline of the query, 0.0 for none
+    hedge: bool  # hedge the LLM call (off while streaming tokens)
+    timed_out: bool
+
+# Open Chroma clients per persist directory, for chromadb versions without Client.close()
+_chroma_clients: Counter = Counter()
+_chroma_clients_lock = threading.Lock()
+
+def _close_vectorstore(snapshot: Optional[Path], client: Optional[Any], pid: int) -> None:
+    """
+    Release an index version nobody references any more.
+    
+    Stops the Chroma system (SQLite connection and HNSW index) of the
+    version's persist directory when it was the last client there, and drops
+    this process's lease on the snapshot. A client opened by the parent of a
+    forked process is left alone in the child.
+    """
+    if client is not None and pid == os.getpid():
+        with _chroma_clients_lock:
+            _chroma_clients[client._identifier] -= 1
+            last = _chroma_clients[client._identifier] <= 0
+            if last:
+                del _chroma_clients[client._identifier]
+        if hasattr(client, "close"):
+            client.close()
+        elif last:
+            from chromadb.api.client import SharedSystemClient
+            system = SharedSystemClient._identifier_to_system.pop(client._identifier, None)
+            if system is not None:
+                system.stop()
+    release_snapshot(snapshot)
+
+def _reset_after_fork() -> None:
+    """Forget the parent's Chroma clients (and their SQLite connections) in a forked child."""
+    global _chroma_clients_lock
+    _chroma_clients.clear()
+    _chroma_clients_lock = threading.Lock()
+    chromadb = sys.modules.get("chromadb")
+    if chromadb is not None:
+        from chromadb.api.client import SharedSystemClient
+        if hasattr(SharedSystemClient, "clear_system_cache"):
+            SharedSystemClient.clear_system_cache()
+        else:
+            SharedSystemClient._identifier_to_system = {}
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+class RetrievalIndex:
+    """
+    One loaded index version: vector store, BM25 index and retriever.
+    
+    Never modified after loading (except for the lazily computed answer
+    cache fingerprint); a new version replaces the whole object, so a query
+    that took a reference keeps a consistent index to the end.
+    """
+    
+    def __init__(self, version: Optional[str], vectorstore: Any, lexical_index: Any = None):
+        """
+        Args:
+            version: Snapshot version, or None for the legacy index layout
+            vectorstore: Chroma or NumpyVectorStore
+            lexical_index: LexicalIndex for hybrid retrieval, or None
+        """
+        self.version = version
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        # Index part of the answer cache fingerprint, computed on first use
+        # (see PetrobrasRAGAgent._index_fingerprint)
+        self.fingerprint: Optional[str] = None
+        if lexical_index is not None:
+            from lexical_index import HybridRetriever
+            self.retriever = HybridRetriever(
+                vectorstore=vectorstore,
+                lexical_index=lexical_index,
+                k=TOP_K_RETRIEVAL,
+                candidates=HYBRID_CANDIDATES,
+                rrf_k=HYBRID_RRF_K
+            )
+        else:
+            self.retriever = vectorstore.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": TOP_K_RETRIEVAL}
+            )
 
 class PetrobrasRAGAgent:
     """RAG Agent for Petrobras financial and administrative questions."""
     
-    def __init__(self):
-        """Initialize the RAG agent."""
-        self.llm = None
-        self.vectorstore = None
-        self.retriever = None
-        self.chain = None
-        self.graph = None
-        self._setup()
+    # Components built by _setup() on first access
+    _LAZY_ATTRIBUTES = frozenset({
+        "llm_config", "llm", "embeddings", "index", "prompt", "chain", "graph",
+        "answer_cache", "context_packer", "hedge_chain", "hedger"
+    })
+    
+    def __init__(self, max_concurrency: Optional[int] = None,
+                 share_from: Optional["PetrobrasRAGAgent"] = None):
+        """
+        Initialize the RAG agent.
+        
+        The LLM, vector store and graph are built on first use (see
+        warm_up() to build them up front).
+        
+        Args:
+            max_concurrency: Maximum number of questions in flight at once on
+                the async API (defaults to MAX_CONCURRENT_QUERIES)
+            share_from: Agent whose LLM, embeddings, loaded index and fact
+                index are reused instead of built again; only the graph and
+                the concurrency limiter are this agent's own (see
+                agent_pool.py)
+        """
+        self.max_concurrency = max_concurrency or MAX_CONCURRENT_QUERIES
+        self._share_from = share_from
+        self._async_limiter = None
+        self._async_limiter_loop = None
+        self._ready = False
+        self._setup_lock = threading.RLock()
+        self._setup_thread = None
+        self._fact_index = None
+        self._fact_index_loaded = False
+        self._fact_index_version = None
+        self._snapshots = SnapshotStore(INDEX_SNAPSHOTS_DIR)
+        self._reload_lock = threading.Lock()
+        self._next_index_check = 0.0
+        self._pid = os.getpid()
+    
+    @property
+    def vectorstore(self) -> Any:
+        """Vector store of the index version currently served."""
+        return self.index.vectorstore
+    
+    @property
+    def lexical_index(self) -> Any:
+        """BM25 index of the current version (None in vector-only mode)."""
+        return self.index.lexical_index
+    
+    @property
+    def retriever(self) -> Any:
+        """Retriever over the current index version."""
+        return self.index.retriever
+    
+    def __getattr__(self, name: str) -> Any:
+        """Build the agent components on first access to any of them."""
+        if name in type(self)._LAZY_ATTRIBUTES and self.__dict__.get("_setup_thread") != threading.get_ident():
+            self._ensure_setup()
+            return self.__dict__[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+    
+    def _ensure_setup(self) -> None:
+        """Run _setup() exactly once, even when called from several threads."""
+        if self._ready:
+            return
+        with self._setup_lock:
+            if self._ready:
+                return
+            self._setup_thread = threading.get_ident()
+            try:
+                self._setup()
+                self._ready = True
+            finally:
+                self._setup_thread = None
+    
+    def _ensure_process(self) -> None:
+        """
+        Drop the components built before fork() so the child builds its own.
+        
+        The parent's HTTP clients, vector store connections and locks must
+        not be used from a forked child; the next access rebuilds them there.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        for name in self._LAZY_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+        self._ready = False
+        self._setup_lock = threading.RLock()
+        self._setup_thread = None
+        self._reload_lock = threading.Lock()
+        self._next_index_check = 0.0
+    
+    def warm_up(self) -> "PetrobrasRAGAgent":
+        """Build the LLM, vector store and graph now instead of on first query."""
+        self._ensure_process()
+        self._get_fact_index()
+        self._ensure_setup()
+        return self
     
-    def _setup(self):
+    def _setup(self) -> None:
         """Setup the RAG chain components."""
+        if self._share_from is not None:
+            self._setup_shared(self._share_from)
+            return
+        
+        from langchain_openai import ChatOpenAI
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+        from embedding_cache import create_embeddings
+        from http_clients import get_http_clients
+        
+        self.answer_cache = None
+        self.context_packer = None
+        self.hedge_chain = None
+        self.hedger = None
+        
         # Validate configuration
         validate_config()
         
         # Get LLM configuration
         llm_config = get_llm_config()
+        self.llm_config = llm_config
         
-        # Initialize LLM
+        # Initialize LLM on the process-wide connection pool of its provider
         if llm_config["provider"] == "openai":
-            self.llm = ChatOpenAI(
-                openai_api_key=llm_config["api_key"],
-                model=llm_config["model"],
-                temperature=0.0
-            )
+            base_url = llm_config.get("base_url")
         else:
             # For OpenRouter, use OpenAI client with custom base URL
-            self.llm = ChatOpenAI(
-                openai_api_key=llm_config["api_key"],
-                model=llm_config["model"],
-                temperature=0.0,
-                openai_api_base="https://openrouter.ai/api/v1"
-            )
-        
-        # Initialize embeddings
-        self.embeddings = OpenAIEmbeddings(
+            base_url = OPENROUTER_BASE_URL
+        http_client, http_async_client = get_http_clients(base_url)
+        self.llm = ChatOpenAI(
             openai_api_key=llm_config["api_key"],
-            model="text-embedding-3-small"
+            model=llm_config["model"],
+            temperature=0.0,
+            openai_api_base=base_url,
+            timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
         
-        # Load existing Chroma DB
-        self.vectorstore = Chroma(
-            persist_directory=str(CHROMA_DB_PATH),
-            embedding_function=self.embeddings,
-            collection_name="petrobras_docs"
-        )
+        # Initialize embeddings (shares the persistent cache with ingestion);
+        # concurrent question embeddings are coalesced into batched requests
+        self.embeddings = create_embeddings(llm_config, micro_batching=EMBEDDING_MICROBATCH_ENABLED)
         
-        # Create retriever
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": TOP_K_RETRIEVAL}
-        )
+        # Load the index version published by ingest.py
+        self.index = self._load_index()
         
         # Create prompt template with comprehensive system prompt
        
@@ -88,43 +316,205 @@ class PetrobrasRAGAgent:
             ("human", "{question}")
         ])
         
-        # Create RAG chain
-        self.chain = (
-            {"context": self.retriever | self._format_docs, "question": RunnablePassthrough()}
-            | self.prompt
-            | self.llm
-            | StrOutputParser()
-        )
+        # Create generation chain; the context comes from the documents the
+        # retrieve node already stored in the graph state
+        self.chain = self.prompt | self.llm | StrOutputParser()
+        
+        # Second model or provider that slow generations are hedged with
+        if HEDGING_ENABLED:
+            from hedging import HedgedRunner
+            hedge_base_url = HEDGE_BASE_URL or base_url
+            hedge_http_client, hedge_http_async_client = get_http_clients(hedge_base_url)
+            hedge_llm = ChatOpenAI(
+                openai_api_key=HEDGE_API_KEY or llm_config["api_key"],
+                model=HEDGE_MODEL or llm_config["model"],
+                temperature=0.0,
+                openai_api_base=hedge_base_url,
+                timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+                http_client=hedge_http_client,
+                http_async_client=hedge_http_async_client
+            )
+            self.hedge_chain = self.prompt | hedge_llm | StrOutputParser()
+            self.hedger = HedgedRunner(
+                percentile=HEDGE_PERCENTILE,
+                initial_delay=HEDGE_INITIAL_DELAY_SECONDS,
+                min_samples=HEDGE_MIN_SAMPLES
+            )
+        
+        # Merge overlapping chunks and cap the context size
+        if CONTEXT_PACKING_ENABLED:
+            from context_packer import ContextPacker
+            self.context_packer = ContextPacker(
+                token_budget=CONTEXT_TOKEN_BUDGET,
+                model=self.llm_config["model"],
+                max_overlap=CHUNK_OVERLAP
+            )
         
         # Create LangGraph workflow
         self._build_graph()
+        
+        # Semantic answer cache in front of the graph
+        if ANSWER_CACHE_ENABLED:
+            from answer_cache import SemanticAnswerCache
+            self.answer_cache = SemanticAnswerCache(
+                threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                path=ANSWER_CACHE_PATH
+            )
+    
+    def _setup_shared(self, source: "PetrobrasRAGAgent") -> None:
+        """Reuse the read-only components of another agent and build only this agent's graph."""
+        source.warm_up()
+        for name in ("llm_config", "llm", "embeddings", "index", "prompt", "chain", "answer_cache", "context_packer",
+                     "hedge_chain", "hedger"):
+            setattr(self, name, getattr(source, name))
+        self._build_graph()
+    
+    def _load_index(self) -> RetrievalIndex:
+        """Open the vector store and BM25 index of the published index version."""
+        snapshot = self._snapshots.current()
+        paths = index_paths(snapshot)
+        if VECTOR_BACKEND == "numpy":
+            from vector_index import NumpyVectorStore
+            vectorstore = NumpyVectorStore(
+                paths["numpy"],
+                self.embeddings,
+                quantization=VECTOR_QUANTIZATION,
+                rescore_multiplier=VECTOR_RESCORE_MULTIPLIER
+            )
+        else:
+            from langchain_chroma import Chroma
+            vectorstore = Chroma(
+                persist_directory=str(paths["chroma"]),
+                embedding_function=self.embeddings,
+                collection_name="petrobras_docs"
+            )
+            with _chroma_clients_lock:
+                _chroma_clients[vectorstore._client._identifier] += 1
+        
+        # Load the BM25 index for hybrid retrieval
+        lexical_index = None
+        if RETRIEVAL_MODE == "hybrid":
+            from lexical_index import LexicalIndex
+            if paths["lexical"].exists():
+                lexical_index = LexicalIndex.load(paths["lexical"])
+            else:
+                print(f"⚠️ Lexical index not found at {paths['lexical']}; using vector retrieval only (run ingest.py)")
+        
+        # Keep the version from being garbage collected while it is open, and
+        # close its Chroma client once no agent or running query uses it
+        hold_snapshot(snapshot)
+        weakref.finalize(vectorstore, _close_vectorstore, snapshot, getattr(vectorstore, "_client", None), os.getpid())
+        return RetrievalIndex(snapshot.name if snapshot else None, vectorstore, lexical_index)
+    
+    def _index_check_due(self) -> bool:
+        """Whether the CURRENT pointer is due for another check."""
+        owner = self._share_from or self
+        return time.monotonic() >= owner._next_index_check
+    
+    def _refresh_index(self) -> None:
+        """
+        Switch to a newly published index version, if any.
+        
+        Checks the CURRENT pointer at most every INDEX_RELOAD_INTERVAL_SECONDS.
+        The new version is loaded next to the old one and swapped in with a
+        single reference assignment: queries already running keep the index
+        they started with, and ingest.py only deletes it after a grace
+        period. If the new version fails to load, the old one stays in use.
+        """
+        self._ensure_process()
+        if self._share_from is not None:
+            # The source agent loads each new version once for every agent
+            # sharing its components
+            self._share_from._refresh_index()
+            if "index" in self.__dict__:
+                self.index = self._share_from.index
+            return
+        if not self._index_check_due() or not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_index_check = time.monotonic() + INDEX_RELOAD_INTERVAL_SECONDS
+            version = self._snapshots.current_version()
+            if self._fact_index_loaded and version != self._fact_index_version:
+                self._fact_index, self._fact_index_version = self._load_fact_index()
+            index = self.__dict__.get("index")
+            if index is not None and index.version is None:
+                # Ingestion updates the legacy collection in place; re-read
+                # its size and content_version on the next cache lookup
+                index.fingerprint = None
+            if index is None or version == index.version:
+                return
+            try:
+                self.index = self._load_index()
+                print(f"🔄 Switched to index version {self.index.version} (was {index.version or 'legacy'})")
+            except Exception as e:
+                print(f"⚠️ Could not load index version {version}, still serving {index.version or 'legacy'}: {e}")
+        finally:
+            self._reload_lock.release()
+    
+    async def _arefresh_index(self) -> None:
+        """Async version of _refresh_index(); loading runs in a worker thread."""
+        self._ensure_process()
+        if self._index_check_due():
+            await asyncio.to_thread(self._refresh_index)
+        elif self._share_from is not None and "index" in self.__dict__:
+            self.index = self._share_from.index
+    
+    @staticmethod
+    def _report_name(doc: Document) -> str:
+        """Report name recorded by ingest.py, or mapped from the source file for chunks ingested without one."""
+        if doc.metadata.get("report_name"):
+            return doc.metadata["report_name"]
+        source = doc.metadata.get("source", "unknown")
+        if "relatorio-financeiro" in source:
+            return "Relatório de Desempenho 1T25"
+        if "Relatorio-da-administracao" in source:
+            return "Relatório da Administração 2024"
+        return source
+    
+    @classmethod
+    def _citation_label(cls, doc: Document) -> str:
+        """Report name shown above a chunk, with its page for PDF reports."""
+        page = doc.metadata.get("page")
+        if page is None:
+            return cls._report_name(doc)
+        return f"{cls._report_name(doc)}, Página {page}"
     
     def _format_docs(self, docs: List[Document]) -> str:
         """Format retrieved documents for the prompt."""
         formatted_docs = []
-        for i, doc in enumerate(docs, 1):
-            source = doc.metadata.get("source", "unknown")
+        for doc in docs:
             content = doc.page_content.strip()
-            
-            # Map source files to proper report names
-            if "relatorio-financeiro" in source:
-                report_name = "Relatório de Desempenho 1T25"
-            elif "Relatorio-da-administracao" in source:
-                report_name = "Relatório da Administração 2024"
-            else:
-                report_name = source
-            
+            report_name = self._citation_label(doc)
             formatted_docs.append(f"**{report_name}**\n{content}")
         return "\n\n".join(formatted_docs)
     
-    def _build_graph(self):
+    def _build_context(self, state: GraphState) -> str:
+        """Assemble the prompt context, packed when CONTEXT_PACKING_ENABLED."""
+        if self.context_packer is None:
+            return self._format_docs(state["documents"])
+        context, stats = self.context_packer.pack(state["documents"], self._citation_label)
+        state["context_stats"] = stats
+        return context
+    
+    def _build_graph(self) -> None:
         """Build the LangGraph workflow."""
+        from langchain_core.runnables import RunnableLambda
+        from langgraph.graph import StateGraph, END
+        
         # Define the graph
         workflow = StateGraph(GraphState)
         
-        # Add nodes
-        workflow.add_node("retrieve", self._retrieve_documents)
-        workflow.add_node("generate", self._generate_answer)
+        # Add nodes (sync implementation for invoke, async one for ainvoke)
+        workflow.add_node(
+            "retrieve",
+            RunnableLambda(self._retrieve_documents, afunc=self._aretrieve_documents)
+        )
+        workflow.add_node(
+            "generate",
+            RunnableLambda(self._generate_answer, afunc=self._agenerate_answer)
+        )
         
         # Add edges
         workflow.add_edge("retrieve", "generate")
@@ -136,107 +526,773 @@ class PetrobrasRAGAgent:
         # Compile the graph
         self.graph = workflow.compile()
     
+    def _extract_sources(self, documents: List[Document]) -> List[str]:
+        """Extract unique report names from documents, keeping retrieval order."""
+        sources = []
+        for doc in documents:
+            report_name = self._report_name(doc)
+            if report_name not in sources:
+                sources.append(report_name)
+        return sources
+    
+    @staticmethod
+    def _vector_k(index: RetrievalIndex) -> int:
+        """Number of vector hits to fetch (more candidates when fusing rankings)."""
+        return HYBRID_CANDIDATES if index.lexical_index is not None else TOP_K_RETRIEVAL
+    
+    @staticmethod
+    def _fuse_lexical(index: RetrievalIndex, question: str, vector_docs: List[Document]) -> List[Document]:
+        """Fuse vector hits with BM25 hits (hybrid mode) and keep the top k."""
+        if index.lexical_index is None:
+            return vector_docs
+        from lexical_index import reciprocal_rank_fusion
+        lexical_docs = index.lexical_index.search_documents(question, index.vectorstore, k=HYBRID_CANDIDATES)
+        return reciprocal_rank_fusion(
+            [vector_docs, lexical_docs],
+            k=HYBRID_RRF_K,
+            top_n=TOP_K_RETRIEVAL
+        )
+    
+    def _search_by_vectors(self, index: RetrievalIndex, embeddings: List[List[float]]) -> List[List[Document]]:
+        """Run one batched vector store query for many question embeddings."""
+        from vector_index import NumpyVectorStore
+        
+        if not embeddings:
+            return []
+        if isinstance(index.vectorstore, NumpyVectorStore):
+            return index.vectorstore.similarity_search_by_vectors(embeddings, k=self._vector_k(index))
+        results = index.vectorstore._collection.query(
+            query_embeddings=embeddings,
+            n_results=self._vector_k(index),
+            include=["documents", "metadatas"]
+        )
+        return [
+            [
+                Document(id=doc_id, page_content=text, metadata=metadata or {})
+                for doc_id, text, metadata in zip(ids, texts, metadatas)
+            ]
+            for ids, texts, metadatas in zip(
+                results["ids"], results["documents"], results["metadatas"]
+            )
+        ]
+    
+    @staticmethod
+    def _record_timing(state: GraphState, node: str, started: float) -> None:
+        """Store the elapsed wall time of a graph node in the state."""
+        timings = dict(state.get("timings") or {})
+        timings[node] = time.perf_counter() - started
+        state["timings"] = timings
+    
     def _retrieve_documents(self, state: GraphState) -> GraphState:
         """Retrieve relevant documents for the question."""
+        started = time.perf_counter()
         try:
             question = state["question"]
-            documents = self.retriever.invoke(question)
-            
-            # Extract sources with proper report names
-            sources = []
-            for doc in documents:
-                source = doc.metadata.get("source", "unknown")
-                
-                # Map source files to proper report names
-                if "relatorio-financeiro" in source:
-                    report_name = "Relatório de Desempenho 1T25"
-                elif "Relatorio-da-administracao" in source:
-                    report_name = "Relatório da Administração 2024"
-                else:
-                    report_name = source
-                
-                if report_name not in sources:
-                    sources.append(report_name)
+            index = self.index
+            timeout = time_left(state.get("deadline", 0.0), "retrieval")
+            # Reuse the embedding computed for the answer cache when available
+            embedding = state.get("question_embedding") or call_with_timeout(
+                lambda: self.embeddings.embed_query(question), timeout, "retrieval"
+            )
+            documents = index.vectorstore.similarity_search_by_vector(
+                embedding,
+                k=self._vector_k(index)
+            )
+            documents = self._fuse_lexical(index, question, documents)
             
             state["documents"] = documents
-            state["sources"] = sources
+            state["sources"] = self._extract_sources(documents)
             state["error"] = ""
             
         except Exception as e:
             state["documents"] = []
             state["sources"] = []
             state["error"] = str(e)
+            state["timed_out"] = isinstance(e, DeadlineExceeded)
         
+        self._record_timing(state, "retrieve", started)
         return state
     
-    def _generate_answer(self, state: GraphState) -> GraphState:
-        """Generate answer using retrieved documents."""
+    @staticmethod
+    def _retrieval_error_answer(state: GraphState) -> str:
+        """Answer reported when retrieval failed or ran out of time."""
+        if state.get("timed_out"):
+            return "Tempo limite excedido ao recuperar documentos."
+        return f"Erro ao recuperar documentos: {state['error']}"
+    
+    def _generate_answer(self, state: GraphState, config: Optional["RunnableConfig"] = None) -> GraphState:
+        """Generate answer using the documents already retrieved into the state."""
+        started = time.perf_counter()
         try:
             if state["error"]:
-                state["answer"] = f"Erro ao recuperar documentos: {state['error']}"
+                state["answer"] = self._retrieval_error_answer(state)
                 return state
             
             # Format documents for the prompt
-            context = self._format_docs(state["documents"])
+            inputs = {"context": self._build_context(state), "question": state["question"]}
+            timeout = time_left(state.get("deadline", 0.0), "generate")
+            
+            # Generate answer from the retrieved context (no second retrieval)
+            if state.get("hedge") and self.hedger is not None:
+                answer = self.hedger.invoke(
+                    lambda: self.chain.invoke(inputs, config=config),
+                    lambda: self.hedge_chain.invoke(inputs),
+                    timeout=timeout
+                )
+            else:
+                answer = call_with_timeout(lambda: self.chain.invoke(inputs, config=config), timeout, "generate")
+            
+            state["answer"] = answer
+            state["error"] = ""
+        
+        except DeadlineExceeded as e:
+            state["answer"] = "Tempo limite excedido ao gerar resposta."
+            state["error"] = str(e)
+            state["timed_out"] = True
+            
+        except Exception as e:
+            state["answer"] = f"Erro ao gerar resposta: {str(e)}"
+            state["error"] = str(e)
+        
+        finally:
+            self._record_timing(state, "generate", started)
+        
+        return state
+    
+    async def _aretrieve_documents(self, state: GraphState) -> GraphState:
+        """Async twin of _retrieve_documents."""
+        started = time.perf_counter()
+        try:
             question = state["question"]
+            index = self.index
+            timeout = time_left(state.get("deadline", 0.0), "retrieval")
+            # Embed over the network without blocking the event loop, then run
+            # the local vector search in a worker thread
+            embedding = state.get("question_embedding") or await await_with_timeout(
+                self.embeddings.aembed_query(question), timeout, "retrieval"
+            )
+            documents = await asyncio.to_thread(
+                index.vectorstore.similarity_search_by_vector,
+                embedding,
+                k=self._vector_k(index)
+            )
+            documents = self._fuse_lexical(index, question, documents)
+            
+            state["documents"] = documents
+            state["sources"] = self._extract_sources(documents)
+            state["error"] = ""
+            
+        except Exception as e:
+            state["documents"] = []
+            state["sources"] = []
+            state["error"] = str(e)
+            state["timed_out"] = isinstance(e, DeadlineExceeded)
+        
+        self._record_timing(state, "retrieve", started)
+        return state
+    
+    async def _agenerate_answer(self, state: GraphState, config: Optional["RunnableConfig"] = None) -> GraphState:
+        """Async twin of _generate_answer."""
+        started = time.perf_counter()
+        try:
+            if state["error"]:
+                state["answer"] = self._retrieval_error_answer(state)
+                return state
             
-            # Generate answer using the chain with proper input format
-            answer = self.chain.invoke(question)
+            inputs = {"context": self._build_context(state), "question": state["question"]}
+            timeout = time_left(state.get("deadline", 0.0), "generate")
+            if state.get("hedge") and self.hedger is not None:
+                answer = await self.hedger.ainvoke(
+                    lambda: self.chain.ainvoke(inputs, config=config),
+                    lambda: self.hedge_chain.ainvoke(inputs),
+                    timeout=timeout
+                )
+            else:
+                answer = await await_with_timeout(self.chain.ainvoke(inputs, config=config), timeout, "generate")
             
             state["answer"] = answer
             state["error"] = ""
+        
+        except DeadlineExceeded as e:
+            state["answer"] = "Tempo limite excedido ao gerar resposta."
+            state["error"] = str(e)
+            state["timed_out"] = True
             
         except Exception as e:
             state["answer"] = f"Erro ao gerar resposta: {str(e)}"
             state["error"] = str(e)
         
+        finally:
+            self._record_timing(state, "generate", started)
+        
         return state
     
-    def query(self, question: str) -> Dict[str, Any]:
+    @staticmethod
+    def _initial_state(question: str, question_embedding: Optional[List[float]] = None,
+                       deadline: float = 0.0, hedge: bool = False) -> GraphState:
+        """Build the initial graph state for a question."""
+        return GraphState(
+            question=question,
+            question_embedding=question_embedding or [],
+            documents=[],
+            answer="",
+            sources=[],
+            error="",
+            timings={},
+            context_stats={},
+            deadline=deadline,
+            hedge=hedge,
+            timed_out=False
+        )
+    
+    @staticmethod
+    def _deadline(timeout: Optional[float]) -> float:
+        """time.monotonic() deadline of a query starting now (0.0 when disabled)."""
+        timeout = QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+        return time.monotonic() + timeout if timeout > 0 else 0.0
+    
+    def _build_result(self, question: str, final_state: GraphState, started: float) -> Dict[str, Any]:
+        """Build the query() result from the final graph state."""
+        timings = dict(final_state.get("timings") or {})
+        timings["total"] = time.perf_counter() - started
+        
+        return {
+            "question": question,
+            "answer": final_state["answer"],
+            "sources": final_state["sources"],
+            "retrieved_docs": len(final_state["documents"]),
+            "metadata": {
+                "model": self.llm.model_name if hasattr(self.llm, 'model_name') else "unknown",
+                "retrieval_k": TOP_K_RETRIEVAL,
+                "timings": timings,
+                "context": dict(final_state.get("context_stats") or {}),
+                "cache": {"hit": False},
+                "timed_out": bool(final_state.get("timed_out"))
+            },
+            "error": final_state.get("error", "")
+        }
+    
+    @staticmethod
+    def _error_result(question: str, error: Exception) -> Dict[str, Any]:
+        """Build the query() result for a question that failed outside the graph (same keys as a success)."""
+        timed_out = isinstance(error, DeadlineExceeded)
+        return {
+            "question": question,
+            "answer": (
+                "Tempo limite excedido ao processar pergunta."
+                if timed_out else f"Erro ao processar pergunta: {str(error)}"
+            ),
+            "sources": [],
+            "retrieved_docs": 0,
+            "metadata": {"timed_out": timed_out},
+            "error": str(error)
+        }
+    
+    def _cache_fingerprint(self) -> str:
+        """
+        Fingerprint of everything a cached answer depends on.
+        
+        Covers the index (see _index_fingerprint()), the system prompt, the
+        configured model and the context packing settings, so re-ingesting,
+        editing the prompt or switching models invalidates the answer cache.
+        """
+        index = self.index
+        if index.fingerprint is None:
+            index.fingerprint = self._index_fingerprint(index)
+        parts = [
+            index.fingerprint,
+            SYSTEM_PROMPT,
+            self.llm_config["model"],
+            f"packing={CONTEXT_PACKING_ENABLED}:{CONTEXT_TOKEN_BUDGET}"
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _index_fingerprint(index: RetrievalIndex) -> str:
+        """
+        Identity of a loaded index: its snapshot version, the petrobras_docs
+        collection with the content version written by ingestion (or the
+        NumPy index id) and its size.
+        
+        Computed once per loaded index, so Chroma is not queried on every
+        lookup; _refresh_index() clears it for the legacy layout.
+        """
+        from vector_index import NumpyVectorStore
+        
+        vectorstore = index.vectorstore
+        if isinstance(vectorstore, NumpyVectorStore):
+            index_parts = [
+                "numpy",
+                vectorstore.index_id,
+                str(len(vectorstore)),
+                f"{vectorstore.quantization}:{vectorstore.rescore_multiplier}"
+            ]
+        else:
+            collection = vectorstore._collection
+            # Incremental ingestion updates the collection in place and bumps
+            # content_version; re-read it since the cached model is stale
+            metadata = vectorstore._client.get_collection(collection.name).metadata or {}
+            index_parts = [
+                str(index.version),
+                collection.name,
+                str(collection.id),
+                str(collection.count()),
+                str(metadata.get("content_version", ""))
+            ]
+        return "\x1f".join(index_parts)
+    
+    def _get_fact_index(self) -> Optional["FactIndex"]:
+        """
+        Load the table fact index on first use.
+        
+        It is independent of the LLM and vector store, so metric lookups
+        never trigger _setup().
+        
+        Returns:
+            The FactIndex, or None when disabled or not built by ingest.py
+        """
+        if self._share_from is not None:
+            return self._share_from._get_fact_index()
+        if self._fact_index_loaded:
+            return self._fact_index
+        with self._setup_lock:
+            if not self._fact_index_loaded:
+                self._fact_index, self._fact_index_version = self._load_fact_index()
+                self._fact_index_loaded = True
+        return self._fact_index
+    
+    def _load_fact_index(self) -> Tuple[Any, Optional[str]]:
+        """Load the fact index of the published index version (None when missing or disabled)."""
+        snapshot = self._snapshots.current()
+        path = index_paths(snapshot)["fact"]
+        fact_index = None
+        if FACT_INDEX_ENABLED and path.exists():
+            from fact_index import FactIndex
+            fact_index = FactIndex.load(path)
+        return fact_index, snapshot.name if snapshot else None
+    
+    def _answer_from_facts(self, question: str, started: float) -> Optional[Dict[str, Any]]:
+        """
+        Answer a single-metric question straight from the fact index.
+        
+        Returns:
+            A query() result, or None when the question is not a confident
+            metric lookup and must go through the RAG graph
+        """
+        fact_index = self._get_fact_index()
+        if fact_index is None:
+            return None
+        fact = fact_index.lookup(question)
+        if fact is None:
+            return None
+        
+        from fact_index import format_answer
+        report_name = self._report_name(Document(page_content="", metadata=fact))
+        return {
+            "question": question,
+            "answer": format_answer(fact, report_name),
+            "sources": [report_name],
+            "retrieved_docs": 0,
+            "metadata": {
+                "model": "fact_index",
+                "retrieval_k": 0,
+                "timings": {"total": time.perf_counter() - started},
+                "context": {},
+                "cache": {"hit": False},
+                "fact": {key: fact[key] for key in ("metric", "period", "value", "unit", "section", "source")}
+            },
+            "error": ""
+        }
+    
+    def _lookup_answer_cache(self, question: str, deadline: float = 0.0) -> Tuple[List[float], str, Optional[Dict[str, Any]]]:
+        """
+        Embed the question and look it up in the answer cache.
+        
+        Args:
+            question: The question to look up
+            deadline: Query deadline (0.0 for none); the embedding call is
+                abandoned once it passes
+        
+        Returns:
+            The question embedding, the cache fingerprint and the cache hit
+            (None on a miss or when the cache is disabled)
+        
+        Raises:
+            DeadlineExceeded: The question was not embedded before the deadline
+        """
+        if self.answer_cache is None:
+            return [], "", None
+        timeout = time_left(deadline, "answer cache lookup")
+        embedding = call_with_timeout(lambda: self.embeddings.embed_query(question), timeout, "answer cache lookup")
+        fingerprint = self._cache_fingerprint()
+        return embedding, fingerprint, self.answer_cache.lookup(embedding, fingerprint, question)
+    
+    async def _alookup_answer_cache(self, question: str, deadline: float = 0.0) -> Tuple[List[float], str, Optional[Dict[str, Any]]]:
+        """Async version of _lookup_answer_cache()."""
+        if self.answer_cache is None:
+            return [], "", None
+        timeout = time_left(deadline, "answer cache lookup")
+        embedding = await await_with_timeout(self.embeddings.aembed_query(question), timeout, "answer cache lookup")
+        fingerprint = await asyncio.to_thread(self._cache_fingerprint)
+        return embedding, fingerprint, self.answer_cache.lookup(embedding, fingerprint, question)
+    
+    def _store_answer(self, question: str, embedding: List[float], fingerprint: str, result: Dict[str, Any]) -> None:
+        """Cache a successful result for similar future questions."""
+        if self.answer_cache is not None and embedding and not result.get("error"):
+            self.answer_cache.store(question, embedding, result, fingerprint)
+    
+    @staticmethod
+    def _cached_result(question: str, cached: Dict[str, Any], started: float) -> Dict[str, Any]:
+        """Build the query() result for an answer cache hit."""
+        result = cached["result"]
+        result["question"] = question
+        result["metadata"]["timings"] = {"total": time.perf_counter() - started}
+        result["metadata"]["cache"] = {
+            "hit": True,
+            "similarity": cached["similarity"],
+            "cached_question": cached["question"]
+        }
+        return result
+    
+    @staticmethod
+    def _cached_stream(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Events emitted by the streaming API for an answer cache hit."""
+        return [
+            {
+                "event": "sources",
+                "sources": result["sources"],
+                "retrieved_docs": result["retrieved_docs"]
+            },
+            {"event": "token", "content": result["answer"]},
+            {"event": "done", "result": result}
+        ]
+    
+    @property
+    def cache_hits(self) -> int:
+        """Number of questions answered from the answer cache."""
+        answer_cache = self.__dict__.get("answer_cache")
+        return answer_cache.hits if answer_cache else 0
+    
+    @property
+    def cache_misses(self) -> int:
+        """Number of questions that missed the answer cache."""
+        answer_cache = self.__dict__.get("answer_cache")
+        return answer_cache.misses if answer_cache else 0
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return answer cache counters (hits, misses, hit rate, entries)."""
+        answer_cache = self.__dict__.get("answer_cache")
+        if answer_cache is None:
+            return {"hits": 0, "misses": 0, "hit_rate": 0.0, "entries": 0}
+        return answer_cache.stats()
+    
+    def hedge_stats(self) -> Dict[str, Any]:
+        """Hedged generation counters (calls, hedges fired and won); empty when hedging is disabled."""
+        hedger = self.__dict__.get("hedger")
+        return hedger.stats() if hedger is not None else {}
+    
+    def embedding_batch_stats(self) -> Dict[str, Any]:
+        """Query embedding micro-batching metrics (batch sizes, queueing delay); empty when disabled."""
+        from embedding_batcher import find_batcher
+        batcher = find_batcher(self.__dict__.get("embeddings"))
+        return batcher.stats() if batcher is not None else {}
+    
+    def query(self, question: str, timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         Query the RAG agent with a question using LangGraph workflow.
         
         Args:
             question: The question to ask
+            timeout: Seconds the question may take (defaults to
+                QUERY_TIMEOUT_SECONDS; 0 disables the deadline)
             
         Returns:
             Dictionary containing answer, sources, and metadata
+            (metadata["timed_out"] is set when the deadline passed)
         """
+        started = time.perf_counter()
+        deadline = self._deadline(timeout)
         try:
-            # Initialize state
-            initial_state = GraphState(
-                question=question,
-                documents=[],
-                answer="",
-                sources=[],
-                error=""
-            )
+            self._refresh_index()
+            fact_result = self._answer_from_facts(question, started)
+            if fact_result is not None:
+                return fact_result
+            
+            embedding, fingerprint, cached = self._lookup_answer_cache(question, deadline)
+            if cached is not None:
+                return self._cached_result(question, cached, started)
             
             # Run the graph
-            final_state = self.graph.invoke(initial_state)
+            final_state = self.graph.invoke(self._initial_state(question, embedding, deadline, hedge=True))
+            result = self._build_result(question, final_state, started)
+            self._store_answer(question, embedding, fingerprint, result)
+            return result
             
-            return {
-                "question": question,
-                "answer": final_state["answer"],
-                "sources": final_state["sources"],
-                "retrieved_docs": len(final_state["documents"]),
-                "metadata": {
-                    "model": self.llm.model_name if hasattr(self.llm, 'model_name') else "unknown",
-                    "retrieval_k": TOP_K_RETRIEVAL
-                },
-                "error": final_state.get("error", "")
-            }
+        except Exception as e:
+            return self._error_result(question, e)
+    
+    def _stream_event(self, mode: str, chunk: Any, final_state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Translate one LangGraph stream item into a query_stream() event.
+        
+        Node updates are folded into final_state as they arrive.
+        """
+        if mode == "updates":
+            for node, node_state in chunk.items():
+                final_state.update(node_state)
+                if node == "retrieve":
+                    return {
+                        "event": "sources",
+                        "sources": node_state["sources"],
+                        "retrieved_docs": len(node_state["documents"])
+                    }
+            return None
+        
+        message, metadata = chunk
+        if metadata.get("langgraph_node") == "generate" and message.content:
+            return {"event": "token", "content": message.content}
+        return None
+    
+    def query_stream(self, question: str, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the answer to a question as it is generated.
+        
+        The deadline of query() applies; generation is not hedged, since
+        tokens already sent cannot be taken back.
+        
+        Yields, in order:
+            {"event": "sources", "sources": [...], "retrieved_docs": n}
+                right after retrieval
+            {"event": "token", "content": "..."} for each answer token
+            {"event": "done", "result": {...}} with the same result as query()
+        """
+        started = time.perf_counter()
+        deadline = self._deadline(timeout)
+        first_token = None
+        try:
+            self._refresh_index()
+            fact_result = self._answer_from_facts(question, started)
+            if fact_result is not None:
+                yield from self._cached_stream(fact_result)
+                return
+            
+            embedding, fingerprint, cached = self._lookup_answer_cache(question, deadline)
+            if cached is not None:
+                yield from self._cached_stream(self._cached_result(question, cached, started))
+                return
+            
+            final_state = dict(self._initial_state(question, embedding, deadline))
+            for mode, chunk in self.graph.stream(final_state, stream_mode=["updates", "messages"]):
+                event = self._stream_event(mode, chunk, final_state)
+                if event is None:
+                    continue
+                if event["event"] == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+                yield event
+            
+            result = self._build_result(question, final_state, started)
+            if first_token is not None:
+                result["metadata"]["timings"]["first_token"] = first_token
+            self._store_answer(question, embedding, fingerprint, result)
+            yield {"event": "done", "result": result}
             
         except Exception as e:
-            return {
-                "question": question,
-                "answer": f"Erro ao processar pergunta: {str(e)}",
-                "sources": [],
-                "retrieved_docs": 0,
-                "error": str(e)
-            }
-    
-    def test_queries(self):
+            yield {"event": "done", "result": self._error_result(question, e)}
+    
+    def _get_async_limiter(self) -> asyncio.Semaphore:
+        """Return the concurrency limiter bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._async_limiter is None or self._async_limiter_loop is not loop:
+            self._async_limiter = asyncio.Semaphore(self.max_concurrency)
+            self._async_limiter_loop = loop
+        return self._async_limiter
+    
+    async def aquery(self, question: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Async version of query() using async graph nodes, retrieval and LLM calls.
+        
+        At most max_concurrency questions run at once per event loop; the
+        others wait for a free slot (the deadline runs while waiting).
+        
+        Args:
+            question: The question to ask
+            timeout: Seconds the question may take (defaults to
+                QUERY_TIMEOUT_SECONDS; 0 disables the deadline)
+            
+        Returns:
+            Dictionary containing answer, sources, and metadata
+        """
+        deadline = self._deadline(timeout)
+        async with self._get_async_limiter():
+            started = time.perf_counter()
+            try:
+                await self._arefresh_index()
+                fact_result = self._answer_from_facts(question, started)
+                if fact_result is not None:
+                    return fact_result
+                
+                await asyncio.to_thread(self._ensure_setup)
+                embedding, fingerprint, cached = await self._alookup_answer_cache(question, deadline)
+                if cached is not None:
+                    return self._cached_result(question, cached, started)
+                
+                final_state = await self.graph.ainvoke(self._initial_state(question, embedding, deadline, hedge=True))
+                result = self._build_result(question, final_state, started)
+                self._store_answer(question, embedding, fingerprint, result)
+                return result
+                
+            except Exception as e:
+                return self._error_result(question, e)
+    
+    async def abatch(self, questions: List[str]) -> List[Dict[str, Any]]:
+        """
+        Answer many questions concurrently on the current event loop.
+        
+        Args:
+            questions: The questions to ask
+            
+        Returns:
+            One result per question, in input order
+        """
+        return await asyncio.gather(*(self.aquery(question) for question in questions))
+    
+    async def aquery_stream(self, question: str, timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Async version of query_stream(); yields the same events."""
+        deadline = self._deadline(timeout)
+        async with self._get_async_limiter():
+            started = time.perf_counter()
+            first_token = None
+            try:
+                await self._arefresh_index()
+                fact_result = self._answer_from_facts(question, started)
+                if fact_result is not None:
+                    for event in self._cached_stream(fact_result):
+                        yield event
+                    return
+                
+                await asyncio.to_thread(self._ensure_setup)
+                embedding, fingerprint, cached = await self._alookup_answer_cache(question, deadline)
+                if cached is not None:
+                    for event in self._cached_stream(self._cached_result(question, cached, started)):
+                        yield event
+                    return
+                
+                final_state = dict(self._initial_state(question, embedding, deadline))
+                async for mode, chunk in self.graph.astream(final_state, stream_mode=["updates", "messages"]):
+                    event = self._stream_event(mode, chunk, final_state)
+                    if event is None:
+                        continue
+                    if event["event"] == "token" and first_token is None:
+                        first_token = time.perf_counter() - started
+                    yield event
+                
+                result = self._build_result(question, final_state, started)
+                if first_token is not None:
+                    result["metadata"]["timings"]["first_token"] = first_token
+                self._store_answer(question, embedding, fingerprint, result)
+                yield {"event": "done", "result": result}
+                
+            except Exception as e:
+                yield {"event": "done", "result": self._error_result(question, e)}
+    
+    def query_batch(self, questions: List[str], max_concurrency: Optional[int] = None,
+                    timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Answer many questions with shared embedding and retrieval calls.
+        
+        Identical questions are answered once, and metric lookups come
+        straight from the fact index. The other questions are all
+        embedded in a single embeddings request and searched with a single
+        batched Chroma query; the LLM generations then run with bounded
+        concurrency, hedged like query().
+        
+        Every question gets the deadline of query(), counted from the start
+        of the batch (it runs while a question waits for a free LLM slot).
+        
+        Args:
+            questions: The questions to ask
+            max_concurrency: Maximum concurrent LLM calls (defaults to
+                QUERY_BATCH_CONCURRENCY)
+            timeout: Seconds each question may take (defaults to
+                QUERY_TIMEOUT_SECONDS; 0 disables the deadline)
+            
+        Returns:
+            One result per question, in input order; failures are reported
+            per item in the "error" field (metadata["timed_out"] is set when
+            the deadline passed)
+        """
+        started = time.perf_counter()
+        deadline = self._deadline(timeout)
+        unique_questions = list(dict.fromkeys(questions))
+        results: Dict[str, Dict[str, Any]] = {}
+        
+        try:
+            self._refresh_index()
+            for question in unique_questions:
+                fact_result = self._answer_from_facts(question, started)
+                if fact_result is not None:
+                    results[question] = fact_result
+            unique_questions = [question for question in unique_questions if question not in results]
+            
+            embeddings = call_with_timeout(
+                lambda: self.embeddings.embed_documents(unique_questions),
+                time_left(deadline, "batch embedding"),
+                "batch embedding"
+            ) if unique_questions else []
+            embed_time = time.perf_counter() - started
+            fingerprint = self._cache_fingerprint() if self.answer_cache else ""
+            
+            # Serve cached answers, collect the rest for retrieval
+            pending = []
+            for question, embedding in zip(unique_questions, embeddings):
+                cached = self.answer_cache.lookup(embedding, fingerprint, question) if self.answer_cache else None
+                if cached is not None:
+                    results[question] = self._cached_result(question, cached, started)
+                else:
+                    pending.append((question, embedding))
+            
+            retrieve_started = time.perf_counter()
+            index = self.index
+            documents = [
+                self._fuse_lexical(index, question, docs)
+                for (question, _), docs in zip(
+                    pending,
+                    self._search_by_vectors(index, [embedding for _, embedding in pending])
+                )
+            ]
+            retrieve_time = time.perf_counter() - retrieve_started
+            
+        except Exception as e:
+            return [self._error_result(question, e) for question in questions]
+        
+        states = []
+        for (question, embedding), docs in zip(pending, documents):
+            state = self._initial_state(question, embedding, deadline, hedge=True)
+            state["documents"] = docs
+            state["sources"] = self._extract_sources(docs)
+            state["timings"] = {"embed": embed_time, "retrieve": retrieve_time}
+            states.append(state)
+        
+        from langchain_core.runnables import RunnableLambda
+        
+        final_states = RunnableLambda(self._generate_answer).batch(
+            states,
+            config={"max_concurrency": max_concurrency or QUERY_BATCH_CONCURRENCY},
+            return_exceptions=True
+        )
+        
+        for (question, embedding), final_state in zip(pending, final_states):
+            if isinstance(final_state, Exception):
+                results[question] = self._error_result(question, final_state)
+                continue
+            result = self._build_result(question, final_state, started)
+            self._store_answer(question, embedding, fingerprint, result)
+            results[question] = result
+        
+        # Duplicated questions get their own copy of the shared result
+        return [copy.deepcopy(results[question]) for question in questions]
+    
+    def test_queries(self) -> None:
         """Test the agent with sample queries."""
         test_questions = [
             "Qual foi o EBITDA Ajustado sem eventos exclusivos no 1T25?",
@@ -254,9 +1310,12 @@ class PetrobrasRAGAgent:
             print(f"✅ {result['answer']}")
             print(f"📚 Fontes: {', '.join(result['sources'])}")
             print(f"📊 Documentos recuperados: {result['retrieved_docs']}")
+            context = result.get("metadata", {}).get("context")
+            if context:
+                print(f"📦 Contexto: {context['tokens']} tokens ({context['tokens_saved']} economizados)")
             print("-" * 80)
 
-def main():
+def main() -> None:
     """Main function for testing the RAG agent."""
     print("🚀 Initializing Petrobras RAG Agent...")
     
@@ -276,10 +1335,18 @@ def main():
                 break
             
             if question:
-                result = agent.query(question)
-                print(f"\n✅ {result['answer']}")
-                if result['sources']:
-                    print(f"📚 Fontes: {', '.join(result['sources'])}")
+                streamed = False
+                for event in agent.query_stream(question):
+                    if event["event"] == "sources" and event["sources"]:
+                        print(f"\n📚 Fontes: {', '.join(event['sources'])}\n")
+                        print("✅ ", end="", flush=True)
+                    elif event["event"] == "token":
+                        streamed = True
+                        print(event["content"], end="", flush=True)
+                    elif event["event"] == "done":
+                        if not streamed:
+                            print(f"\n✅ {event['result']['answer']}", end="")
+                        print()
         
     except Exception as e:
         print(f"❌ Error initializing RAG agent: {e}")
@@ -0,0 +1,224 @@
+"""
+Versioned index snapshots published with an atomic pointer swap.
+
+Every ingestion run writes a complete index version (vector store, BM25
+index, fact index) into a new directory under snapshots/ and only then
+points CURRENT at it, by writing the version name to a temporary file and
+renaming it over CURRENT (atomic on POSIX and Windows). Readers therefore see
+either the previous version or the new one, never a half-written store.
+Replaced versions get a RETIRED marker and are deleted once they have been
+retired longer than a grace period, so agents still answering with them can
+finish. Before the first snapshot is published, the legacy single-directory
+layout (chroma_db/, numpy_index/, ...) is used.
+
+Garbage collection never deletes a version that is still in use: a version
+being built carries a BUILDING marker with the builder's pid until it is
+published, and every process with a version open holds a READER-<pid> lease
+in it (hold_snapshot()/release_snapshot()). Markers of processes that no longer exist are
+ignored, so a crashed ingestion or agent does not pin a version forever.
+A forked child re-takes its parent's leases under its own pid.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from config import CHROMA_DB_PATH, FACT_INDEX_PATH, LEXICAL_INDEX_PATH, NUMPY_INDEX_PATH
+
+POINTER_FILE = "CURRENT"
+RETIRED_FILE = "RETIRED"
+BUILDING_FILE = "BUILDING"
+READER_PREFIX = "READER-"
+
+
+def index_paths(snapshot: Optional[Path]) -> Dict[str, Path]:
+    """
+    Locations of the index files of a snapshot.
+
+    Args:
+        snapshot: Snapshot directory, or None for the legacy layout
+
+    Returns:
+        "chroma", "numpy", "lexical" and "fact" paths
+    """
+    if snapshot is None:
+        return {"chroma": CHROMA_DB_PATH, "numpy": NUMPY_INDEX_PATH, "lexical": LEXICAL_INDEX_PATH, "fact": FACT_INDEX_PATH}
+    return {
+        "chroma": snapshot / CHROMA_DB_PATH.name,
+        "numpy": snapshot / NUMPY_INDEX_PATH.name,
+        "lexical": snapshot / LEXICAL_INDEX_PATH.name,
+        "fact": snapshot / FACT_INDEX_PATH.name
+    }
+
+
+class SnapshotStore:
+    """Index versions under a root directory and the CURRENT pointer to one of them."""
+
+    def __init__(self, root: Union[str, Path]):
+        """
+        Args:
+            root: Directory holding CURRENT and snapshots/
+        """
+        self.root = Path(root)
+        self.snapshots_dir = self.root / "snapshots"
+        self.pointer = self.root / POINTER_FILE
+
+    def current_version(self) -> Optional[str]:
+        """Name of the published version, or None before the first publish."""
+        try:
+            version = self.pointer.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def current(self) -> Optional[Path]:
+        """Directory of the published version, or None before the first publish."""
+        version = self.current_version()
+        return self.snapshots_dir / version if version else None
+
+    def create(self) -> Path:
+        """
+        Create the directory of a new, unpublished version.
+
+        Names sort by creation time, e.g. "20250512-141503-3f2a9c1d".
+        """
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        directory = self.snapshots_dir / version
+        directory.mkdir(parents=True)
+        (directory / BUILDING_FILE).write_text(str(os.getpid()), encoding="utf-8")
+        return directory
+
+    def publish(self, snapshot: Path) -> None:
+        """Atomically make a snapshot the current version and retire the previous one."""
+        previous = self.current()
+        tmp_pointer = self.root / f"{POINTER_FILE}.{os.getpid()}.tmp"
+        with open(tmp_pointer, "w", encoding="utf-8") as f:
+            f.write(snapshot.name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_pointer, self.pointer)
+        (snapshot / BUILDING_FILE).unlink(missing_ok=True)
+        if previous is not None and previous != snapshot and previous.exists():
+            (previous / RETIRED_FILE).write_text(str(time.time()), encoding="utf-8")
+
+    def _retired_at(self, snapshot: Path) -> float:
+        """When a snapshot stopped being current (creation time for never-published ones)."""
+        try:
+            return float((snapshot / RETIRED_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return snapshot.stat().st_mtime
+
+    @staticmethod
+    def in_use(snapshot: Path) -> bool:
+        """Whether a live process is still building the snapshot or has it open."""
+        markers = [snapshot / BUILDING_FILE] + list(snapshot.glob(f"{READER_PREFIX}*"))
+        for marker in markers:
+            try:
+                pid = int(marker.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if _process_alive(pid):
+                return True
+        return False
+
+    def collect_garbage(self, grace_seconds: float, keep: Optional[Path] = None) -> List[str]:
+        """
+        Delete versions retired (or abandoned unpublished) longer than grace_seconds ago.
+
+        Versions still being built or held open by a live process are kept
+        regardless of their age.
+
+        Args:
+            grace_seconds: Time agents get to finish queries on a retired version
+            keep: A snapshot being built, never deleted
+
+        Returns:
+            Names of the deleted versions
+        """
+        if not self.snapshots_dir.is_dir():
+            return []
+        current = self.current()
+        deadline = time.time() - grace_seconds
+        removed = []
+        for snapshot in sorted(self.snapshots_dir.iterdir()):
+            if not snapshot.is_dir() or snapshot in (current, keep):
+                continue
+            if self._retired_at(snapshot) <= deadline and not self.in_use(snapshot):
+                # Files still memory-mapped by an old agent cannot be removed
+                # on Windows; they are retried on the next run
+                shutil.rmtree(snapshot, ignore_errors=True)
+                if not snapshot.exists():
+                    removed.append(snapshot.name)
+        return removed
+
+
+def _process_alive(pid: int) -> bool:
+    """Whether a process with this pid exists (always assumed on Windows)."""
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill() would terminate the process there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_readers: Counter = Counter()
+_readers_lock = threading.Lock()
+
+
+def hold_snapshot(snapshot: Optional[Path]) -> None:
+    """
+    Mark a snapshot as open by this process, so garbage collection keeps it.
+
+    Calls are counted; the lease file is removed by the matching last release_snapshot().
+    """
+    if snapshot is None:
+        return
+    with _readers_lock:
+        _readers[snapshot] += 1
+        if _readers[snapshot] == 1:
+            (snapshot / f"{READER_PREFIX}{os.getpid()}").write_text(str(os.getpid()), encoding="utf-8")
+
+
+def release_snapshot(snapshot: Optional[Path]) -> None:
+    """Undo one hold_snapshot(); the lease goes away with the last one."""
+    if snapshot is None:
+        return
+    with _readers_lock:
+        if _readers[snapshot] <= 0:
+            return
+        _readers[snapshot] -= 1
+        if _readers[snapshot] == 0:
+            del _readers[snapshot]
+            (snapshot / f"{READER_PREFIX}{os.getpid()}").unlink(missing_ok=True)
+
+
+def _reset_after_fork() -> None:
+    """
+    Re-take the parent's leases under the child's pid.
+
+    Snapshots the parent had open stay open in a forked child (inherited
+    agents keep using them until they rebuild), and the parent's lease goes
+    away when the parent releases or exits.
+    """
+    global _readers_lock
+    _readers_lock = threading.Lock()
+    for snapshot in list(_readers):
+        try:
+            (snapshot / f"{READER_PREFIX}{os.getpid()}").write_text(str(os.getpid()), encoding="utf-8")
+        except OSError:
+            del _readers[snapshot]
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
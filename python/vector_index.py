@@ -0,0 +1,347 @@
+"""
+In-process NumPy vector index, an alternative to Chroma for small corpora.
+
+An index directory holds:
+- vectors.f32: memory-mapped float32 matrix of L2-normalized embeddings
+- vectors.i8 / scales.f32: int8 codes of every row with a per-row scale
+- vectors.bin: sign bits of every row, packed 8 per byte
+- docs.jsonl: one {"id", "text", "metadata"} record per row
+- offsets.npy: byte offset of every docs.jsonl record (rows are read on demand)
+- manifest.json: row count, dimension, embedding model and index id
+
+Top-k search is a single matrix-vector product followed by argpartition. With
+quantization="int8" (4x smaller) or "binary" (32x smaller) only the compressed
+codes are loaded in memory: they shortlist k * rescore_multiplier candidates,
+which are then rescored exactly against the float32 rows read from disk.
+"""
+import json
+import mmap
+import shutil
+import uuid
+import warnings
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# Rows quantized or scored per block, so quantized search never materializes
+# a float32 copy of the whole matrix
+_BLOCK_ROWS = 16384
+# int8 rows converted to float32 per matmul; small enough to stay in cache
+_INT8_BLOCK_ROWS = 256
+
+# Set bits of every byte value (np.bitwise_count needs NumPy 2)
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row int8 quantization.
+
+    Returns:
+        int8 codes and the float32 scale of each row (vector ~ codes * scale)
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """Sign bits of every row, packed 8 per byte."""
+    return np.packbits(vectors > 0, axis=1)
+
+
+def _popcount(packed: np.ndarray) -> np.ndarray:
+    """Number of set bits per row of a packed bit matrix."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[packed].sum(axis=1, dtype=np.int32)
+
+
+class NumpyIndexWriter:
+    """Writes a NumpyVectorStore index incrementally, batch by batch."""
+
+    def __init__(self, directory: Union[str, Path], embedding_model: str = ""):
+        """
+        Start a new index, replacing any index already in the directory.
+
+        Args:
+            directory: Index directory
+            embedding_model: Name of the model that produced the embeddings
+        """
+        self.directory = Path(directory)
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        self.directory.mkdir(parents=True)
+        self.embedding_model = embedding_model
+        self.count = 0
+        self.dim: Optional[int] = None
+        self._offsets = [0]
+        self._vectors_file = open(self.directory / "vectors.f32", "wb")
+        self._int8_file = open(self.directory / "vectors.i8", "wb")
+        self._scales_file = open(self.directory / "scales.f32", "wb")
+        self._binary_file = open(self.directory / "vectors.bin", "wb")
+        self._docs_file = open(self.directory / "docs.jsonl", "wb")
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]],
+            embeddings: Union[List[List[float]], np.ndarray]) -> None:
+        """Append a batch of documents and their embeddings."""
+        if not ids:
+            return
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._vectors_file.write(vectors.astype(np.float32).tobytes())
+        codes, scales = quantize_int8(vectors)
+        self._int8_file.write(codes.tobytes())
+        self._scales_file.write(scales.tobytes())
+        self._binary_file.write(quantize_binary(vectors).tobytes())
+
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            line = json.dumps(
+                {"id": doc_id, "text": text, "metadata": metadata},
+                ensure_ascii=False
+            ).encode("utf-8") + b"\n"
+            self._docs_file.write(line)
+            self._offsets.append(self._offsets[-1] + len(line))
+        self.count += len(ids)
+
+    def close(self) -> None:
+        """Finish the index by writing the offsets and the manifest."""
+        for f in (self._vectors_file, self._int8_file, self._scales_file, self._binary_file, self._docs_file):
+            f.close()
+        np.save(self.directory / "offsets.npy", np.asarray(self._offsets, dtype=np.int64))
+        manifest = {
+            "index_id": str(uuid.uuid4()),
+            "count": self.count,
+            "dim": self.dim or 0,
+            "embedding_model": self.embedding_model,
+            "quantized": ["int8", "binary"]
+        }
+        (self.directory / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+
+class NumpyVectorStore(VectorStore):
+    """Read-only vector store over a NumpyIndexWriter index directory."""
+
+    def __init__(self, directory: Union[str, Path], embedding_function: Embeddings,
+                 quantization: str = "none", rescore_multiplier: int = 8):
+        """
+        Load an index.
+
+        Args:
+            directory: Index directory written by NumpyIndexWriter
+            embedding_function: Embeddings used to embed text queries
+            quantization: "none" (exact float32 search), "int8" or "binary"
+                (compressed shortlist, exact rescoring)
+            rescore_multiplier: Candidates shortlisted per requested result
+                when quantized
+        """
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"quantization must be one of {QUANTIZATION_MODES}, got '{quantization}'")
+        self.directory = Path(directory)
+        self.embedding_function = embedding_function
+        self.quantization = quantization
+        self.rescore_multiplier = max(1, rescore_multiplier)
+        self.manifest = json.loads((self.directory / "manifest.json").read_text())
+        self.index_id = self.manifest["index_id"]
+        count, dim = self.manifest["count"], self.manifest["dim"]
+
+        if count:
+            self._vectors = np.memmap(
+                self.directory / "vectors.f32", dtype=np.float32, mode="r", shape=(count, dim)
+            )
+            with open(self.directory / "docs.jsonl", "rb") as f:
+                self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._vectors = np.zeros((0, dim), dtype=np.float32)
+            self._docs = b""
+        self._offsets = np.load(self.directory / "offsets.npy")
+        # Row of every document id, read from docs.jsonl on first use
+        self._rows: Optional[Dict[str, int]] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        if quantization != "none":
+            self._load_codes(count, dim)
+
+    def _load_codes(self, count: int, dim: int) -> None:
+        """Read the compressed vectors into memory (quantized from vectors.f32 for old indexes)."""
+        quantization_missing = self.quantization not in self.manifest.get("quantized", [])
+        if quantization_missing:
+            warnings.warn(
+                f"{self.directory} has no {self.quantization} vectors; quantizing at load time "
+                "(re-run ingest.py to store them)"
+            )
+        if self.quantization == "int8":
+            if quantization_missing:
+                parts = [quantize_int8(np.asarray(self._vectors[start:start + _BLOCK_ROWS]))
+                         for start in range(0, count, _BLOCK_ROWS)]
+                self._codes = np.concatenate([codes for codes, _ in parts]) if parts else np.zeros((0, dim), np.int8)
+                self._scales = np.concatenate([scales for _, scales in parts]) if parts else np.zeros(0, np.float32)
+            else:
+                self._codes = np.fromfile(self.directory / "vectors.i8", dtype=np.int8).reshape(count, dim)
+                self._scales = np.fromfile(self.directory / "scales.f32", dtype=np.float32)
+        else:
+            packed_dim = (dim + 7) // 8
+            if quantization_missing:
+                parts = [quantize_binary(np.asarray(self._vectors[start:start + _BLOCK_ROWS]))
+                         for start in range(0, count, _BLOCK_ROWS)]
+                self._codes = np.concatenate(parts) if parts else np.zeros((0, packed_dim), np.uint8)
+            else:
+                self._codes = np.fromfile(self.directory / "vectors.bin", dtype=np.uint8).reshape(count, packed_dim)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Bytes of vector data the search keeps in memory (float32 rows are paged from disk)."""
+        if self._codes is None:
+            return int(self._vectors.nbytes)
+        return int(self._codes.nbytes + (self._scales.nbytes if self._scales is not None else 0))
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def _document(self, row: int) -> Document:
+        """Read one document record from the sidecar."""
+        record = json.loads(self._docs[self._offsets[row]:self._offsets[row + 1]])
+        return Document(id=record["id"], page_content=record["text"], metadata=record["metadata"])
+
+    def content_hashes(self) -> Dict[str, str]:
+        """Map every document id to the content_hash stored in its metadata."""
+        hashes = {}
+        for row in range(len(self)):
+            doc = self._document(row)
+            hashes[doc.id] = doc.metadata.get("content_hash", "")
+        return hashes
+
+    def _id_rows(self) -> Dict[str, int]:
+        """Row of every document id."""
+        if self._rows is None:
+            self._rows = {self._document(row).id: row for row in range(len(self))}
+        return self._rows
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        """Return the documents with the given ids, in the order asked (unknown ids are skipped)."""
+        rows = self._id_rows()
+        return [self._document(rows[doc_id]) for doc_id in ids if doc_id in rows]
+
+    def get_vectors(self, ids: Sequence[str]) -> np.ndarray:
+        """Stored (normalized) vectors of the given document ids, one row per id."""
+        rows = self._id_rows()
+        return np.asarray(self._vectors[[rows[doc_id] for doc_id in ids]])
+
+    def _top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """Row indexes of the k best scores, best first."""
+        k = min(k, scores.shape[-1])
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        return candidates[np.argsort(-scores[candidates])]
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """Similarity of every row to a normalized query, from the compressed codes."""
+        count = len(self._codes)
+        scores = np.empty(count, dtype=np.float32)
+        if self.quantization == "int8":
+            buffer = np.empty((min(count, _INT8_BLOCK_ROWS), self._codes.shape[1]), dtype=np.float32)
+            for start in range(0, count, _INT8_BLOCK_ROWS):
+                block = self._codes[start:start + _INT8_BLOCK_ROWS]
+                np.copyto(buffer[:len(block)], block)
+                scores[start:start + len(block)] = buffer[:len(block)] @ query
+            return scores * self._scales
+        # Fewer differing sign bits means a smaller angle
+        query_bits = quantize_binary(query[None, :])
+        for start in range(0, count, _BLOCK_ROWS):
+            block = self._codes[start:start + _BLOCK_ROWS]
+            scores[start:start + len(block)] = -_popcount(np.bitwise_xor(block, query_bits))
+        return scores
+
+    def _search(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Rows and exact cosine scores of the k best matches for a normalized query."""
+        if self._codes is None:
+            scores = self._vectors @ query
+            return [(int(row), float(scores[row])) for row in self._top_k(scores, k)]
+
+        # Shortlist with the compressed codes, then rescore the candidates
+        # exactly; sorted rows keep the reads from vectors.f32 sequential
+        candidates = np.sort(self._top_k(self._approximate_scores(query), k * self.rescore_multiplier))
+        exact = np.asarray(self._vectors[candidates]) @ query
+        return [(int(candidates[i]), float(exact[i])) for i in self._top_k(exact, k)]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        """Return the k most similar documents with their cosine similarity."""
+        query = _normalize_rows(np.asarray([embedding], dtype=np.float32))[0]
+        return [(self._document(row), score) for row, score in self._search(query, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        """Return the k most similar documents to an embedding."""
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_by_vectors(self, embeddings: List[List[float]], k: int = 4) -> List[List[Document]]:
+        """Batched search: one matrix product for many query embeddings."""
+        if not embeddings:
+            return []
+        queries = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        if self._codes is not None:
+            return [[self._document(row) for row, _ in self._search(query, k)] for query in queries]
+        scores = queries @ self._vectors.T
+        return [
+            [self._document(int(row)) for row in self._top_k(query_scores, k)]
+            for query_scores in scores
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Embed a text query and return the k most similar documents with scores."""
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        """Embed a text query and return the k most similar documents."""
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k)
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        """Scores are already cosine similarities."""
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        persist_directory: Optional[Union[str, Path]] = None,
+        embedding_model: str = "",
+        **kwargs: Any
+    ) -> "NumpyVectorStore":
+        """Embed texts, write them to persist_directory and load the index."""
+        if persist_directory is None:
+            raise ValueError("persist_directory is required for NumpyVectorStore")
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        writer = NumpyIndexWriter(persist_directory, embedding_model=embedding_model)
+        writer.add(ids, list(texts), metadatas, embedding.embed_documents(list(texts)))
+        writer.close()
+        return cls(persist_directory, embedding)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        """The index is read-only; rebuild it with ingest.py instead."""
+        raise NotImplementedError("NumpyVectorStore is read-only; re-run ingest.py to rebuild it")